@@ -0,0 +1,100 @@
+"""Benchmark allendalewine page parsing on the page corpus.
+
+Compares the lxml structural reader and the session key regex against
+the previous BeautifulSoup parse -> str -> split -> regex path, per
+page, and checks both give the same items:
+
+    python -m scraper.benchmarks.bench_allendalewine [corpus_dir]
+
+"""
+
+# STANDARD LIB
+import argparse
+import re
+import timeit
+import bs4
+import pandas as pd
+
+# PROJECT LIB
+from scraper.benchmarks import corpus
+from scraper.web_scraper.wine_scraper import allendalewine, parsing
+
+LEGACY_METADATA_REGEX = re.compile(
+    parsing.optional_field(r'brand">(?P<BRAND>[^<]*)<') +
+    parsing.optional_field(r'title">(?P<TITLE>[^<]*)<') +
+    parsing.optional_field(r'vintageAge">(?P<VINTAGE>\w[^<]*)<') +
+    parsing.optional_field(r'listprice">\$(?P<BASE_PRICE>\w[^<]*)<') +
+    parsing.optional_field(r'priceSale">\$(?P<PRICE>\w[^<]*)<'))
+
+
+def legacy_session_key(html_str):
+    """BeautifulSoup implementation of allendalewine.get_session_key."""
+    soup = bs4.BeautifulSoup(html_str, "lxml")
+    page_links = [
+        a["href"] for a in soup.find_all("a", href=True)
+        if "/scan/MM" in a["href"]
+    ]
+    if not page_links:
+        return None
+    return re.findall(r"scan\/MM=(\w*)", page_links[0])[0]
+
+
+def legacy_items(html_str):
+    """BeautifulSoup + regex implementation of the item fields."""
+    soup = bs4.BeautifulSoup(html_str, "lxml")
+    results_list = "".join(map(str, soup.find_all(id="itemResultsList")))
+    results_list = results_list.replace("\n", "")
+    df = pd.DataFrame(results_list.split("itemTitle"),
+                      columns=["RAW_DATA_STR"])
+    fields = df["RAW_DATA_STR"].str.extract(LEGACY_METADATA_REGEX)
+    fields = fields[fields["BRAND"].notnull()].copy()
+    fields["BASE_PRICE"] = "$" + fields["BASE_PRICE"]
+    fields["PRICE"] = "$" + fields["PRICE"]
+    return allendalewine.get_metadata_from_query_result(fields)
+
+
+def current_items(html_str):
+    """lxml implementation of the item fields."""
+    return allendalewine.get_metadata_from_query_result(
+        allendalewine.get_raw_data(html_str))
+
+
+def ms_per_page(fn, pages, repeat=5):
+    """Best of repeat timings of fn over all pages, in ms per page."""
+    seconds = min(
+        timeit.repeat(lambda: [fn(p) for p in pages], number=1,
+                      repeat=repeat))
+    return seconds / len(pages) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir", nargs="?")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = corpus.load_pages("allendalewine", args.corpus_dir)
+    if not pages:
+        print("no allendalewine pages")
+        return
+    for page in pages:
+        assert legacy_session_key(page) == allendalewine.get_session_key(page)
+        before = legacy_items(page)
+        after = current_items(page)
+        for col in ["NAME", "PRICE", "BASE_PRICE", "IS_ON_SALE"]:
+            assert before[col].tolist() == after[col].tolist(), col
+
+    print("{:<15}{:>12}{:>12}{:>9}".format("step", "before ms", "after ms",
+                                           "speedup"))
+    for step, legacy, current in [
+        ("session key", legacy_session_key, allendalewine.get_session_key),
+        ("items", legacy_items, current_items),
+    ]:
+        before = ms_per_page(legacy, pages, args.repeat)
+        after = ms_per_page(current, pages, args.repeat)
+        print("{:<15}{:>12.3f}{:>12.3f}{:>8.1f}x".format(
+            step, before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark the threaded and asyncio fetch engines on a stub server.
+
+Scrapes generated garyswine catalogs from a local stub_server that waits
+before every answer, like a remote site would, with both engines and
+several page windows, and reports pages per second:
+
+    python -m scraper.benchmarks.bench_engines [-n PAGES] [-c CATALOGS]
+        [-l LATENCY] [-i ITEMS] [-p PARSE_WORKERS]
+
+Pages are parsed as usual, use few items per page to compare the fetch
+overhead of the engines alone.
+
+"""
+
+# STANDARD LIB
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import time
+
+# PROJECT LIB
+from scraper.benchmarks import stub_server
+from scraper.util import scraper_async, scraper_http, scraper_parse
+from scraper.web_scraper.wine_scraper import garyswine
+
+ITEMS_PER_PAGE = 100
+WINDOWS = [1, 4, 16]
+
+
+def make_page(page_num, n_items=ITEMS_PER_PAGE):
+    """Generate a garyswine result page.
+
+    Args:
+        page_num (int): page number, makes item names unique.
+        n_items (int, default ITEMS_PER_PAGE): items on the page.
+
+    Returns:
+        html_str (str): page html.
+    """
+    table = "<table><tr><td>{}</td><td>{}</td></tr></table>"
+    items = "".join(
+        table.format(
+            "img", "content_name: Wine {}-{}, ${}.99 ${}.99".format(
+                page_num, i, 10 + i % 50, 20 + i % 50))
+        for i in range(n_items))
+    header = table.format("nav", "nav") * 2
+    return "<html><body>{}{}{}</body></html>".format(header, items, header)
+
+
+def scrape_threads(catalogs, window):
+    """Scrape catalogs with the threaded engine, one thread per catalog.
+
+    Returns:
+        n_pages (int): pages scraped.
+    """
+    with concurrent.futures.ThreadPoolExecutor(catalogs) as executor:
+        futures = [
+            executor.submit(lambda: sum(1 for _ in garyswine.scrape_batches(
+                window))) for _ in range(catalogs)
+        ]
+        return sum(f.result() for f in futures)
+
+
+def scrape_async(catalogs, window):
+    """Scrape catalogs with the asyncio engine, all on one event loop.
+
+    Returns:
+        n_pages (int): pages scraped.
+    """
+
+    async def count(engine):
+        n_pages = 0
+        async for _ in garyswine.scrape_batches_async(engine, window):
+            n_pages += 1
+        return n_pages
+
+    async def run():
+        async with scraper_async.AsyncFetcher() as engine:
+            counts = await asyncio.gather(
+                *(count(engine) for _ in range(catalogs)))
+        return sum(counts)
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--pages", type=int, default=50)
+    parser.add_argument("-c", "--catalogs", type=int, default=4)
+    parser.add_argument("-l", "--latency", type=float, default=0.05)
+    parser.add_argument("-i", "--items", type=int, default=ITEMS_PER_PAGE)
+    parser.add_argument("-p", "--parse_workers", type=int, default=0)
+    args = parser.parse_args()
+    scraper_parse.configure(workers=args.parse_workers)
+
+    pages = [make_page(n, args.items) for n in range(1, args.pages + 1)]
+    with stub_server.serve_retailer(garyswine, pages, args.latency):
+        print("{:<10}{:>8}{:>12}".format("engine", "window", "pages/s"))
+        for window in WINDOWS:
+            scraper_http.configure(
+                cache_mode=scraper_http.CACHE_OFF,
+                rate=0,
+                max_connections_per_host=window * args.catalogs)
+            for name, fn in [("threads", scrape_threads),
+                             ("async", scrape_async)]:
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    n_pages = fn(args.catalogs, window)
+                elapsed = time.perf_counter() - start
+                print("{:<10}{:>8}{:>12.1f}".format(name, window,
+                                                    n_pages / elapsed))
+    scraper_parse.shutdown()
+
+if __name__ == "__main__":
+    main()
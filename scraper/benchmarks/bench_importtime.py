@@ -0,0 +1,79 @@
+"""Measure the cold start import cost of the driver with -X importtime.
+
+Each scenario runs in a fresh interpreter, so nothing is cached in
+sys.modules, and reports the total import time and the heaviest imports
+made by the top level modules:
+
+    python -m scraper.benchmarks.bench_importtime [-r REPEAT] [-t TOP]
+
+"""
+
+# STANDARD LIB
+import argparse
+import re
+import subprocess
+import sys
+
+SCENARIOS = [
+    ("driver", "import scraper.main.wine_scraper_main"),
+    ("driver + garyswine",
+     "import scraper.main.wine_scraper_main; "
+     "from scraper.web_scraper.wine_scraper import registry; "
+     "registry.get_modules(['garyswine'])"),
+    ("driver + all retailers",
+     "import scraper.main.wine_scraper_main; "
+     "from scraper.web_scraper.wine_scraper import registry; "
+     "registry.get_modules()"),
+]
+
+# "import time:  self [us] | cumulative | imported package"
+IMPORTTIME_REGEX = re.compile(r"import time:\s*(\d+) \|\s*(\d+) \|( *)(\S+)")
+
+
+def get_imports(code):
+    """Import times of the imports made by code.
+
+    Args:
+        code (str): python source run with -X importtime.
+
+    Returns:
+        imports (list of tuple): (name, cumulative us, depth) of every
+            import, depth 0 for imports made directly by code. Nested
+            imports are also counted in their parent's time.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          stderr=subprocess.PIPE,
+                          stdout=subprocess.DEVNULL,
+                          universal_newlines=True,
+                          check=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_REGEX.match(line)
+        if match:  # one space per top level import, two more per level
+            depth = (len(match.group(3)) - 1) // 2
+            imports.append((match.group(4), int(match.group(2)), depth))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-t", "--top", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, code in SCENARIOS:
+        # best of repeat, every run is a cold start
+        runs = []
+        for _ in range(args.repeat):
+            imports = get_imports(code)
+            runs.append((sum(us for _, us, d in imports if d == 0), imports))
+        total, imports = min(runs, key=lambda r: r[0])
+        print("{:<25}{:>10.1f} ms".format(name, total / 1e3))
+        second_level = [(m, us) for m, us, d in imports if d == 1]
+        second_level.sort(key=lambda i: -i[1])
+        for module, us in second_level[:args.top]:
+            print("    {:<40}{:>8.1f} ms".format(module, us / 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark get_metadata_from_query_result on the saved page corpus.
+
+Compares the per-row cost of the single pass METADATA_REGEX extractors
+against the previous chained str.findall + apply implementation.
+allendalewine reads its fields structurally, see bench_allendalewine:
+
+    python -m scraper.benchmarks.bench_metadata [corpus_dir]
+
+"""
+
+# STANDARD LIB
+import argparse
+import timeit
+import pandas as pd
+
+# PROJECT LIB
+from scraper.benchmarks import corpus
+
+PRICE_REGEX = r"\$\d{1,3}(?:[,]\d{3})*(?:[.]\d{2})"
+
+
+def legacy_content_name(df):
+    """Chained findall implementation of buyritewines / garyswine."""
+    df = df.copy()
+    df["NAME"] = df["RAW_DATA_STR"].str.findall("content_name.*?,").apply(
+        lambda x: x[0].split(":")[1][:-1].strip() if x else None)
+    df = df[df["NAME"].notnull()].copy()
+    df["PRICES"] = df["RAW_DATA_STR"].str.findall(PRICE_REGEX)
+    df["PRICE"] = df["PRICES"].apply(lambda x: x[0][1:].replace(",", ""))
+    df["BASE_PRICE"] = df["PRICES"].apply(
+        lambda x: x[1][1:].replace(",", "")
+        if (x[1:2]) else x[0][1:].replace(",", ""))
+    df["IS_ON_SALE"] = df["BASE_PRICE"] > df["PRICE"]
+    return df
+
+
+def legacy_winelibrary(df):
+    """Chained findall implementation of winelibrary metadata."""
+    df = df.copy()
+    df["RAW_DATA_STR"] = df["RAW_DATA_STR"].str.replace("\n", "")
+    df["NAME"] = df["RAW_DATA_STR"].str.findall(
+        r"(?<=js-elip-multi'>).*?(?=<)")
+    df["NAME"] = df["NAME"].apply(lambda x: x[0])
+    df["PRICES"] = df["RAW_DATA_STR"].str.findall(PRICE_REGEX)
+    df["PRICE"] = df["PRICES"].apply(lambda x: x[0][1:].replace(",", ""))
+    df["BASE_PRICE"] = df["PRICES"].apply(lambda x: x[1][1:].replace(",", ""))
+    df["IS_ON_SALE"] = df["BASE_PRICE"] > df["PRICE"]
+    return df
+
+
+LEGACY = {
+    "buyritewines": legacy_content_name,
+    "garyswine": legacy_content_name,
+    "winelibrary": legacy_winelibrary,
+}
+
+
+def get_raw_frame(retailer, corpus_dir=None):
+    """All item rows of a retailer's saved pages in one frame.
+
+    Args:
+        retailer (str): one of LEGACY.
+        corpus_dir (str, default None): corpus location.
+
+    Returns:
+        df (pd.DataFrame): dataframe with ["RAW_DATA_STR"].
+    """
+    module = corpus.get_module(retailer)
+    dfs = [module.get_raw_data(p) for p in corpus.load_pages(
+        retailer, corpus_dir)]
+    if not dfs:
+        return pd.DataFrame(columns=["RAW_DATA_STR"])
+    return pd.concat(dfs, ignore_index=True)
+
+
+def time_per_row(fn, df, repeat=5):
+    """Best of repeat timings of fn(df), in microseconds per row."""
+    seconds = min(timeit.repeat(lambda: fn(df), number=1, repeat=repeat))
+    return seconds / len(df) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir", nargs="?")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:<15}{:>8}{:>14}{:>14}{:>9}".format("retailer", "rows",
+                                                 "before us/row",
+                                                 "after us/row", "speedup"))
+    for retailer in LEGACY:
+        df = get_raw_frame(retailer, args.corpus_dir)
+        if df.empty:
+            print("{:<15}{:>8}".format(retailer, "no pages"))
+            continue
+        module = corpus.get_module(retailer)
+        before = time_per_row(LEGACY[retailer], df, args.repeat)
+        after = time_per_row(module.get_metadata_from_query_result, df,
+                             args.repeat)
+        print("{:<15}{:>8}{:>14.2f}{:>14.2f}{:>8.1f}x".format(
+            retailer, len(df), before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Benchmark get_raw_data of the table based retailers on the page corpus.
+
+Compares the lxml XPath cell reader against the previous pd.read_html
+implementation, per page, in CPU time and peak traced allocations:
+
+    python -m scraper.benchmarks.bench_raw_data [corpus_dir]
+
+"""
+
+# STANDARD LIB
+import argparse
+import io
+import time
+import tracemalloc
+import pandas as pd
+
+# PROJECT LIB
+from scraper.benchmarks import corpus
+
+RETAILERS = ["buyritewines", "garyswine"]
+
+
+def legacy_buyritewines(html_str):
+    """pd.read_html implementation of buyritewines.get_raw_data."""
+    result = pd.read_html(io.StringIO(html_str))
+    df = pd.concat(result)
+    df = df.loc[df[4].notnull(), [4]]
+    df.columns = ["RAW_DATA_STR"]
+    return df
+
+
+def legacy_garyswine(html_str):
+    """pd.read_html implementation of garyswine.get_raw_data."""
+    result = pd.read_html(io.StringIO(html_str))
+    df = pd.concat(result[2:-2])
+    df.columns = ["METADATA", "RAW_DATA_STR"]
+    return df[["RAW_DATA_STR"]].dropna()
+
+
+LEGACY = {
+    "buyritewines": legacy_buyritewines,
+    "garyswine": legacy_garyswine,
+}
+
+
+def cpu_ms_per_page(fn, pages, repeat=5):
+    """Best of repeat CPU times of fn over all pages, in ms per page."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for page in pages:
+            fn(page)
+        best = min(best, time.process_time() - start)
+    return best / len(pages) * 1e3
+
+
+def peak_kib_per_page(fn, pages):
+    """Mean peak traced allocation of fn on one page, in KiB."""
+    total = 0
+    for page in pages:
+        tracemalloc.start()
+        fn(page)
+        total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return total / len(pages) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir", nargs="?")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:<15}{:>7}{:>12}{:>12}{:>12}{:>12}".format(
+        "retailer", "pages", "before ms", "after ms", "before KiB",
+        "after KiB"))
+    for retailer in RETAILERS:
+        pages = corpus.load_pages(retailer, args.corpus_dir)
+        if not pages:
+            print("{:<15}{:>7}".format(retailer, "none"))
+            continue
+        legacy = LEGACY[retailer]
+        current = corpus.get_module(retailer).get_raw_data
+        for page in pages:
+            assert (legacy(page)["RAW_DATA_STR"].tolist() ==
+                    current(page)["RAW_DATA_STR"].tolist())
+        print("{:<15}{:>7}{:>12.2f}{:>12.2f}{:>12.0f}{:>12.0f}".format(
+            retailer, len(pages), cpu_ms_per_page(legacy, pages, args.repeat),
+            cpu_ms_per_page(current, pages, args.repeat),
+            peak_kib_per_page(legacy, pages),
+            peak_kib_per_page(current, pages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark scraper_io.SqliteWriter against the previous to_sql path.
+
+Writes the same synthetic catalog, one page sized batch at a time, once
+through df.to_sql on a fresh connection per batch (the old
+to_sqlite_db) and once through a single SqliteWriter, and reports rows
+per second:
+
+    python -m scraper.benchmarks.bench_sqlite_writer [-n ROWS]
+
+"""
+
+# STANDARD LIB
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# PROJECT LIB
+from scraper.util import scraper_io
+
+PAGE_SIZE = 100  # rows per batch, i.e. one result page
+
+
+def make_batches(n_rows, page_size=PAGE_SIZE):
+    """Synthetic wine table batches.
+
+    Args:
+        n_rows (int): total number of rows.
+        page_size (int, default PAGE_SIZE): rows per batch.
+
+    Returns:
+        batches (list of pd.DataFrame): frames with the wine table columns.
+    """
+    rng = np.random.default_rng(0)
+    price = rng.uniform(5, 500, n_rows).round(2)
+    df = pd.DataFrame({
+        "RUN_ID": 20200101000000,
+        "NAME": ["Wine {}".format(i) for i in range(n_rows)],
+        "PRICE": price,
+        "BASE_PRICE": price * rng.choice([1, 1.2], n_rows),
+        "SRC": "https://www.example.com/",
+        "QUERY": "https://www.example.com/wines/?page=1&l=100",
+        "AS_OF_DATE": pd.Timestamp("2020-01-01"),
+    })
+    df.insert(4, "IS_ON_SALE", df["BASE_PRICE"] > df["PRICE"])
+    return [df.iloc[i:i + page_size] for i in range(0, n_rows, page_size)]
+
+
+def write_to_sql(batches, db_path):
+    """The previous path: a new connection and df.to_sql per batch."""
+    for df in batches:
+        cnx = sqlite3.connect(db_path)
+        df.to_sql(name="wine", con=cnx, if_exists="append", index=False)
+        cnx.commit()
+        cnx.close()
+
+
+def write_sqlite_writer(batches, db_path):
+    """One SqliteWriter for the whole run."""
+    with scraper_io.SqliteWriter(db_path) as writer:
+        for df in batches:
+            writer.write(df, "wine")
+
+
+def rows_per_second(fn, batches):
+    """Rows per second of fn writing batches into a fresh db."""
+    n_rows = sum(len(df) for df in batches)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        start = time.perf_counter()
+        fn(batches, db_path)
+        seconds = time.perf_counter() - start
+        cnx = sqlite3.connect(db_path)
+        assert cnx.execute("SELECT COUNT(*) FROM wine").fetchone()[0] == n_rows
+        cnx.close()
+    return n_rows / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    batches = make_batches(args.rows)
+    before = rows_per_second(write_to_sql, batches)
+    after = rows_per_second(write_sqlite_writer, batches)
+    print("{:<15}{:>14}".format("path", "rows/sec"))
+    print("{:<15}{:>14,.0f}".format("to_sql", before))
+    print("{:<15}{:>14,.0f}".format("SqliteWriter", after))
+    print("speedup {:.1f}x".format(after / before))
+
+
+if __name__ == "__main__":
+    main()
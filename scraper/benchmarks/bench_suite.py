@@ -0,0 +1,109 @@
+"""Run the offline benchmark suite and keep its results.
+
+Runs scraper/tests/benchmarks with pytest-benchmark and saves every run
+under DATA_DIRECTORY/benchmarks, named after the current commit, then
+prints the pages/s, rows/s and peak memory of each benchmark:
+
+    python -m scraper.benchmarks.bench_suite [--corpus CORPUS_DIR]
+        [--compare [RUN]] [--threshold PCT]
+
+--compare checks the run against the last saved run, or RUN, e.g.
+0003, and fails if any mean got more than --threshold percent slower.
+
+"""
+
+# STANDARD LIB
+import argparse
+import glob
+import json
+import os
+import sys
+import pytest
+
+# PROJECT LIB
+from scraper.benchmarks import corpus
+from scraper.settings import settings
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests",
+                         "benchmarks")
+DEFAULT_THRESHOLD = 10.0  # percent a mean may regress before --compare fails
+
+
+def get_storage_dir():
+    """Directory the benchmark results are saved in.
+
+    Returns:
+        path (str): path under settings.DATA_DIRECTORY.
+    """
+    return os.path.join(settings.DATA_DIRECTORY, "benchmarks")
+
+
+def get_latest_result(storage_dir):
+    """Load the newest saved run.
+
+    Args:
+        storage_dir (str): see get_storage_dir.
+
+    Returns:
+        result (dict or None): pytest-benchmark json, None if no run is
+            saved.
+    """
+    paths = glob.glob(os.path.join(storage_dir, "**", "*.json"),
+                      recursive=True)
+    if not paths:
+        return None
+    with open(max(paths, key=os.path.getmtime)) as f:
+        return json.load(f)
+
+
+def print_throughput(result):
+    """Print the extra_info the benchmarks record, one line each.
+
+    Args:
+        result (dict): pytest-benchmark json.
+
+    Returns:
+        void
+    """
+    print("{:<55}{:>10}{:>12}{:>10}".format("benchmark", "pages/s",
+                                             "rows/s", "peak MiB"))
+    for bench in result["benchmarks"]:
+        info = bench["extra_info"]
+        print("{:<55}{:>10.1f}{:>12.0f}{:>10.1f}".format(
+            bench["name"], info["pages_per_sec"], info["rows_per_sec"],
+            info["peak_mib"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="corpus dir, the fixture pages "
+                        "if not given")
+    parser.add_argument("--compare", nargs="?", const="", metavar="RUN")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    if args.corpus:
+        os.environ[corpus.ENV_CORPUS] = args.corpus
+
+    storage_dir = get_storage_dir()
+    pytest_args = [
+        TESTS_DIR, "-q", "--benchmark-only", "--benchmark-autosave",
+        "--benchmark-storage=" + storage_dir
+    ]
+    if args.compare is not None:
+        pytest_args += [
+            "--benchmark-compare" +
+            ("=" + args.compare if args.compare else ""),
+            "--benchmark-compare-fail=mean:{:g}%".format(args.threshold)
+        ]
+    exit_code = pytest.main(pytest_args)
+
+    result = get_latest_result(storage_dir)
+    if result is not None:
+        print_throughput(result)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Saved page corpus used by the benchmarks.
+
+The corpus is a directory with one sub directory of .html files per
+retailer. It can be filled from the http cache of a previous run:
+
+    python -m scraper.benchmarks.corpus [corpus_dir]
+
+A small corpus of pages trimmed to the markup the parsers read ships in
+scraper/tests/fixtures/pages, for the offline benchmark suite.
+
+"""
+
+# STANDARD LIB
+import argparse
+import glob
+import hashlib
+import os
+
+# PROJECT LIB
+from scraper.settings import settings
+from scraper.util import scraper_cache
+from scraper.web_scraper.wine_scraper import registry
+
+RETAILERS = registry.get_names()
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                           "tests", "fixtures", "pages")
+ENV_CORPUS = "SCRAPER_BENCH_CORPUS"  # corpus of the benchmark suite
+
+
+def get_default_corpus_dir():
+    """Default location of the page corpus.
+
+    Returns:
+        path (str): path under settings.DATA_DIRECTORY.
+    """
+    return os.path.join(settings.DATA_DIRECTORY, "page_corpus")
+
+
+def get_suite_corpus_dir():
+    """Corpus the offline benchmark suite runs on.
+
+    Returns:
+        path (str): $SCRAPER_BENCH_CORPUS, else FIXTURE_DIR.
+    """
+    return os.environ.get(ENV_CORPUS) or FIXTURE_DIR
+
+
+def get_module(retailer):
+    """Import the wine_scraper module of a retailer.
+
+    Args:
+        retailer (str): one of RETAILERS.
+
+    Returns:
+        module (module): the wine_scraper module.
+    """
+    return registry.get_module(retailer)
+
+
+def load_pages(retailer, corpus_dir=None):
+    """Load the saved pages of one retailer.
+
+    Args:
+        retailer (str): one of RETAILERS.
+        corpus_dir (str, default None): corpus location, the default
+            corpus if None.
+
+    Returns:
+        pages (list of str): html of every saved page, sorted by file name.
+    """
+    corpus_dir = corpus_dir or get_default_corpus_dir()
+    pages = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, retailer,
+                                              "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+def export_cache(corpus_dir=None, cache_path=None):
+    """Copy cached pages into the corpus, grouped by retailer.
+
+    Args:
+        corpus_dir (str, default None): corpus location, the default
+            corpus if None.
+        cache_path (str, default None): http cache file, the default cache
+            if None.
+
+    Returns:
+        counts (dict): number of pages written per retailer.
+    """
+    corpus_dir = corpus_dir or get_default_corpus_dir()
+    cache = scraper_cache.HttpCache(cache_path
+                                    or scraper_cache.get_default_path())
+    prefixes = {r: get_module(r).HTML for r in RETAILERS}
+    counts = dict.fromkeys(RETAILERS, 0)
+    for url in cache.urls():
+        retailer = next((r for r, p in prefixes.items() if url.startswith(p)),
+                        None)
+        if retailer is None:
+            continue
+        out_dir = os.path.join(corpus_dir, retailer)
+        os.makedirs(out_dir, exist_ok=True)
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        with open(os.path.join(out_dir, name + ".html"), "w",
+                  encoding="utf-8") as f:
+            f.write(cache.get(url)["body"])
+        counts[retailer] += 1
+    cache.close()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir", nargs="?")
+    args = parser.parse_args()
+    print(export_cache(args.corpus_dir))
@@ -0,0 +1,180 @@
+"""Local stand in for the retailer sites.
+
+Serves a fixed set of pages from a thread per connection, with an
+optional delay per request to mimic network latency. Any other path is
+answered with an empty page, which every parser treats as the end of
+the catalog:
+
+    with stub_server.serve({"/wines/?page=1&l=100": html_str}) as base:
+        scraper_http.fetch(base + "wines/?page=1&l=100")
+
+serve_retailer puts saved pages, e.g. from the corpus, at the links a
+retailer module queries and points the module at the server, so the
+whole scrape runs offline:
+
+    with stub_server.serve_retailer(garyswine, pages):
+        garyswine.scrape()
+
+"""
+
+# STANDARD LIB
+import contextlib
+import http.server
+import threading
+import time
+
+EMPTY_PAGE = "<html><body></body></html>"
+# result page of a category, links to the page with its session key
+CATEGORY_PAGE = '<html><body><a href="/scan/MM={}:0:99:100">1</a></body></html>'
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """Threading server that accepts many connections at once."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # clients drop the requests they cancel past the end of a catalog
+        pass
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answers GETs from server.pages after server.latency seconds."""
+    protocol_version = "HTTP/1.1"  # keep connections alive
+    # headers and body go out as separate writes, don't let the second
+    # one wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        body = self.server.pages.get(self.path, EMPTY_PAGE).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.hits += 1
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve(pages, latency=0.0):
+    """Run a stub server on a free local port.
+
+    Args:
+        pages (dict): request path, e.g. "/search?page=1" -> html.
+        latency (float, default 0.0): seconds to wait before answering.
+
+    Yields:
+        base (str): base url of the server, ending in "/".
+    """
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.pages = pages
+    server.latency = latency
+    server.hits = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:{}/".format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def get_page_paths(module, n_pages):
+    """Paths a retailer module queries for its first result pages.
+
+    Page numbered retailers query page 1, 2, ...; allendalewine queries
+    the first page of each of its categories.
+
+    Args:
+        module (module): a wine_scraper module.
+        n_pages (int): number of pages, at most len(CATEGORY_PAGES) for
+            allendalewine.
+
+    Returns:
+        paths (list of str): request paths, e.g. "/search?page=1".
+    """
+    if hasattr(module, "CATEGORY_PAGES"):
+        links = [
+            module.get_page_link(get_category_format(module, i), 0,
+                                 module.MAX_RESULTS_PER_PAGE)
+            for i in range(n_pages)
+        ]
+    else:  # the page size is ignored by formats without one
+        links = [
+            module.HTML_FORMAT.format(n, getattr(module, "RESULTS_PER_PAGE",
+                                                 None))
+            for n in range(1, n_pages + 1)
+        ]
+    return [link[len(module.HTML) - 1:] for link in links]
+
+
+def get_category_format(module, category_num):
+    """Html base link format the stub hands out for a category.
+
+    Args:
+        module (module): allendalewine.
+        category_num (int): position in CATEGORY_PAGES.
+
+    Returns:
+        html_format (str): link with a made up session key.
+    """
+    return module.HTML + "scan/MM=stub{}".format(category_num)
+
+
+def get_site_pages(module, pages):
+    """Lay saved result pages out the way a retailer's site serves them.
+
+    Args:
+        module (module): a wine_scraper module.
+        pages (list of str): html of saved result pages. allendalewine
+            categories take turns at them, other retailers get them as
+            page 1, 2, ...
+
+    Returns:
+        site (dict): request path -> html, see serve.
+    """
+    if not hasattr(module, "CATEGORY_PAGES"):
+        return dict(zip(get_page_paths(module, len(pages)), pages))
+
+    categories = module.CATEGORY_PAGES
+    site = {}
+    for i, path in enumerate(get_page_paths(module, len(categories))):
+        site["/" + categories[i]] = CATEGORY_PAGE.format("stub{}".format(i))
+        site[path] = pages[i % len(pages)]
+    return site
+
+
+@contextlib.contextmanager
+def serve_retailer(module, pages, latency=0.0):
+    """Serve saved pages in place of a retailer's site.
+
+    The module's HTML and HTML_FORMAT point at the stub server until the
+    context exits.
+
+    Args:
+        module (module): a wine_scraper module.
+        pages (list of str): html of saved result pages, see
+            get_site_pages.
+        latency (float, default 0.0): seconds to wait before answering.
+
+    Yields:
+        base (str): base url of the server, ending in "/".
+    """
+    html = module.HTML
+    html_format = getattr(module, "HTML_FORMAT", None)
+    with serve(get_site_pages(module, pages), latency) as base:
+        module.HTML = base
+        if html_format is not None:
+            module.HTML_FORMAT = base + html_format[len(html):]
+        try:
+            yield base
+        finally:
+            module.HTML = html
+            if html_format is not None:
+                module.HTML_FORMAT = html_format
@@ -1,62 +1,505 @@
 """Driver file for all the wine_scraper modules.
 
+Pandas and the fetch, parse and io modules are imported by the functions
+that use them, so importing the driver stays cheap and a run only pays
+for the retailers it selects, see registry.
+
 """
 
 # STANDARD LIB
 import argparse
+import concurrent.futures
+import contextlib
 import os
-import pandas as pd
+import queue
 
 # PROJECT LIB
 from scraper.settings import settings
-from scraper.web_scraper.wine_scraper import (allendalewine, buyritewines,
-                                              garyswine, winelibrary)
-from scraper.util import scraper_io
+from scraper.web_scraper.wine_scraper import registry
+
+DEFAULT_WORKERS = 1  # sequential unless asked otherwise
+QUEUE_SIZE = 16  # scraped batches waiting for the writer
+# rows written before a commit, 0 commits every page with its checkpoint
+# so a crash loses no finished page; cheap in WAL mode
+COMMIT_ROWS = 0
+
+SINK_SQLITE = "sqlite"
+SINK_CSV = "csv"
+SINK_PARQUET = "parquet"
+SINKS = [SINK_SQLITE, SINK_CSV, SINK_PARQUET]
+
+ENGINE_THREADS = "threads"  # blocking requests, a thread per page in flight
+ENGINE_ASYNC = "async"  # aiohttp, every request on one event loop
+ENGINES = [ENGINE_THREADS, ENGINE_ASYNC]
+
+
+def get_module_name(module):
+    """Short name of a wine_scraper module, e.g. "garyswine".
+
+    Args:
+        module (module): a wine_scraper module.
+
+    Returns:
+        name (str): last component of the module path.
+    """
+    return module.__name__.split(".")[-1]
+
+
+def get_db_path():
+    """Path of the wine database.
+
+    Returns:
+        path (str): path under settings.DB_DIRECTORY.
+    """
+    return os.path.join(settings.DB_DIRECTORY, "wine_db.db")
+
+
+def get_completed_pages(run_id):
+    """Pages an earlier, interrupted run already wrote to the wine db.
+
+    Args:
+        run_id (int): ID of the run to resume.
+
+    Returns:
+        pages (dict): module name -> set of page keys.
+    """
+    from scraper.util import scraper_io
+
+    with scraper_io.WineDbWriter(get_db_path()) as writer:
+        return writer.get_completed_pages(run_id)
+
+
+def match_products():
+    """Match the products new to the wine db with those of other retailers.
+
+    Returns:
+        void
+    """
+    from scraper.util import scraper_io
+    from scraper.web_scraper.wine_scraper import matching
+
+    with scraper_io.WineDbWriter(get_db_path()) as writer:
+        n_products, n_pairs = matching.match_new_products(writer)
+    print("Matched {} new products, {} matches found".format(
+        n_products, n_pairs))
+
+
+def refresh_aggregates(run_id):
+    """Add a run to the price aggregates read by scraper_query.
+
+    Only the retailers the run scraped completely are added, the others
+    keep their previous run as their latest, see open_writer.
+
+    Args:
+        run_id (int): ID of this run.
+
+    Returns:
+        void
+    """
+    from scraper.util import scraper_io
+
+    with scraper_io.WineDbWriter(get_db_path()) as writer:
+        writer.refresh_aggregates([run_id])
+
+
+def write_metrics(run_id, metrics_file=None):
+    """Store the metrics of a run and print where the time went.
+
+    Metrics go to the run_metric table of the wine db whatever the sink,
+    and optionally to a file in the Prometheus text format, e.g. for the
+    node exporter textfile collector.
+
+    Args:
+        run_id (int): ID of this run.
+        metrics_file (str, default None): path of the Prometheus file.
+
+    Returns:
+        void
+    """
+    from scraper.util import scraper_io, scraper_metrics
+
+    rows = scraper_metrics.get_rows()
+    print(scraper_metrics.format_summary(rows))
+    print(scraper_metrics.format_memory(rows))
+    with scraper_io.WineDbWriter(get_db_path()) as writer:
+        writer.write_metrics(run_id, rows)
+    if metrics_file:
+        with open(metrics_file, "w") as f:
+            f.write(scraper_metrics.to_prometheus(rows, run_id))
+
+
+@contextlib.contextmanager
+def open_writer(run_id, sink=SINK_SQLITE, write_mode=None):
+    """Open a function that writes one batch of a module to a sink.
+
+    The sqlite sink writes into the normalized schema of
+    scraper_io.WineDbWriter, keeps one connection open for the whole run
+    and commits when the context exits. The parquet sink buffers up to
+    scraper_io.PARQUET_FILE_ROWS rows per module and adds them to the
+    scraper_io.get_parquet_directory() dataset.
+
+    Calling write with None instead of a batch marks the module as
+    completely scraped; the sqlite sink records it on the run, so only
+    completed modules reach the aggregates, and in delta mode closes the
+    price intervals of products the module no longer lists. The sqlite
+    sink checkpoints the page_key of every batch together with its rows,
+    see get_completed_pages.
+
+    Args:
+        run_id (int): ID of this run.
+        sink (str, default SINK_SQLITE): one of SINKS.
+        write_mode (str, default None): one of scraper_io.WRITE_MODES,
+            scraper_io.WRITE_FULL if None, sqlite sink only.
+
+    Yields:
+        write (callable): takes a batch, the module that produced it and
+            optionally the key of the page it came from.
+    """
+    import pandas as pd
+    from scraper.util import scraper_io
+
+    write_mode = write_mode or scraper_io.WRITE_FULL
+    if sink == SINK_CSV:
+        paths = {}  # one csv per module per run
+
+        def write_csv(df, module, page_key=None):
+            if df is None:
+                return
+            name = get_module_name(module)
+            if name not in paths:
+                paths[name] = scraper_io.get_csv_path(name + "_catalog")
+            scraper_io.append_csv(df, paths[name])
+
+        yield write_csv
+        return
+
+    if sink == SINK_PARQUET:
+        pending = {}  # module name -> batches not yet written
+
+        def flush(name):
+            dfs = pending.pop(name, [])
+            if dfs:
+                scraper_io.to_parquet(pd.concat(dfs, ignore_index=True))
+
+        def write_parquet(df, module, page_key=None):
+            name = get_module_name(module)
+            if df is None:
+                flush(name)
+                return
+            dfs = pending.setdefault(name, [])
+            dfs.append(df)
+            if sum(len(d) for d in dfs) >= scraper_io.PARQUET_FILE_ROWS:
+                flush(name)
+
+        try:
+            yield write_parquet
+        finally:
+            for name in list(pending):
+                flush(name)
+        return
+
+    with scraper_io.WineDbWriter(get_db_path(),
+                                 commit_rows=COMMIT_ROWS,
+                                 write_mode=write_mode) as writer:
+        writer.start_run(run_id)
+
+        def write_sqlite(df, module, page_key=None):
+            if df is None:
+                writer.complete_retailer(module.HTML, run_id)
+                return
+            writer.write_batch(df, get_module_name(module), page_key)
 
+        yield write_sqlite
 
-def scrape(run_id, module):
+
+def add_run_id(df, run_id):
+    """Prepend the run ID column in place.
+
+    Args:
+        df (pd.DataFrame): a batch from a wine_scraper module.
+        run_id (int): ID of this run.
+
+    Returns:
+        df (pd.DataFrame): the same frame with a leading "RUN_ID" column.
+    """
+    df.insert(0, "RUN_ID", run_id)
+    return df
+
+
+def scrape(run_id, module, write=None, skip_pages=None):
     """Scrape to db.
 
-    Include database audit columns and run ID here.
+    Include database audit columns and run ID here. Each batch is written
+    as soon as it is scraped, so only one page is held in memory.
 
     Args:
         run_id (int): ID of this run.
         module (module): a wine_scraper module.
+        write (callable, default None): writer from open_writer, a new
+            sqlite writer if None.
+        skip_pages (set of str, default None): page keys already written
+            by this run, see get_completed_pages.
 
     """
+    if write is None:
+        with open_writer(run_id) as write:
+            scrape(run_id, module, write, skip_pages)
+        return
+
+    name = get_module_name(module)
     try:
-        name = module.__name__.split(".")[-1]
         print("Scraping {}...".format(name))
-        df = module.scrape()
-        cols = df.columns.tolist()
-        df["RUN_ID"] = run_id
-        df = df[["RUN_ID"] + cols]
-        scraper_io.to_sqlite_db(df,
-                                table_name="wine",
-                                db_path=os.path.join(settings.DB_DIRECTORY,
-                                                     "wine_db.db"))
+        for page_key, df in module.scrape_batches(skip_pages=skip_pages):
+            write(add_run_id(df, run_id), module, page_key)
+        write(None, module)
     except Exception as e:
         print("Failed to scrape {} into db, exception {}".format(name, e))
 
 
+def scrape_parallel(run_id,
+                    modules,
+                    max_workers,
+                    write=None,
+                    completed_pages=None):
+    """Scrape several modules at the same time.
+
+    Retailers are scraped on a thread pool and push their batches onto a
+    bounded queue. Every write happens here on the calling thread, one
+    batch at a time, so the sqlite file only ever has a single writer.
+    As in scrape, a failed write stops its module, which is then not
+    marked completely scraped.
+
+    Args:
+        run_id (int): ID of this run.
+        modules (list of module): wine_scraper modules to run.
+        max_workers (int): number of retailers to scrape concurrently.
+        write (callable, default None): writer from open_writer, a new
+            sqlite writer if None.
+        completed_pages (dict, default None): module name -> page keys
+            already written by this run, see get_completed_pages.
+
+    Returns:
+        void
+    """
+    if write is None:
+        with open_writer(run_id) as write:
+            scrape_parallel(run_id, modules, max_workers, write,
+                            completed_pages)
+        return
+    completed_pages = completed_pages or {}
+
+    batches = queue.Queue(maxsize=QUEUE_SIZE)
+    failed = set()  # names of the modules a write failed for
+
+    def produce(module):
+        name = get_module_name(module)
+        is_complete = False
+        try:
+            print("Scraping {}...".format(name))
+            for page_key, df in module.scrape_batches(
+                    skip_pages=completed_pages.get(name)):
+                if name in failed:
+                    return
+                batches.put((module, page_key, add_run_id(df, run_id)))
+            is_complete = True
+        except Exception as e:
+            print("Failed to scrape {}, exception {}".format(name, e))
+        finally:
+            batches.put((module, None, is_complete))  # this module is done
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for module in modules:
+            executor.submit(produce, module)
+
+        remaining = len(modules)
+        while remaining:
+            module, page_key, df = batches.get()
+            name = get_module_name(module)
+            if isinstance(df, bool):
+                remaining -= 1
+                if not df:
+                    continue
+                df = None  # completed, let the writer finish the module
+            if name in failed:
+                continue
+            try:
+                write(df, module, page_key)
+            except Exception as e:
+                failed.add(name)
+                print("Failed to scrape {} into db, exception {}".format(
+                    name, e))
+
+
+def scrape_async(run_id, modules, write=None, completed_pages=None):
+    """Scrape several modules at the same time on one event loop.
+
+    Every module runs as a task of a single event loop using the asyncio
+    fetch engine of scraper_async. Batches are written from the loop as
+    they arrive, so the sqlite file only ever has a single writer.
+
+    Args:
+        run_id (int): ID of this run.
+        modules (list of module): wine_scraper modules to run.
+        write (callable, default None): writer from open_writer, a new
+            sqlite writer if None.
+        completed_pages (dict, default None): module name -> page keys
+            already written by this run, see get_completed_pages.
+
+    Returns:
+        void
+    """
+    if write is None:
+        with open_writer(run_id) as write:
+            scrape_async(run_id, modules, write, completed_pages)
+        return
+    completed_pages = completed_pages or {}
+
+    # aiohttp is only needed by this engine, import it when selected
+    import asyncio
+    from scraper.util import scraper_async
+
+    async def produce(engine, module):
+        name = get_module_name(module)
+        try:
+            print("Scraping {}...".format(name))
+            async for page_key, df in module.scrape_batches_async(
+                    engine, skip_pages=completed_pages.get(name)):
+                write(add_run_id(df, run_id), module, page_key)
+            write(None, module)
+        except Exception as e:
+            print("Failed to scrape {} into db, exception {}".format(name, e))
+
+    async def run():
+        async with scraper_async.AsyncFetcher() as engine:
+            await asyncio.gather(*(produce(engine, m) for m in modules))
+
+    asyncio.run(run())
+
+
 def main():
     """Scrape everything.
 
     """
-    run_id = int(pd.to_datetime("today").strftime("%Y%m%d%H%M%S"))
+    import pandas as pd
+    from scraper.util import (scraper_http, scraper_io, scraper_metrics,
+                              scraper_parse, scraper_throttle)
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("-s", "--scraper_to_run")
+    parser.add_argument("-s",
+                        "--scraper_to_run",
+                        nargs="+",
+                        choices=registry.get_names(),
+                        help="retailers to scrape, all if not given")
+    parser.add_argument("-w",
+                        "--workers",
+                        type=int,
+                        default=DEFAULT_WORKERS,
+                        help="number of retailers to scrape concurrently")
+    parser.add_argument("-e",
+                        "--engine",
+                        choices=ENGINES,
+                        default=ENGINE_THREADS,
+                        help="async scrapes every retailer on one event "
+                        "loop, --workers is ignored")
+    parser.add_argument("-c",
+                        "--connections_per_host",
+                        type=int,
+                        default=scraper_http.MAX_CONNECTIONS_PER_HOST,
+                        help="max open connections to one site")
+    parser.add_argument("-p",
+                        "--parse_workers",
+                        type=int,
+                        default=scraper_parse.DEFAULT_WORKERS,
+                        help="processes parsing pages, 0 parses on the "
+                        "fetching threads")
+    parser.add_argument("--cache-only",
+                        action="store_true",
+                        help="re-parse cached pages without network access")
+    parser.add_argument("--rate",
+                        type=float,
+                        default=scraper_throttle.DEFAULT_RATE,
+                        help="requests per second per site, 0 for no limit")
+    parser.add_argument("--sink", choices=SINKS, default=SINK_SQLITE)
+    parser.add_argument("--write_mode",
+                        choices=scraper_io.WRITE_MODES,
+                        default=scraper_io.WRITE_FULL,
+                        help="delta only stores prices that changed")
+    parser.add_argument("--metrics_file",
+                        help="also write the run metrics to this file in "
+                        "the Prometheus text format")
+    parser.add_argument("--profile",
+                        action="store_true",
+                        help="cProfile each retailer, writes a .pstats file "
+                        "per retailer to DATA_DIRECTORY/profiles")
+    parser.add_argument("--trace-memory",
+                        action="store_true",
+                        help="trace the allocations of each retailer with "
+                        "tracemalloc, writes a report per retailer to "
+                        "DATA_DIRECTORY/profiles")
+    parser.add_argument("--resume",
+                        type=int,
+                        metavar="RUN_ID",
+                        help="continue an interrupted run, skipping the "
+                        "pages it already wrote (sqlite sink only)")
     args = parser.parse_args()
+    if args.resume is not None and args.sink != SINK_SQLITE:
+        parser.error("--resume needs --sink {}".format(SINK_SQLITE))
+    is_profiled = args.profile or args.trace_memory
+    if is_profiled and (args.engine == ENGINE_ASYNC or args.workers > 1
+                        or args.parse_workers > 0):
+        # a profile has to see one retailer's threads and nothing else
+        parser.error("--profile and --trace-memory scrape one retailer at a "
+                     "time, without --engine {}, --workers or "
+                     "--parse_workers".format(ENGINE_ASYNC))
+    if is_profiled:
+        from scraper.util import scraper_profile
+
+    if args.resume is None:
+        run_id = int(pd.Timestamp.now().strftime("%Y%m%d%H%M%S"))
+        completed_pages = {}
+    else:
+        run_id = args.resume
+        completed_pages = get_completed_pages(run_id)
+        print("Resuming run {}, {} pages already written".format(
+            run_id, sum(len(p) for p in completed_pages.values())))
 
-    if args.scraper_to_run is None or args.scraper_to_run == "allendalewine":
-        scrape(run_id, allendalewine)
-    if args.scraper_to_run is None or args.scraper_to_run == "buyritewines":
-        scrape(run_id, buyritewines)
-    if args.scraper_to_run is None or args.scraper_to_run == "garyswine":
-        scrape(run_id, garyswine)
-    if args.scraper_to_run is None or args.scraper_to_run == "winelibrary":
-        scrape(run_id, winelibrary)
+    scraper_http.configure(
+        rate=args.rate, max_connections_per_host=args.connections_per_host)
+    if args.cache_only:
+        scraper_http.configure(cache_mode=scraper_http.CACHE_ONLY)
+    scraper_parse.configure(workers=args.parse_workers)
+
+    # only the selected retailers are imported
+    modules = registry.get_modules(args.scraper_to_run)
+
+    scraper_metrics.reset()
+    try:
+        with open_writer(run_id, args.sink, args.write_mode) as write:
+            if args.engine == ENGINE_ASYNC:
+                scrape_async(run_id, modules, write, completed_pages)
+            elif args.workers > 1:
+                scrape_parallel(run_id, modules, args.workers, write,
+                                completed_pages)
+            else:
+                for module in modules:
+                    name = get_module_name(module)
+                    if not is_profiled:
+                        scrape(run_id, module, write,
+                               completed_pages.get(name))
+                        continue
+                    with scraper_profile.profile(
+                            name,
+                            scraper_profile.get_profile_directory(run_id),
+                            cpu=args.profile,
+                            memory=args.trace_memory):
+                        scrape(run_id, module, write,
+                               completed_pages.get(name))
+    finally:
+        scraper_parse.shutdown()
+    if args.sink == SINK_SQLITE:
+        match_products()
+        refresh_aggregates(run_id)
+    write_metrics(run_id, args.metrics_file)
 
 
 if __name__ == "__main__":
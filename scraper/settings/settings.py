@@ -1,22 +1,138 @@
+"""Module of run settings, e.g. where data and databases are written.
+
+Settings are read on first access, not on import, and then cached:
+
+    from scraper.settings import settings
+    settings.DATA_DIRECTORY
+
+Each setting is looked up, in order, in the values passed to configure,
+the SCRAPER_<NAME> environment variable and the config file. The config
+file is the path passed to configure, else $SCRAPER_CONFIG, else
+~/.scraper/scraper_config.py, a python file defining every setting.
+
+"""
+
 # STANDARD LIB
 import importlib.util
 import os
-import sys
-
-homedir = os.path.expanduser("~")
-homedir = os.path.realpath(homedir)
-scraper_config_dir = os.path.join(homedir, ".scraper")
-scraper_config_path = os.path.join(scraper_config_dir, "scraper_config.py")
-
-config_path = scraper_config_path
-if os.path.exists(scraper_config_path):
-    spec = importlib.util.spec_from_file_location("scraper", config_path)
-    c = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(c)
-
-    # Setup constants.
-    DATA_DIRECTORY = c.DATA_DIRECTORY
-    DB_DIRECTORY = c.DB_DIRECTORY
-else:
-    print("No configuration file found... exiting process...")
-    sys.exit(1)
+import threading
+
+SETTING_NAMES = ["DATA_DIRECTORY", "DB_DIRECTORY"]
+ENV_PREFIX = "SCRAPER_"  # e.g. SCRAPER_DATA_DIRECTORY
+ENV_CONFIG = "SCRAPER_CONFIG"  # path of the config file
+
+_config_path = None  # config file passed to configure
+_overrides = {}  # values passed to configure
+_values = None  # cached settings, None until first access
+_lock = threading.Lock()
+
+
+def get_default_config_path():
+    """Default location of the config file.
+
+    Returns:
+        path (str): ~/.scraper/scraper_config.py
+    """
+    homedir = os.path.realpath(os.path.expanduser("~"))
+    return os.path.join(homedir, ".scraper", "scraper_config.py")
+
+
+def get_config_path():
+    """Config file that settings are read from.
+
+    Returns:
+        path (str): the configured path, else $SCRAPER_CONFIG, else
+            get_default_config_path().
+    """
+    return (_config_path or os.environ.get(ENV_CONFIG)
+            or get_default_config_path())
+
+
+def configure(config_path=None, **values):
+    """Override where settings come from.
+
+    Cached settings are dropped, so the next access reads them again.
+
+    Args:
+        config_path (str, default None): config file to read, None keeps
+            the current one.
+        **values: settings to use as is, e.g. DATA_DIRECTORY="/tmp".
+
+    Returns:
+        void
+    """
+    global _config_path, _values
+    unknown = set(values) - set(SETTING_NAMES)
+    if unknown:
+        raise ValueError("unknown settings {}, expected {}".format(
+            sorted(unknown), SETTING_NAMES))
+    with _lock:
+        if config_path is not None:
+            _config_path = config_path
+        _overrides.update(values)
+        _values = None
+
+
+def reset():
+    """Drop every override and the cached settings.
+
+    Returns:
+        void
+    """
+    global _config_path, _values
+    with _lock:
+        _config_path = None
+        _overrides.clear()
+        _values = None
+
+
+def load_config_file(path):
+    """Execute a config file.
+
+    Args:
+        path (str): path of the python config file.
+
+    Returns:
+        config (module): the executed config.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            "No configuration file found at {}, create it or set {} or "
+            "the {}<NAME> environment variables".format(
+                path, ENV_CONFIG, ENV_PREFIX))
+    spec = importlib.util.spec_from_file_location("scraper_config", path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
+
+
+def get_settings():
+    """Get every setting, reading them on first call.
+
+    Returns:
+        values (dict): setting name -> value.
+    """
+    global _values
+    with _lock:
+        if _values is None:
+            values = {}
+            config = None
+            for name in SETTING_NAMES:
+                if name in _overrides:
+                    values[name] = _overrides[name]
+                elif ENV_PREFIX + name in os.environ:
+                    values[name] = os.environ[ENV_PREFIX + name]
+                else:
+                    if config is None:  # only read when needed
+                        config = load_config_file(get_config_path())
+                    values[name] = getattr(config, name)
+            _values = values
+        return _values
+
+
+def __getattr__(name):
+    """Settings are read on first access, e.g. settings.DATA_DIRECTORY."""
+    if name in SETTING_NAMES:
+        return get_settings()[name]
+    raise AttributeError("module {} has no attribute {}".format(
+        __name__, name))
@@ -0,0 +1,125 @@
+"""Offline benchmarks of every retailer module.
+
+Runs on the saved pages of benchmarks.corpus.get_suite_corpus_dir(),
+served by benchmarks.stub_server, so no site is contacted. Each
+benchmark adds pages/s, rows/s and peak traced memory to its
+extra_info. Run and keep results with benchmarks.bench_suite.
+
+"""
+
+# STANDARD LIB
+import contextlib
+import io
+import tracemalloc
+import pytest
+
+# PROJECT LIB
+from scraper.benchmarks import corpus, stub_server
+from scraper.util import scraper_http, scraper_parse, scraper_throttle
+
+pytest.importorskip("pytest_benchmark")
+
+ROUNDS = 5
+
+
+@pytest.fixture(params=corpus.RETAILERS)
+def retailer(request):
+    pages = corpus.load_pages(request.param, corpus.get_suite_corpus_dir())
+    if not pages:
+        pytest.skip("no saved pages of {}".format(request.param))
+    return corpus.get_module(request.param), pages
+
+
+@pytest.fixture
+def site(retailer):
+    module, pages = retailer
+    scraper_http.configure(cache_mode=scraper_http.CACHE_OFF, rate=0)
+    scraper_parse.configure(workers=0)
+    with stub_server.serve_retailer(module, pages) as base:
+        yield module, pages, base
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ON,
+                           rate=scraper_throttle.DEFAULT_RATE)
+
+
+def quiet(fn):
+    """Run fn without the per page progress prints."""
+
+    def run(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn(*args)
+
+    return run
+
+
+def record(benchmark, fn, n_pages, n_rows):
+    """Add throughput and the peak memory of one more call of fn.
+
+    Nothing is recorded when benchmarks are disabled, e.g. with
+    --benchmark-disable or under xdist.
+
+    Args:
+        benchmark (BenchmarkFixture): a benchmark that has run.
+        fn (callable): the benchmarked function, called once more under
+            tracemalloc.
+        n_pages (int): pages handled per call.
+        n_rows (int): rows produced per call.
+    """
+    if benchmark.disabled or benchmark.stats is None:
+        return
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info["pages_per_sec"] = n_pages / mean
+    benchmark.extra_info["rows_per_sec"] = n_rows / mean
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_mib"] = peak / 2**20
+
+
+def test_query_one_page(benchmark, site):
+    module, pages, base = site
+    if hasattr(module, "CATEGORY_PAGES"):
+        session = scraper_http.new_session()
+        links = [
+            base + path[1:]
+            for path in stub_server.get_page_paths(module, len(pages))
+        ]
+        fn = quiet(lambda: [module.query_one_page(session, l) for l in links])
+    else:
+        fn = quiet(lambda: [
+            module.query_one_page(n) for n in range(1, len(pages) + 1)
+        ])
+
+    dfs = benchmark.pedantic(fn, rounds=ROUNDS, warmup_rounds=1)
+    assert all(not df.empty for df in dfs)
+    record(benchmark, fn, len(pages), sum(len(df) for df in dfs))
+
+
+def test_get_metadata_from_query_result(benchmark, retailer):
+    module, pages = retailer
+    raws = [module.get_raw_data(page) for page in pages]
+
+    def setup():
+        return ([df.copy() for df in raws],), {}
+
+    def transform(dfs):
+        return [module.get_metadata_from_query_result(df) for df in dfs]
+
+    dfs = benchmark.pedantic(transform,
+                             setup=setup,
+                             rounds=ROUNDS,
+                             warmup_rounds=1)
+    record(benchmark, lambda: transform(setup()[0][0]), len(pages),
+           sum(len(df) for df in dfs))
+
+
+def test_scrape(benchmark, site):
+    module, _, _ = site
+    n_pages = sum(1 for _ in quiet(lambda: list(module.scrape_batches()))())
+    fn = quiet(module.scrape)
+
+    df = benchmark.pedantic(fn, rounds=ROUNDS, warmup_rounds=1)
+    assert not df.empty
+    record(benchmark, fn, n_pages, len(df))
@@ -0,0 +1,124 @@
+"""All unit tests for wine_scraper_main module.
+
+"""
+
+# STANDARD LIB
+import sqlite3
+import types
+import pandas as pd
+import pytest
+
+# PROJECT LIB
+from scraper.main import wine_scraper_main
+from scraper.settings import settings
+from scraper.util import scraper_io
+
+
+def make_module(name, n_pages):
+
+    def scrape_batches(skip_pages=None):
+        for page_num in range(1, n_pages + 1):
+            yield str(page_num), pd.DataFrame({"PAGE": [page_num]})
+
+    module = types.ModuleType("scraper.web_scraper.wine_scraper." + name)
+    module.HTML = "https://{}.com".format(name)
+    module.scrape_batches = scrape_batches
+    return module
+
+
+def make_wine_module(name, names, price, fail_at=None):
+    """Module scraping a page per wine, failing on page fail_at."""
+    html = "https://www.{}.com/".format(name)
+
+    def scrape_batches(skip_pages=None):
+        for page_num, wine in enumerate(names, 1):
+            if page_num == fail_at:
+                raise ValueError("page failed")
+            yield str(page_num), pd.DataFrame({
+                "NAME": [wine],
+                "PRICE": [price],
+                "BASE_PRICE": [price],
+                "IS_ON_SALE": [False],
+                "SRC": html,
+                "QUERY": html,
+                "AS_OF_DATE": pd.Timestamp("2020-01-01"),
+            })
+
+    module = types.ModuleType("scraper.web_scraper.wine_scraper." + name)
+    module.HTML = html
+    module.scrape_batches = scrape_batches
+    return module
+
+
+def make_write(fail_at=None):
+    """Write recording (module name, page key), failing on one page."""
+    written = []
+
+    def write(df, module, page_key=None):
+        name = wine_scraper_main.get_module_name(module)
+        if (name, page_key) == fail_at:
+            raise ValueError("write failed")
+        written.append((name, page_key))
+
+    return write, written
+
+
+def test_scrape_001():
+    write, written = make_write(fail_at=("a", "2"))
+    wine_scraper_main.scrape(1, make_module("a", 3), write)
+    assert written == [("a", "1")]
+
+
+def test_scrape_parallel_001():
+    write, written = make_write()
+    modules = [make_module("a", 3), make_module("b", 2)]
+    wine_scraper_main.scrape_parallel(1, modules, 2, write)
+    for name, n_pages in [("a", 3), ("b", 2)]:
+        pages = [key for src, key in written if src == name]
+        assert pages == [str(i) for i in range(1, n_pages + 1)] + [None]
+
+
+def test_scrape_parallel_002():
+    # a failed write stops its module without completing it, as in scrape
+    write, written = make_write(fail_at=("a", "2"))
+    modules = [make_module("a", 3), make_module("b", 2)]
+    wine_scraper_main.scrape_parallel(1, modules, 2, write)
+    assert [key for src, key in written if src == "a"] == ["1"]
+    assert [key for src, key in written if src == "b"] == ["1", "2", None]
+
+
+@pytest.fixture
+def db_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv(settings.ENV_PREFIX + "DB_DIRECTORY", str(tmp_path))
+    settings.configure()  # drop the cached settings
+    yield str(tmp_path)
+    monkeypatch.undo()
+    settings.configure()
+
+
+@pytest.mark.parametrize("write_mode", scraper_io.WRITE_MODES)
+def test_refresh_aggregates_001(db_directory, write_mode):
+    # b fails partway through run 2, its run 1 prices stay the latest
+    for run_id, fail_at in [(1, None), (2, 2)]:
+        modules = [
+            make_wine_module("a", ["Wine A1", "Wine A2"], 10.0 - run_id),
+            make_wine_module("b", ["Wine B1", "Wine B2"], 10.0 - run_id,
+                             fail_at)
+        ]
+        with wine_scraper_main.open_writer(run_id,
+                                           write_mode=write_mode) as write:
+            for module in modules:
+                wine_scraper_main.scrape(run_id, module, write)
+        wine_scraper_main.refresh_aggregates(run_id)
+    cnx = sqlite3.connect(wine_scraper_main.get_db_path())
+    assert cnx.execute("SELECT SRC, RUN_ID FROM retailer_latest_run "
+                       "ORDER BY SRC").fetchall() == [
+                           ("https://www.a.com/", 2),
+                           ("https://www.b.com/", 1)
+                       ]
+    assert cnx.execute("SELECT w.NAME, l.RUN_ID, w.PRICE FROM wine_price w "
+                       "JOIN product_latest l USING (PRODUCT_ID) "
+                       "ORDER BY w.NAME").fetchall() == [("Wine A1", 2, 8.0),
+                                                         ("Wine A2", 2, 8.0),
+                                                         ("Wine B1", 1, 9.0),
+                                                         ("Wine B2", 1, 9.0)]
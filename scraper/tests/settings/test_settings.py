@@ -0,0 +1,63 @@
+"""All unit tests for settings module.
+
+"""
+
+# STANDARD LIB
+import pytest
+
+# PROJECT LIB
+from scraper.settings import settings
+
+
+@pytest.fixture
+def clean_settings(monkeypatch):
+    for name in settings.SETTING_NAMES:
+        monkeypatch.delenv(settings.ENV_PREFIX + name, raising=False)
+    monkeypatch.delenv(settings.ENV_CONFIG, raising=False)
+    settings.reset()
+    yield monkeypatch
+    settings.reset()
+
+
+def write_config(path, data_directory, db_directory):
+    path.write_text('DATA_DIRECTORY = "{}"\nDB_DIRECTORY = "{}"\n'.format(
+        data_directory, db_directory))
+    return str(path)
+
+
+def test_configure_001(clean_settings, tmp_path):
+    config_path = write_config(tmp_path / "config.py", "/data", "/db")
+    settings.configure(config_path=config_path)
+    assert settings.DATA_DIRECTORY == "/data"
+    assert settings.DB_DIRECTORY == "/db"
+
+
+def test_configure_002(clean_settings, tmp_path):
+    config_path = write_config(tmp_path / "config.py", "/data", "/db")
+    clean_settings.setenv(settings.ENV_CONFIG, config_path)
+    clean_settings.setenv("SCRAPER_DB_DIRECTORY", "/env_db")
+    assert settings.DATA_DIRECTORY == "/data"
+    assert settings.DB_DIRECTORY == "/env_db"
+    settings.configure(DB_DIRECTORY="/explicit_db")
+    assert settings.DB_DIRECTORY == "/explicit_db"
+
+
+def test_configure_003(clean_settings, tmp_path):
+    settings.configure(config_path=str(tmp_path / "missing.py"))
+    with pytest.raises(FileNotFoundError):
+        settings.DATA_DIRECTORY
+    # no config file needed when every setting is given
+    settings.configure(DATA_DIRECTORY="/data", DB_DIRECTORY="/db")
+    assert settings.DATA_DIRECTORY == "/data"
+
+
+def test_get_settings_001(clean_settings, tmp_path):
+    path = tmp_path / "config.py"
+    settings.configure(config_path=write_config(path, "/data", "/db"))
+    assert settings.DATA_DIRECTORY == "/data"
+    write_config(path, "/changed", "/db")
+    assert settings.DATA_DIRECTORY == "/data"  # read once, then cached
+    with pytest.raises(ValueError):
+        settings.configure(UNKNOWN="x")
+    with pytest.raises(AttributeError):
+        settings.UNKNOWN
@@ -0,0 +1,176 @@
+"""All unit tests for scraper_async module.
+
+"""
+
+# STANDARD LIB
+import asyncio
+import gzip
+import http.server
+import threading
+import aiohttp
+import pytest
+
+# PROJECT LIB
+from scraper.benchmarks import stub_server
+from scraper.util import scraper_async, scraper_http, scraper_metrics
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    path = str(tmp_path / "cache.db")
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ON,
+                           cache_path=path,
+                           cache_ttl=3600)
+    yield path
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ON, cache_ttl=0)
+    scraper_http._config["cache_path"] = None
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    """Answers with the status in the path, e.g. /404, and an html page."""
+    body = b"<html>error</html>"
+
+    def do_GET(self):
+        self.send_response(int(self.path.strip("/")))
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def status_server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StatusHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class GzipHandler(http.server.BaseHTTPRequestHandler):
+    """Serves a gzip encoded page."""
+    body = gzip.compress(b"<html>" + b"wine " * 1000 + b"</html>")
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gzip_server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), GzipHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def parse_length(html_str, suffix):
+    return len(html_str), suffix
+
+
+def test_get_client_timeout_001():
+    timeout = scraper_async.get_client_timeout((3, 7))
+    assert (timeout.sock_connect, timeout.sock_read) == (3, 7)
+    timeout = scraper_async.get_client_timeout(5)
+    assert (timeout.sock_connect, timeout.sock_read) == (5, 5)
+
+
+def test_async_fetcher_001(cache_path):
+    pages = {"/a": "<html>a</html>", "/b": "<html>b</html>"}
+
+    async def run(base):
+        async with scraper_async.AsyncFetcher() as engine:
+            texts = await asyncio.gather(engine.fetch(base + "a"),
+                                         engine.fetch(base + "b"))
+            async with engine.new_session() as session:
+                texts.append(await engine.fetch(base + "a", session))
+            texts.append(await engine.parse(parse_length, texts[0], "x"))
+        return texts
+
+    with stub_server.serve(pages) as base:
+        texts = asyncio.run(run(base))
+    assert texts == ["<html>a</html>", "<html>b</html>", "<html>a</html>",
+                     (14, "x")]
+    # the third fetch was a fresh cache hit
+    assert scraper_http.get_cache().get(base + "b")["body"] == pages["/b"]
+
+
+def test_async_fetcher_002(cache_path):
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ONLY)
+
+    async def run():
+        async with scraper_async.AsyncFetcher() as engine:
+            return await engine.fetch("http://127.0.0.1:9/missing")
+
+    assert asyncio.run(run()) == ""
+
+
+def test_async_fetcher_003(status_server, cache_path):
+
+    async def run(url):
+        async with scraper_async.AsyncFetcher() as engine:
+            return await engine.fetch(url)
+
+    # error pages raise instead of being parsed as empty pages
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(run(status_server + "403"))
+    _, breaker = scraper_http.get_host_throttle(status_server)
+    assert breaker._failed == 1
+
+
+def test_async_fetcher_004(status_server, cache_path):
+    url = status_server + "200"
+    _, breaker = scraper_http.get_host_throttle(url)
+    breaker.failures, breaker.reset = 1, 0
+    breaker.record_failure()
+
+    async def run():
+        async with scraper_async.AsyncFetcher() as engine:
+            # cancelled during the trial, e.g. past the end of a catalog
+            task = asyncio.ensure_future(engine.fetch(url))
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return await engine.fetch(url)
+
+    assert asyncio.run(run()) == "<html>error</html>"
+
+
+def test_async_fetcher_005(status_server, cache_path):
+
+    async def run(url):
+        async with scraper_async.AsyncFetcher() as engine:
+            return await engine.fetch(url)
+
+    # a page past the end of a catalog is not a failure of the host
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        asyncio.run(run(status_server + "410"))
+    assert scraper_http.get_error_status(error.value) == 410
+    _, breaker = scraper_http.get_host_throttle(status_server)
+    assert breaker._failed == 0
+
+
+def test_async_fetcher_006(gzip_server, cache_path):
+
+    async def run():
+        async with scraper_async.AsyncFetcher() as engine:
+            return await engine.fetch(gzip_server)
+
+    # fetch_bytes counts the bytes sent, not the decompressed page
+    scraper_metrics.reset()
+    assert len(asyncio.run(run())) > len(GzipHandler.body)
+    assert [
+        r["TOTAL"] for r in scraper_metrics.get_rows()
+        if r["NAME"] == "fetch_bytes"
+    ] == [len(GzipHandler.body)]
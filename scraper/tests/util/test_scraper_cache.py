@@ -0,0 +1,48 @@
+"""All unit tests for scraper_cache module.
+
+"""
+
+# PROJECT LIB
+from scraper.util import scraper_cache
+
+
+def test_http_cache_get_001(tmp_path):
+    cache = scraper_cache.HttpCache(str(tmp_path / "cache.db"))
+    assert cache.get("http://x/1") is None
+
+
+def test_http_cache_get_002(tmp_path):
+    cache = scraper_cache.HttpCache(str(tmp_path / "cache.db"), ttl=3600)
+    cache.put("http://x/1", "<html>1</html>", etag='"abc"')
+    entry = cache.get("http://x/1")
+    assert entry["body"] == "<html>1</html>"
+    assert entry["etag"] == '"abc"'
+    assert entry["last_modified"] is None
+    assert entry["is_fresh"]
+
+
+def test_http_cache_get_003(tmp_path):
+    cache = scraper_cache.HttpCache(str(tmp_path / "cache.db"), ttl=0)
+    cache.put("http://x/1", "<html>1</html>")
+    assert not cache.get("http://x/1")["is_fresh"]
+
+
+def test_http_cache_put_001(tmp_path):
+    # entries survive reopening the cache file
+    path = str(tmp_path / "cache.db")
+    scraper_cache.HttpCache(path).put("http://x/1", "body")
+    assert scraper_cache.HttpCache(path).get("http://x/1")["body"] == "body"
+
+
+def test_http_cache_put_002(tmp_path):
+    # least recently used entry is evicted once over budget
+    body = "".join(str(i) for i in range(2000))  # poorly compressible
+    cache = scraper_cache.HttpCache(str(tmp_path / "cache.db"))
+    cache.put("http://x/1", body)
+    cache.max_bytes = 2 * cache._total
+    cache.put("http://x/2", body)
+    cache.get("http://x/1")
+    cache.put("http://x/3", body)
+    assert cache.get("http://x/1") is not None
+    assert cache.get("http://x/2") is None
+    assert cache.get("http://x/3") is not None
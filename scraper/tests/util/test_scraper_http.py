@@ -0,0 +1,226 @@
+"""All unit tests for scraper_http module.
+
+"""
+
+# STANDARD LIB
+import gzip
+import http.server
+import threading
+import pytest
+
+# PROJECT LIB
+from scraper.util import scraper_http, scraper_metrics, scraper_throttle
+
+DEFAULT_BREAKER_FAILURES = scraper_throttle.DEFAULT_BREAKER_FAILURES
+DEFAULT_BREAKER_RESET = scraper_throttle.DEFAULT_BREAKER_RESET
+
+
+class EtagHandler(http.server.BaseHTTPRequestHandler):
+    """Serves one fixed page and answers 304 to a matching ETag."""
+    body = b"<html>page</html>"
+    etag = '"v1"'
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    """Answers 503 with a Retry-After until failures run out."""
+    failures = 0
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    """Answers with the status in the path, e.g. /404, and an html page."""
+    body = b"<html>error</html>"
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        self.send_response(int(self.path.strip("/")))
+        self.send_header("Location", self.path)  # 3xx loop to itself
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GzipHandler(http.server.BaseHTTPRequestHandler):
+    """Serves a gzip encoded page."""
+    body = gzip.compress(b"<html>" + b"wine " * 1000 + b"</html>")
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    EtagHandler.hits = []
+    yield from serve(EtagHandler)
+
+
+@pytest.fixture
+def flaky_server():
+    FlakyHandler.hits = 0
+    yield from serve(FlakyHandler)
+
+
+@pytest.fixture
+def status_server():
+    StatusHandler.hits = 0
+    yield from serve(StatusHandler)
+
+
+@pytest.fixture
+def gzip_server():
+    yield from serve(GzipHandler)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    path = str(tmp_path / "cache.db")
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ON,
+                           cache_path=path,
+                           cache_ttl=0)
+    yield path
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ON,
+                           cache_ttl=0,
+                           max_retries=scraper_http.MAX_RETRIES,
+                           backoff_base=scraper_throttle.DEFAULT_BACKOFF_BASE,
+                           breaker_failures=DEFAULT_BREAKER_FAILURES,
+                           breaker_reset=DEFAULT_BREAKER_RESET)
+    scraper_http._config["cache_path"] = None
+
+
+def test_fetch_001(server, cache_path):
+    assert scraper_http.fetch(server) == "<html>page</html>"
+    # second fetch revalidates and is answered from the cache on 304
+    assert scraper_http.fetch(server) == "<html>page</html>"
+    assert EtagHandler.hits == [None, '"v1"']
+
+
+def test_fetch_002(server, cache_path):
+    scraper_http.fetch(server)
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ONLY)
+    assert scraper_http.fetch(server) == "<html>page</html>"
+    assert scraper_http.fetch(server + "missing") == ""
+    assert len(EtagHandler.hits) == 1
+
+
+def test_configure_001():
+    with pytest.raises(ValueError):
+        scraper_http.configure(cache_mode="sometimes")
+
+
+def test_fetch_003(flaky_server, cache_path):
+    scraper_http.configure(cache_mode=scraper_http.CACHE_OFF,
+                           backoff_base=0.01)
+    FlakyHandler.failures = 2
+    assert scraper_http.fetch(flaky_server) == "ok"
+    assert FlakyHandler.hits == 3
+
+    FlakyHandler.hits = 0
+    FlakyHandler.failures = 5
+    scraper_http.configure(max_retries=1)
+    with pytest.raises(scraper_http.requests.HTTPError):
+        scraper_http.fetch(flaky_server)
+    assert FlakyHandler.hits == 2
+
+
+def test_fetch_004(status_server, cache_path):
+    # error pages raise instead of being parsed as empty pages
+    with pytest.raises(scraper_http.requests.HTTPError):
+        scraper_http.fetch(status_server + "404")
+    assert scraper_http.get_cache().get(status_server + "404") is None
+
+
+def test_send_001(status_server, cache_path):
+    # a block page is not retried and counts towards the breaker
+    url = status_server + "403"
+    with pytest.raises(scraper_http.requests.HTTPError):
+        scraper_http.send(scraper_http.get_session(), url, {}, 5)
+    assert StatusHandler.hits == 1
+    _, breaker = scraper_http.get_host_throttle(url)
+    assert breaker._failed == 1
+
+
+def test_send_002(status_server, cache_path):
+    scraper_http.configure(breaker_failures=1, breaker_reset=0)
+    url = status_server + "302"
+    _, breaker = scraper_http.get_host_throttle(url)
+    breaker.record_failure()
+    # a trial request that raises does not leave the circuit stuck open
+    with pytest.raises(scraper_http.requests.TooManyRedirects):
+        scraper_http.send(scraper_http.get_session(), url, {}, 5)
+    assert scraper_http.send(scraper_http.get_session(), status_server + "200",
+                             {}, 5).status_code == 200
+
+
+def test_send_003(status_server, cache_path):
+    # a page past the end of a catalog is not a failure of the host
+    url = status_server + "404"
+    with pytest.raises(scraper_http.requests.HTTPError) as error:
+        scraper_http.send(scraper_http.get_session(), url, {}, 5)
+    assert scraper_http.get_error_status(error.value) == 404
+    _, breaker = scraper_http.get_host_throttle(url)
+    assert breaker._failed == 0
+
+
+def test_send_004(gzip_server, cache_path):
+    # fetch_bytes counts the bytes sent, not the decompressed page
+    scraper_metrics.reset()
+    response = scraper_http.send(scraper_http.get_session(), gzip_server, {},
+                                 5)
+    assert len(response.content) > len(GzipHandler.body)
+    assert [
+        r["TOTAL"] for r in scraper_metrics.get_rows()
+        if r["NAME"] == "fetch_bytes"
+    ] == [len(GzipHandler.body)]
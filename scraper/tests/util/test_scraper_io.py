@@ -4,12 +4,13 @@
 
 # STANDARD LIB
 import os
+import sqlite3
 import pandas as pd
 import pytest
 
 # PROJECT LIB
 from scraper.settings import settings
-from scraper.util import scraper_io
+from scraper.util import scraper_io, scraper_metrics
 
 
 def test_to_sqlite_db_001():
@@ -29,3 +30,314 @@ def test_to_sqlite_db_003():
     df = pd.DataFrame({"A": ["x", "y", "z"], "B": [4, 5, 6]})
     scraper_io.to_sqlite_db(df, "TEST_TABLE",
                             os.path.join(settings.DB_DIRECTORY, "test_db.db"))
+
+
+def test_sqlite_writer_001(tmp_path):
+    db_path = str(tmp_path / "test_db.db")
+    df = pd.DataFrame({
+        "A": [1, 2],
+        "B": [1.5, None],
+        "C": ["x", None],
+        "D": [True, False],
+        "E": pd.to_datetime(["2020-01-01", "2020-01-02"]),
+    })
+    with scraper_io.SqliteWriter(db_path) as writer:
+        writer.write(df, "TEST_TABLE")
+        writer.write(df, "TEST_TABLE")
+    res = pd.read_sql("SELECT * FROM TEST_TABLE", sqlite3.connect(db_path))
+    assert len(res) == 4
+    assert res["B"].isnull().tolist() == [False, True] * 2
+    assert res["C"].isnull().tolist() == [False, True] * 2
+    assert res["D"].tolist() == [1, 0] * 2
+    assert res["E"].iloc[0] == "2020-01-01 00:00:00.000000"
+
+
+def test_sqlite_writer_002(tmp_path):
+    # a failed write keeps none of its rows
+    db_path = str(tmp_path / "test_db.db")
+    with scraper_io.SqliteWriter(db_path) as writer:
+        writer.write(pd.DataFrame({"A": [1]}), "TEST_TABLE")
+        with pytest.raises(sqlite3.OperationalError):
+            writer.write(pd.DataFrame({"A": [2], "C": [3]}), "TEST_TABLE")
+        writer.write(pd.DataFrame({"A": [4]}), "TEST_TABLE")
+    res = pd.read_sql("SELECT * FROM TEST_TABLE", sqlite3.connect(db_path))
+    assert res["A"].tolist() == [1, 4]
+
+
+def test_sqlite_writer_003(tmp_path):
+    # nothing is kept if the run fails before committing
+    db_path = str(tmp_path / "test_db.db")
+    with pytest.raises(RuntimeError):
+        with scraper_io.SqliteWriter(db_path) as writer:
+            writer.write(pd.DataFrame({"A": [1]}), "TEST_TABLE")
+            raise RuntimeError()
+    cnx = sqlite3.connect(db_path)
+    assert not cnx.execute("SELECT * FROM sqlite_master").fetchall()
+
+
+def make_wine_batch(run_id, names, prices):
+    return pd.DataFrame({
+        "RUN_ID": run_id,
+        "NAME": names,
+        "PRICE": prices,
+        "BASE_PRICE": 20.0,
+        "IS_ON_SALE": [p < 20.0 for p in prices],
+        "SRC": "https://www.example.com/",
+        "QUERY": "https://www.example.com/wines/?page=1",
+        "AS_OF_DATE": pd.Timestamp("2020-01-01"),
+    })
+
+
+def test_sqlite_writer_004(tmp_path):
+    # float32 prices are stored as the decimal they print as
+    db_path = str(tmp_path / "test_db.db")
+    df = pd.DataFrame({"P": pd.Series([12.99, 1299.99, None],
+                                      dtype="float32")})
+    with scraper_io.SqliteWriter(db_path) as writer:
+        writer.write(df, "TEST_TABLE")
+    res = sqlite3.connect(db_path).execute("SELECT P FROM TEST_TABLE")
+    assert res.fetchall() == [(12.99, ), (1299.99, ), (None, )]
+
+
+def test_normalize_names_001():
+    s = pd.Series(["  Chateau  Margaux 2015", "chateau margaux\t2015 "])
+    assert scraper_io.normalize_names(s).tolist() == [
+        "chateau margaux 2015"
+    ] * 2
+    assert scraper_io.normalize_name(s.iloc[0]) == "chateau margaux 2015"
+
+
+def test_wine_db_writer_001(tmp_path):
+    db_path = str(tmp_path / "wine_db.db")
+    with scraper_io.WineDbWriter(db_path) as writer:
+        for run_id in [1, 2]:
+            writer.start_run(run_id)
+            writer.write_observations(
+                make_wine_batch(run_id, ["Wine A", "wine  a", "Wine B"],
+                                [10.0, 11.0, 20.0]))
+    cnx = sqlite3.connect(db_path)
+    assert cnx.execute("SELECT COUNT(*) FROM product").fetchone()[0] == 2
+    assert cnx.execute("SELECT COUNT(*) FROM run").fetchone()[0] == 2
+    res = pd.read_sql("SELECT * FROM wine_flat ORDER BY RUN_ID, PRICE", cnx)
+    assert len(res) == 4
+    assert res["PRICE"].tolist() == [11.0, 20.0] * 2
+
+
+def test_wine_db_writer_002(tmp_path):
+    db_path = str(tmp_path / "wine_db.db")
+    flat = pd.concat([
+        make_wine_batch(1, ["Wine A", "Wine B"], [10.0, 20.0]),
+        make_wine_batch(2, ["Wine A"], [15.0]),
+    ])
+    scraper_io.to_sqlite_db(flat, "wine", db_path)
+    with scraper_io.WineDbWriter(db_path) as writer:
+        writer.import_flat_table("wine")
+    cnx = sqlite3.connect(db_path)
+    res = pd.read_sql("SELECT * FROM wine_flat ORDER BY RUN_ID, NAME", cnx)
+    assert res["PRICE"].tolist() == [10.0, 20.0, 15.0]
+    row = cnx.execute("SELECT FIRST_RUN_ID, LAST_RUN_ID FROM product "
+                      "WHERE NAME_KEY = 'wine a'").fetchone()
+    assert row == (1, 2)
+
+
+def test_wine_db_writer_003(tmp_path):
+    db_path = str(tmp_path / "wine_db.db")
+    runs = {
+        1: (["Wine A", "Wine B", "Wine C"], [10.0, 20.0, 30.0]),
+        2: (["Wine A", "Wine B", "Wine C"], [10.0, 18.0, 30.0]),
+        3: (["Wine A", "Wine B"], [10.0, 18.0]),
+    }
+    with scraper_io.WineDbWriter(
+            db_path, write_mode=scraper_io.WRITE_DELTA) as writer:
+        for run_id, (names, prices) in runs.items():
+            writer.start_run(run_id)
+            writer.write_batch(make_wine_batch(run_id, names, prices))
+            writer.close_missing("https://www.example.com/", run_id)
+    cnx = sqlite3.connect(db_path)
+    assert cnx.execute(
+        "SELECT COUNT(*) FROM price_observation").fetchone()[0] == 0
+    res = pd.read_sql(
+        "SELECT p.NAME, i.VALID_FROM_RUN_ID, i.VALID_TO_RUN_ID, "
+        "i.LAST_SEEN_RUN_ID, i.PRICE FROM price_interval i "
+        "JOIN product p USING (PRODUCT_ID) "
+        "ORDER BY p.NAME, i.VALID_FROM_RUN_ID", cnx)
+    assert res["NAME"].tolist() == ["Wine A", "Wine B", "Wine B", "Wine C"]
+    assert res["VALID_FROM_RUN_ID"].tolist() == [1, 1, 2, 1]
+    assert res["VALID_TO_RUN_ID"].fillna(0).tolist() == [0, 2, 0, 3]
+    assert res["LAST_SEEN_RUN_ID"].tolist() == [3, 1, 3, 2]
+    current = pd.read_sql(
+        "SELECT NAME, PRICE FROM current_price ORDER BY NAME", cnx)
+    assert current.values.tolist() == [["Wine A", 10.0], ["Wine B", 18.0]]
+
+
+def test_wine_db_writer_004(tmp_path):
+    with pytest.raises(ValueError):
+        scraper_io.WineDbWriter(str(tmp_path / "wine_db.db"),
+                                write_mode="nope")
+
+
+def test_get_site_001():
+    assert scraper_io.get_site("https://www.garyswine.com/") == "garyswine.com"
+    assert scraper_io.get_site("https://winelibrary.com/") == "winelibrary.com"
+
+
+def test_to_parquet_batches_001(tmp_path):
+    root = str(tmp_path / "wine_parquet")
+    batches = [make_wine_batch(1, ["Wine A", "Wine B"], [10.0, 20.0])] * 3
+    scraper_io.to_parquet_batches(batches, root, file_rows=4)
+    files = list((tmp_path / "wine_parquet" / "SITE=example.com" /
+                  "RUN_DATE=2020-01-01").glob("*.parquet"))
+    assert len(files) == 2
+    res = scraper_io.read_parquet(root)
+    assert len(res) == 6
+    assert res["IS_ON_SALE"].dtype == bool
+    assert pd.api.types.is_datetime64_any_dtype(res["AS_OF_DATE"])
+    assert isinstance(res["SRC"].dtype, pd.CategoricalDtype)
+
+
+def test_to_parquet_001(tmp_path):
+    root = str(tmp_path / "wine_parquet")
+    df = make_wine_batch(1, ["Wine A"], [12.99])
+    df = df.astype({"PRICE": "float32", "BASE_PRICE": "float32",
+                    "QUERY": "category"})
+    scraper_io.to_parquet(df, root)
+    res = scraper_io.read_parquet(root)
+    assert res["PRICE"].dtype == "float64"
+    assert res["PRICE"].tolist() == [12.99]
+
+
+def test_read_parquet_001(tmp_path):
+    root = str(tmp_path / "wine_parquet")
+    old = make_wine_batch(1, ["Wine A"], [10.0])
+    new = make_wine_batch(2, ["Wine A", "Wine B"], [12.0, 20.0])
+    new["AS_OF_DATE"] = pd.Timestamp("2020-01-02")
+    scraper_io.to_parquet(old, root)
+    scraper_io.to_parquet(new, root)
+    res = scraper_io.read_parquet(root,
+                                  columns=["NAME", "PRICE"],
+                                  sites=["example.com"],
+                                  start_date="2020-01-02")
+    assert res.columns.tolist() == ["NAME", "PRICE"]
+    assert res["PRICE"].tolist() == [12.0, 20.0]
+    assert scraper_io.read_parquet(root, sites=["other.com"]).empty
+
+
+def test_wine_db_writer_005(tmp_path):
+    db_path = str(tmp_path / "wine_db.db")
+    with scraper_io.WineDbWriter(db_path, commit_rows=1) as writer:
+        writer.start_run(1)
+        writer.write_batch(make_wine_batch(1, ["Wine A"], [10.0]),
+                           "example", "1")
+        writer.write_batch(make_wine_batch(1, ["Wine B"], [20.0]),
+                           "example", "2")
+        bad = make_wine_batch(1, ["Wine C"], [30.0])
+        bad["PRICE"] = [object()]
+        with pytest.raises(sqlite3.Error):
+            # the page, its product and its checkpoint are rolled back
+            writer.write_batch(bad, "example", "3")
+        assert writer.get_completed_pages(1) == {"example": {"1", "2"}}
+        assert writer.get_completed_pages(2) == {}
+    cnx = sqlite3.connect(db_path)
+    assert cnx.execute("SELECT COUNT(*) FROM product").fetchone()[0] == 2
+
+
+def test_wine_db_writer_006(tmp_path):
+    db_path = str(tmp_path / "wine_db.db")
+    rows = [{
+        "SITE": "garyswine.com",
+        "NAME": "fetch_seconds",
+        "KIND": "timer",
+        "N": 2,
+        "TOTAL": 0.5,
+        "P50": 0.25,
+        "P90": 0.3,
+        "P99": 0.3,
+        "MAX": 0.3
+    }]
+    with scraper_io.WineDbWriter(db_path) as writer:
+        writer.write_metrics(1, rows)
+        writer.write_metrics(1, rows)  # rewriting a run replaces it
+    cnx = sqlite3.connect(db_path)
+    assert cnx.execute("SELECT RUN_ID, SITE, NAME, N, TOTAL "
+                       "FROM run_metric").fetchall() == [
+                           (1, "garyswine.com", "fetch_seconds", 2, 0.5)
+                       ]
+
+
+@pytest.mark.parametrize("write_mode", scraper_io.WRITE_MODES)
+def test_wine_db_writer_007(tmp_path, write_mode):
+    db_path = str(tmp_path / "wine_db.db")
+    runs = {
+        1: (["Wine A", "Wine B"], [10.0, 20.0]),
+        2: (["Wine A", "Wine B"], [10.0, 15.0]),
+    }
+    with scraper_io.WineDbWriter(db_path, write_mode=write_mode) as writer:
+        for run_id, (names, prices) in runs.items():
+            writer.start_run(run_id)
+            writer.write_batch(make_wine_batch(run_id, names, prices))
+            writer.complete_retailer("https://www.example.com/", run_id)
+        assert writer.refresh_aggregates() == [1, 2]
+        assert writer.refresh_aggregates() == []
+        # refreshing a run again keeps the price seen before it
+        assert writer.refresh_aggregates([2]) == [2]
+    cnx = sqlite3.connect(db_path)
+    assert cnx.execute("SELECT SRC, RUN_ID, N_PRODUCTS, N_ON_SALE "
+                       "FROM retailer_run_stats ORDER BY RUN_ID").fetchall() == [
+                           ("https://www.example.com/", 1, 2, 1),
+                           ("https://www.example.com/", 2, 2, 2)
+                       ]
+    res = pd.read_sql(
+        "SELECT p.NAME, l.RUN_ID, l.PRICE, l.PREV_PRICE, l.DISCOUNT_PCT "
+        "FROM product_latest l JOIN product p USING (PRODUCT_ID) "
+        "ORDER BY p.NAME", cnx)
+    assert res["RUN_ID"].tolist() == [2, 2]
+    assert res["PRICE"].tolist() == [10.0, 15.0]
+    assert res["PREV_PRICE"].tolist() == [10.0, 20.0]
+    assert res["DISCOUNT_PCT"].tolist() == [50.0, 25.0]
+    assert cnx.execute("SELECT COUNT(*) FROM wine_price").fetchone()[0] == 2
+
+
+@pytest.mark.parametrize("write_mode", scraper_io.WRITE_MODES)
+def test_wine_db_writer_008(tmp_path, write_mode):
+    db_path = str(tmp_path / "wine_db.db")
+    src = "https://www.example.com/"
+    scraper_metrics.reset()
+    with scraper_io.WineDbWriter(db_path, write_mode=write_mode) as writer:
+        writer.start_run(1)
+        # same name within the batch, then within the run
+        writer.write_batch(
+            make_wine_batch(1, ["Wine A", "wine  a", "Wine B"],
+                            [10.0, 11.0, 20.0]))
+        assert writer.count_collapsed([src] * 2, ["wine b", "wine c"], 1) == 1
+        writer.write_batch(make_wine_batch(1, ["Wine B", "Wine C"],
+                                           [20.0, 30.0]))
+        # a product seen by an earlier run is not collapsed
+        writer.start_run(2)
+        assert writer.count_collapsed([src] * 2, ["wine a", "wine d"], 2) == 0
+    collapsed = [
+        r["TOTAL"] for r in scraper_metrics.get_rows()
+        if r["NAME"] == "rows_collapsed"
+    ]
+    assert collapsed == [2]
+
+
+@pytest.mark.parametrize("write_mode", scraper_io.WRITE_MODES)
+def test_wine_db_writer_009(tmp_path, write_mode):
+    # run 2 fails after its first page, run 1 stays the latest
+    db_path = str(tmp_path / "wine_db.db")
+    src = "https://www.example.com/"
+    with scraper_io.WineDbWriter(db_path, write_mode=write_mode) as writer:
+        writer.start_run(1)
+        writer.write_batch(make_wine_batch(1, ["Wine A", "Wine B"],
+                                           [10.0, 20.0]))
+        writer.complete_retailer(src, 1)
+        writer.start_run(2)
+        writer.write_batch(make_wine_batch(2, ["Wine A"], [9.0]))
+        assert writer.refresh_aggregates() == [1, 2]
+    cnx = sqlite3.connect(db_path)
+    assert cnx.execute("SELECT SRC, RUN_ID FROM retailer_latest_run"
+                       ).fetchall() == [(src, 1)]
+    assert cnx.execute("SELECT RUN_ID, PRICE FROM product_latest "
+                       "ORDER BY PRODUCT_ID").fetchall() == [(1, 10.0),
+                                                            (1, 20.0)]
+    assert cnx.execute("SELECT COUNT(*) FROM wine_price").fetchone()[0] == 2
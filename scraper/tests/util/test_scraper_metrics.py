@@ -0,0 +1,89 @@
+"""All unit tests for scraper_metrics module.
+
+"""
+
+# STANDARD LIB
+import pytest
+
+# PROJECT LIB
+from scraper.util import scraper_metrics
+
+HTML = "https://www.garyswine.com/"
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    scraper_metrics.reset()
+    yield
+    scraper_metrics.reset()
+
+
+def test_get_site_001():
+    assert scraper_metrics.get_site(HTML + "wines/?page=1") == "garyswine.com"
+    assert scraper_metrics.get_site("https://winelibrary.com/") == (
+        "winelibrary.com")
+    assert scraper_metrics.get_site("") == ""
+
+
+def test_get_rows_001():
+    scraper_metrics.inc("rows_parsed", 3, HTML)
+    scraper_metrics.inc("rows_parsed", 4, HTML + "wines/")
+    for seconds in [0.1, 0.2, 0.3, 0.4]:
+        scraper_metrics.observe("fetch_seconds", seconds, HTML)
+    with scraper_metrics.timer("write_seconds"):
+        pass
+
+    rows = {(r["SITE"], r["NAME"]): r for r in scraper_metrics.get_rows()}
+    assert set(rows) == {("garyswine.com", "rows_parsed"),
+                         ("garyswine.com", "fetch_seconds"),
+                         ("", "write_seconds")}
+    counter = rows["garyswine.com", "rows_parsed"]
+    assert (counter["N"], counter["TOTAL"], counter["P50"]) == (2, 7, None)
+    fetch = rows["garyswine.com", "fetch_seconds"]
+    assert fetch["N"] == 4
+    assert fetch["TOTAL"] == pytest.approx(1.0)
+    assert fetch["P50"] == pytest.approx(0.25)
+    assert fetch["MAX"] == pytest.approx(0.4)
+
+
+def test_merge_001():
+    scraper_metrics.inc("rows_dropped", 2, HTML)
+    recorded = scraper_metrics.collect()
+    scraper_metrics.merge(recorded)
+    row, = scraper_metrics.get_rows()
+    assert (row["N"], row["TOTAL"]) == (2, 4)
+
+
+def test_to_prometheus_001():
+    scraper_metrics.inc("fetch_bytes", 100, HTML)
+    scraper_metrics.inc("fetch_bytes", 50, "https://winelibrary.com/")
+    scraper_metrics.observe("fetch_seconds", 0.5, HTML)
+    text = scraper_metrics.to_prometheus(scraper_metrics.get_rows(), 7)
+    lines = text.splitlines()
+    assert lines[:3] == [
+        "# TYPE scraper_fetch_bytes_total counter",
+        'scraper_fetch_bytes_total{site="garyswine.com",run_id="7"} 100.0',
+        'scraper_fetch_bytes_total{site="winelibrary.com",run_id="7"} 50.0',
+    ]
+    assert "# TYPE scraper_fetch_seconds summary" in lines
+    assert ('scraper_fetch_seconds{site="garyswine.com",run_id="7",'
+            'quantile="0.99"} 0.5') in lines
+    assert 'scraper_fetch_seconds_count{site="garyswine.com",run_id="7"} 1' in lines
+
+
+def test_format_summary_001():
+    scraper_metrics.observe("fetch_seconds", 0.5, HTML)
+    scraper_metrics.observe("parse_seconds", 2.0, HTML)
+    lines = scraper_metrics.format_summary(
+        scraper_metrics.get_rows()).splitlines()
+    assert len(lines) == 3
+    assert "parse_seconds" in lines[1]  # slowest stage first
+
+
+def test_format_memory_001():
+    scraper_metrics.inc("frame_bytes_plain", 4 * 2**20, HTML)
+    scraper_metrics.inc("frame_bytes", 2**20, HTML)
+    scraper_metrics.inc("rows_parsed", 40, HTML)
+    lines = scraper_metrics.format_memory(
+        scraper_metrics.get_rows()).splitlines()
+    assert lines[1].split() == ["garyswine.com", "40", "4.00", "1.00", "75%"]
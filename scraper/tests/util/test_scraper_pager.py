@@ -0,0 +1,205 @@
+"""All unit tests for scraper_pager module.
+
+"""
+
+# STANDARD LIB
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+import time
+import pandas as pd
+import pytest
+import requests
+
+# PROJECT LIB
+from scraper.util import scraper_pager
+
+
+def make_query_fn(last_page, queried=None):
+    lock = threading.Lock()
+
+    def query_fn(page_num):
+        if queried is not None:
+            with lock:
+                queried.append(page_num)
+        if page_num > last_page:
+            return pd.DataFrame()
+        return pd.DataFrame({"PAGE": [page_num]})
+
+    return query_fn
+
+
+def make_missing_fn(last_page, status=404):
+    """Query fn answering status past last_page, like a site paged by number."""
+
+    def query_fn(page_num):
+        if page_num > last_page:
+            response = requests.Response()
+            response.status_code = status
+            raise requests.HTTPError(response=response)
+        return pd.DataFrame({"PAGE": [page_num]})
+
+    return query_fn
+
+
+def test_query_pages_001():
+    all_dfs = scraper_pager.query_pages(make_query_fn(10), itertools.count(1))
+    assert [df["PAGE"].iloc[0] for df in all_dfs] == list(range(1, 11))
+
+
+def test_query_pages_002():
+    all_dfs = scraper_pager.query_pages(make_query_fn(10),
+                                        itertools.count(1),
+                                        window=1)
+    assert [df["PAGE"].iloc[0] for df in all_dfs] == list(range(1, 11))
+
+
+def test_query_pages_003():
+    assert not scraper_pager.query_pages(make_query_fn(0), itertools.count(1))
+
+
+def test_query_pages_004():
+    # never more than window - 1 requests past the last page
+    queried = []
+    scraper_pager.query_pages(make_query_fn(10, queried),
+                              itertools.count(1),
+                              window=4)
+    assert max(queried) <= 10 + 4
+
+
+def test_query_pages_005():
+    all_dfs = scraper_pager.query_pages(make_query_fn(10), [1, 2, 3])
+    assert len(all_dfs) == 3
+
+
+def test_iter_keyed_pages_001():
+    for window in [1, 4]:
+        keys = (n for n in itertools.count(1) if n not in {2, 3})
+        pages = list(
+            scraper_pager.iter_keyed_pages(make_query_fn(5), keys, window))
+        assert [key for key, _ in pages] == [1, 4, 5]
+        assert [df["PAGE"].iloc[0] for _, df in pages] == [1, 4, 5]
+
+
+def test_iter_keyed_pages_002():
+    # a 404 or 410 past the last page ends the catalog
+    for window in [1, 4]:
+        for status in [404, 410]:
+            pages = list(
+                scraper_pager.iter_keyed_pages(make_missing_fn(3, status),
+                                               itertools.count(1), window))
+            assert [key for key, _ in pages] == [1, 2, 3]
+
+
+def test_iter_keyed_pages_003():
+    # a missing first page and other errors still raise
+    for window in [1, 4]:
+        with pytest.raises(requests.HTTPError):
+            list(
+                scraper_pager.iter_keyed_pages(make_missing_fn(0),
+                                               itertools.count(1), window))
+        with pytest.raises(requests.HTTPError):
+            list(
+                scraper_pager.iter_keyed_pages(make_missing_fn(3, 403),
+                                               itertools.count(1), window))
+
+
+def test_iter_keyed_pages_004():
+    # pages still being parsed are resolved in key order
+    query_fn = make_query_fn(5)
+    with concurrent.futures.ThreadPoolExecutor(4) as parser:
+
+        def submit_fn(page_num):
+            return parser.submit(query_fn, page_num)
+
+        for window in [1, 4]:
+            pages = list(
+                scraper_pager.iter_keyed_pages(submit_fn, itertools.count(1),
+                                               window))
+            assert [df["PAGE"].iloc[0] for _, df in pages] == [1, 2, 3, 4, 5]
+
+
+def test_iter_keyed_pages_005():
+    # later pages are fetched while the oldest one is still parsing
+    queried = []
+    query_fn = make_query_fn(8, queried)
+    first_page = concurrent.futures.Future()
+
+    def submit_fn(page_num):
+        return first_page if page_num == 1 else query_fn(page_num)
+
+    def parse_first_page():
+        deadline = time.monotonic() + 2
+        while len(queried) < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        first_page.set_result(query_fn(1))
+
+    thread = threading.Thread(target=parse_first_page)
+    thread.start()
+    pages = list(
+        scraper_pager.iter_keyed_pages(submit_fn, itertools.count(1), 2))
+    thread.join()
+    assert [key for key, _ in pages] == list(range(1, 9))
+    assert sorted(queried[:3]) == [2, 3, 4]
+
+
+def test_iter_keyed_pages_async_001():
+    queried = []
+    query_fn = make_query_fn(10, queried)
+
+    async def query_async(page_num):
+        await asyncio.sleep(0.001 * (page_num % 3))  # finish out of order
+        return query_fn(page_num)
+
+    async def collect():
+        return [(key, df["PAGE"].iloc[0])
+                async for key, df in scraper_pager.iter_keyed_pages_async(
+                    query_async, itertools.count(1), window=4)]
+
+    assert asyncio.run(collect()) == [(n, n) for n in range(1, 11)]
+    assert max(queried) <= 10 + 4
+
+
+def test_iter_keyed_pages_async_002():
+    query_fn = make_missing_fn(3, 410)
+
+    async def query_async(page_num):
+        return query_fn(page_num)
+
+    async def collect():
+        return [key async for key, _ in scraper_pager.iter_keyed_pages_async(
+            query_async, itertools.count(1), window=4)]
+
+    assert asyncio.run(collect()) == [1, 2, 3]
+
+
+def test_iter_merged_001():
+    items = list(scraper_pager.iter_merged([range(0, 5), range(10, 13), []],
+                                           max_workers=2))
+    assert sorted(items) == [0, 1, 2, 3, 4, 10, 11, 12]
+    assert [i for i in items if i < 10] == [0, 1, 2, 3, 4]
+
+
+def test_iter_merged_002():
+
+    def failing():
+        yield 1
+        raise ValueError("page failed")
+
+    with pytest.raises(ValueError):
+        list(scraper_pager.iter_merged([failing(), itertools.count()], 2))
+
+
+def test_iter_merged_async_001():
+
+    async def agen(start, n):
+        for i in range(start, start + n):
+            await asyncio.sleep(0)
+            yield i
+
+    async def collect():
+        return [i async for i in scraper_pager.iter_merged_async(
+            [agen(0, 3), agen(10, 2)])]
+
+    assert sorted(asyncio.run(collect())) == [0, 1, 2, 10, 11]
@@ -0,0 +1,60 @@
+"""All unit tests for scraper_parse module.
+
+"""
+
+# STANDARD LIB
+import concurrent.futures
+import pytest
+
+# PROJECT LIB
+from scraper.util import scraper_parse
+from scraper.web_scraper.wine_scraper import parsing
+
+HTML_STR = ("<table><tr><td>a</td><td>$1.00</td></tr>"
+            "<tr><td>b</td><td>$2.00</td></tr></table>")
+
+
+@pytest.fixture
+def parse_workers():
+    yield scraper_parse.configure
+    scraper_parse.configure(workers=scraper_parse.DEFAULT_WORKERS)
+
+
+def test_parse_001():
+    assert scraper_parse.get_pool() == (None, None)
+    assert scraper_parse.parse(parsing.get_cell_texts, HTML_STR,
+                               1) == ["$1.00", "$2.00"]
+
+
+def test_parse_002(parse_workers):
+    parse_workers(workers=2, max_pending=3)
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(
+                lambda column: scraper_parse.parse(parsing.get_cell_texts,
+                                                   HTML_STR, column % 2),
+                range(8)))
+    assert results == [["a", "b"], ["$1.00", "$2.00"]] * 4
+    _, slots = scraper_parse.get_pool()
+    assert all(slots.acquire(blocking=False) for _ in range(3))
+    assert not slots.acquire(blocking=False)
+
+
+def test_submit_001(parse_workers):
+    parse_workers(workers=2, max_pending=2)
+    # fetching threads get futures back and move on, results keep order
+    futures = [
+        scraper_parse.submit(parsing.get_cell_texts, HTML_STR, column % 2)
+        for column in range(6)
+    ]
+    assert [f.result() for f in futures] == [["a", "b"], ["$1.00", "$2.00"]
+                                             ] * 3
+    # errors of the worker are raised when the future is resolved
+    future = scraper_parse.submit(parsing.get_cell_texts, HTML_STR, "x")
+    with pytest.raises(TypeError):
+        future.result()
+
+
+def test_configure_001():
+    with pytest.raises(ValueError):
+        scraper_parse.configure(workers=-1)
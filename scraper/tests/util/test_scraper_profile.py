@@ -0,0 +1,74 @@
+"""All unit tests for scraper_profile module.
+
+"""
+
+# STANDARD LIB
+import concurrent.futures
+import os
+import pstats
+import threading
+
+# PROJECT LIB
+from scraper.util import scraper_profile
+
+
+def busy_in_thread(n):
+    return sum(i * i for i in range(n))
+
+
+def allocate():
+    return [str(i) for i in range(10000)]
+
+
+def get_function_names(stats):
+    return {func for _, _, func in stats.stats}
+
+
+def test_profile_threads_001():
+    with scraper_profile.profile_threads() as thread_stats:
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            list(executor.map(busy_in_thread, [1000, 1000]))
+        assert thread_stats == []
+    if scraper_profile.PER_THREAD_PROFILERS:
+        assert len(thread_stats) >= 2  # the calling thread and the workers
+    stats = scraper_profile.get_stats(thread_stats)
+    assert "busy_in_thread" in get_function_names(stats)
+
+
+def test_profile_threads_002():
+    stop = threading.Event()
+
+    def work_after_stop():
+        stop.wait()
+        busy_in_thread(1000)
+
+    with scraper_profile.profile_threads() as thread_stats:
+        thread = threading.Thread(target=work_after_stop)
+        thread.start()
+    # a thread outliving the block adds nothing to the stats after it
+    stop.set()
+    thread.join()
+    stats = scraper_profile.get_stats(thread_stats)
+    assert "busy_in_thread" not in get_function_names(stats)
+
+
+def test_profile_001(tmp_path, capsys):
+    directory = str(tmp_path / "profiles")
+    with scraper_profile.profile("retailer", directory, memory=True):
+        data = allocate()
+    assert len(data) == 10000
+
+    stats = pstats.Stats(os.path.join(directory, "retailer.pstats"))
+    assert "allocate" in get_function_names(stats)
+    with open(os.path.join(directory, "retailer_memory.txt")) as f:
+        report = f.read()
+    assert report.startswith("peak ")
+    assert "test_scraper_profile.py" in report
+    assert "allocate" in capsys.readouterr().out  # hot functions printed
+
+
+def test_profile_002(tmp_path):
+    directory = str(tmp_path)
+    with scraper_profile.profile("retailer", directory, cpu=False):
+        allocate()
+    assert os.listdir(directory) == []
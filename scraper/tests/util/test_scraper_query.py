@@ -0,0 +1,101 @@
+"""All unit tests for scraper_query module.
+
+"""
+
+# STANDARD LIB
+import sqlite3
+import pandas as pd
+import pytest
+
+# PROJECT LIB
+from scraper.util import scraper_io, scraper_query
+from scraper.web_scraper.wine_scraper import matching
+
+SRC_A = "https://www.a.com/"
+SRC_B = "https://www.b.com/"
+
+
+def make_batch(run_id, src, names, prices, base_prices):
+    return pd.DataFrame({
+        "RUN_ID": run_id,
+        "NAME": names,
+        "PRICE": prices,
+        "BASE_PRICE": base_prices,
+        "IS_ON_SALE": [p < b for p, b in zip(prices, base_prices)],
+        "SRC": src,
+        "QUERY": src + "wines/?page=1",
+        "AS_OF_DATE": pd.Timestamp("2020-01-01"),
+    })
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / "wine_db.db")
+    with scraper_io.WineDbWriter(db_path) as writer:
+        writer.start_run(1)
+        writer.write_batch(
+            make_batch(1, SRC_A, ["Wine A", "Wine B", "Wine C"],
+                       [10.0, 20.0, 30.0], [10.0, 20.0, 30.0]))
+        writer.write_batch(
+            make_batch(1, SRC_B, ["Wine A 750ml"], [12.0], [12.0]))
+        writer.complete_retailer(SRC_A, 1)
+        writer.complete_retailer(SRC_B, 1)
+        writer.start_run(2)
+        # Wine C is gone, Wine B goes on sale
+        writer.write_batch(
+            make_batch(2, SRC_A, ["Wine A", "Wine B"], [10.0, 16.0],
+                       [10.0, 20.0]))
+        writer.write_batch(
+            make_batch(2, SRC_B, ["Wine A 750ml"], [9.0], [12.0]))
+        writer.complete_retailer(SRC_A, 2)
+        writer.complete_retailer(SRC_B, 2)
+        # both retailers sell Wine A
+        matching.match_new_products(writer)
+        writer.refresh_aggregates()
+    return db_path
+
+
+def test_get_cheapest_prices_001(db_path):
+    with scraper_query.WineQuery(db_path) as query:
+        res = query.get_cheapest_prices()
+        assert res["NAME"].tolist() == ["Wine A 750ml", "Wine B"]
+        assert res["PRICE"].tolist() == [9.0, 16.0]
+        assert res["MAX_PRICE"].tolist() == [10.0, 16.0]
+        assert res["N_OFFERS"].tolist() == [2, 1]
+        assert len(query.get_cheapest_prices(min_offers=2)) == 1
+        assert query.get_cheapest_prices(
+            name="wine b")["SRC"].tolist() == [SRC_A]
+
+
+def test_get_biggest_discounts_001(db_path):
+    with scraper_query.WineQuery(db_path) as query:
+        res = query.get_biggest_discounts()
+        assert res["NAME"].tolist() == ["Wine A 750ml", "Wine B"]
+        assert res["DISCOUNT_PCT"].tolist() == pytest.approx([25.0, 20.0])
+        res = query.get_biggest_discounts(limit=1, src=SRC_A)
+        assert res["NAME"].tolist() == ["Wine B"]
+
+
+def test_get_price_changes_001(db_path):
+    with scraper_query.WineQuery(db_path) as query:
+        res = query.get_price_changes()
+    assert res["NAME"].tolist() == ["Wine A 750ml", "Wine B"]
+    assert res["PREV_PRICE"].tolist() == [12.0, 20.0]
+    assert res["CHANGE_PCT"].tolist() == pytest.approx([-25.0, -20.0])
+
+
+def test_get_sale_ratios_001(db_path):
+    with scraper_query.WineQuery(db_path) as query:
+        res = query.get_sale_ratios()
+        assert res["SRC"].tolist() == [SRC_A, SRC_B]
+        assert res["SALE_RATIO"].tolist() == [0.5, 1.0]
+        res = query.get_sale_ratios(run_id=1)
+        assert res["N_PRODUCTS"].tolist() == [3, 1]
+        assert res["N_ON_SALE"].tolist() == [0, 0]
+
+
+def test_wine_query_001(db_path):
+    with scraper_query.WineQuery(db_path) as query:
+        with pytest.raises(sqlite3.OperationalError):
+            query.cnx.execute("DELETE FROM wine_price")
+    assert query.cnx is None
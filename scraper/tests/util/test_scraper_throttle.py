@@ -0,0 +1,94 @@
+"""All unit tests for scraper_throttle module.
+
+"""
+
+# STANDARD LIB
+import pytest
+
+# PROJECT LIB
+from scraper.util import scraper_throttle
+
+
+class FakeClock:
+    """Clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_001():
+    clock = FakeClock()
+    bucket = scraper_throttle.TokenBucket(2.0, 2, clock=clock)
+    # burst goes through, then requests are spaced at the rate
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now = 10.0
+    assert bucket.reserve() == 0
+
+
+def test_token_bucket_002():
+    clock = FakeClock()
+    bucket = scraper_throttle.TokenBucket(0, 1, clock=clock)
+    assert all(bucket.reserve() == 0 for _ in range(10))
+    bucket.pause(3)
+    assert bucket.reserve() == pytest.approx(3)
+
+
+def test_circuit_breaker_001():
+    clock = FakeClock()
+    breaker = scraper_throttle.CircuitBreaker(2, 30, clock=clock)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(scraper_throttle.CircuitOpenError):
+        breaker.allow()
+
+    # one trial after reset, a failed trial opens the circuit again
+    clock.now = 30.0
+    breaker.allow()
+    with pytest.raises(scraper_throttle.CircuitOpenError):
+        breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(scraper_throttle.CircuitOpenError):
+        breaker.allow()
+
+    clock.now = 60.0
+    breaker.allow()
+    breaker.record_success()
+    breaker.allow()
+    breaker.allow()
+
+
+def test_circuit_breaker_002():
+    clock = FakeClock()
+    breaker = scraper_throttle.CircuitBreaker(1, 30, clock=clock)
+    breaker.record_failure()
+    clock.now = 30.0
+    breaker.allow()
+    # a trial given up without an outcome lets the next one through
+    breaker.release()
+    breaker.allow()
+    breaker.record_success()
+    breaker.allow()
+
+
+def test_get_backoff_001():
+    for attempt in range(10):
+        backoff = scraper_throttle.get_backoff(attempt, base=1, cap=8)
+        assert 0 <= backoff <= min(8, 2**attempt)
+
+
+def test_parse_retry_after_001():
+    assert scraper_throttle.parse_retry_after(None) is None
+    assert scraper_throttle.parse_retry_after("120") == 120
+    assert scraper_throttle.parse_retry_after("soon") is None
+    now = 1445412480.0  # Wed, 21 Oct 2015 07:28:00 GMT
+    assert scraper_throttle.parse_retry_after(
+        "Wed, 21 Oct 2015 07:28:30 GMT", now=now) == 30
+    assert scraper_throttle.parse_retry_after(
+        "Wed, 21 Oct 2015 07:27:00 GMT", now=now) == 0
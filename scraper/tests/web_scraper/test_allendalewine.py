@@ -2,7 +2,14 @@
 
 """
 
+# STANDARD LIB
+import asyncio
+import pandas as pd
+import pytest
+
 # PROJECT LIB
+from scraper.benchmarks import stub_server
+from scraper.util import scraper_async, scraper_http
 from scraper.web_scraper.wine_scraper import allendalewine
 
 def test_scrape_one_page_001():
@@ -13,3 +20,120 @@ def test_scrape_one_page_002():
 
 def test_scrape_one_page_003():
     assert allendalewine.scrape_one_page(9999, 10000).empty
+
+def test_get_session_key_001():
+    html_str = ('<a href="/r/Cats">x</a>'
+                '<a href="/scan/MM=ab74b627:50:99:50?mv_more_ip=1">2</a>')
+    assert allendalewine.get_session_key(html_str) == "ab74b627"
+    assert allendalewine.get_session_key('<a href="/r/Cats">x</a>') is None
+
+def test_parse_page_001():
+    html_str = ('<div id="itemResultsList">'
+                '<div class="itemTitle"><span class="brand">Brand </span>'
+                '<span class="title">Title</span>'
+                '<span class="vintageAge">2015</span>'
+                '<span class="listprice">$1,020.00</span>'
+                '<span class="priceSale">$15.99</span></div>'
+                '<div class="itemTitle"><span class="brand">Other</span>'
+                '<span class="title">Red</span>'
+                '<span class="vintageAge"></span>'
+                '<span class="listprice">$9.99</span></div></div>')
+    df = allendalewine.parse_page(html_str, "link")
+    assert df["NAME"].tolist() == ["Brand Title 2015", "Other Red"]
+    assert df["PRICE"].tolist() == pytest.approx([15.99, 9.99])
+    assert df["BASE_PRICE"].tolist() == pytest.approx([1020.0, 9.99])
+    assert df["IS_ON_SALE"].tolist() == [True, False]
+
+def make_results_page(n_items, session_key=None):
+    items = "".join('<div class="itemTitle"><span class="brand">B{}</span>'
+                    '<span class="title">T</span>'
+                    '<span class="listprice">$9.99</span></div>'.format(i)
+                    for i in range(n_items))
+    paging = ('<a href="/scan/MM={}:0:99:100">1</a>'.format(session_key)
+              if session_key else "")
+    return '<div id="itemResultsList">{}</div>{}'.format(items, paging)
+
+
+@pytest.fixture
+def site(monkeypatch):
+    # category a honors big pages, b pages by 100, c has one page only,
+    # d caps pages at 250
+    pages = {
+        "/a": make_results_page(3, "ka"),
+        "/scan/MM=ka:0:500:500": make_results_page(500),
+        "/scan/MM=ka:500:1000:500": make_results_page(120),
+        "/b": make_results_page(3, "kb"),
+        "/scan/MM=kb:0:500:500": make_results_page(100),
+        "/scan/MM=kb:100:200:100": make_results_page(100),
+        "/scan/MM=kb:200:300:100": make_results_page(20),
+        "/c": make_results_page(5),
+        "/d": make_results_page(3, "kd"),
+        "/scan/MM=kd:0:500:500": make_results_page(250),
+        "/scan/MM=kd:250:500:250": make_results_page(250),
+        "/scan/MM=kd:500:750:250": make_results_page(40),
+        # past the end of d, must not be scraped
+        "/scan/MM=kd:750:1000:250": make_results_page(250),
+    }
+    scraper_http.configure(cache_mode=scraper_http.CACHE_OFF)
+    with stub_server.serve(pages) as base:
+        monkeypatch.setattr(allendalewine, "HTML", base)
+        monkeypatch.setattr(allendalewine, "CATEGORY_PAGES",
+                            ["a", "b", "c", "d"])
+        yield base
+    scraper_http.configure(cache_mode=scraper_http.CACHE_ON)
+
+
+def test_scrape_batches_001(site):
+    batches = dict(allendalewine.scrape_batches())
+    assert {k: len(df) for k, df in batches.items()} == {
+        "a:0": 500,
+        "a:500": 120,
+        "b:0": 100,
+        "b:100": 100,
+        "b:200": 20,
+        "c:0": 5,
+        "d:0": 250,
+        "d:250": 250,
+        "d:500": 40,
+    }
+
+
+def test_scrape_batches_002(site):
+    batches = dict(allendalewine.scrape_batches(skip_pages={"b:0", "b:100"}))
+    assert sorted(batches) == ["a:0", "a:500", "b:200", "c:0", "d:0", "d:250",
+                               "d:500"]
+
+
+def test_scrape_batches_003(site):
+    first = pd.concat(df for _, df in allendalewine.scrape_batches())
+    second = pd.concat(df for _, df in allendalewine.scrape_batches())
+    assert first["AS_OF_DATE"].nunique() == 1
+    assert second["AS_OF_DATE"].nunique() == 1
+    assert second["AS_OF_DATE"].iloc[0] > first["AS_OF_DATE"].iloc[0]
+
+
+def test_scrape_batches_async_001(site):
+
+    async def collect():
+        async with scraper_async.AsyncFetcher() as engine:
+            return [(key, len(df)) async for key, df in
+                    allendalewine.scrape_batches_async(engine)]
+
+    assert sorted(asyncio.run(collect())) == [("a:0", 500), ("a:500", 120),
+                                              ("b:0", 100), ("b:100", 100),
+                                              ("b:200", 20), ("c:0", 5),
+                                              ("d:0", 250), ("d:250", 250),
+                                              ("d:500", 40)]
+
+
+def test_get_items_per_page_001():
+    page = allendalewine.parse_page(make_results_page(250), "link")
+    assert allendalewine.get_items_per_page(page) == 250
+    page = allendalewine.parse_page(make_results_page(80), "link")
+    assert allendalewine.get_items_per_page(page) == 100
+    # items without a brand are dropped but still count towards the page
+    page = allendalewine.parse_page(
+        make_results_page(250).replace('class="brand">B0<', '>B0<'), "link")
+    assert len(page) == 249
+    assert allendalewine.get_items_per_page(page) == 250
+    assert not allendalewine.is_last_page(page, 250)
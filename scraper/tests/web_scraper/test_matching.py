@@ -0,0 +1,145 @@
+"""All unit tests for matching module.
+
+"""
+
+# STANDARD LIB
+import pandas as pd
+
+# PROJECT LIB
+from scraper.util import scraper_io
+from scraper.web_scraper.wine_scraper import matching
+
+
+def make_batch(run_id, src, names):
+    return pd.DataFrame({
+        "RUN_ID": run_id,
+        "NAME": names,
+        "PRICE": 10.0,
+        "BASE_PRICE": 10.0,
+        "IS_ON_SALE": False,
+        "SRC": src,
+        "QUERY": src + "search",
+        "AS_OF_DATE": pd.Timestamp("2020-01-01"),
+    })
+
+
+def get_wine_ids(writer):
+    return dict(
+        writer.cnx.execute(
+            "SELECT p.NAME, k.WINE_ID FROM product_match_key k "
+            "JOIN product p ON p.PRODUCT_ID = k.PRODUCT_ID"))
+
+
+def test_normalize_names_001():
+    df = matching.normalize_names(
+        pd.Series([
+            "Ch. Margaux 2015 1.5L", "Château Margaux Magnum 2015",
+            "CAYMUS Cabernet Sauvignon Napa 2019 750ml",
+            "Veuve Clicquot Brut NV 375 ml", None
+        ]))
+    assert df["PRODUCER"].tolist() == [
+        "chateau margaux", "chateau margaux", "caymus", "veuve", ""
+    ]
+    assert df["VINTAGE"].tolist() == [2015, 2015, 2019, pd.NA, pd.NA]
+    assert df["SIZE_ML"].tolist() == [1500, 1500, 750, 375, 750]
+    assert df["MATCH_NAME"].tolist() == [
+        "chateau margaux", "chateau margaux",
+        "caymus cabernet sauvignon napa", "veuve clicquot brut", ""
+    ]
+
+
+def test_get_matches_001():
+    keys = pd.concat([
+        pd.DataFrame({
+            "PRODUCT_ID": [1, 2, 3, 4, 5],
+            "SRC": ["a", "b", "b", "b", "a"]
+        }),
+        matching.normalize_names(
+            pd.Series([
+                "Opus One 2018", "Opus One Red 2018", "Opus One 2017",
+                "Opus One 2018 375ml", "Opus One Overture 2018"
+            ]))
+    ],
+                     axis=1).set_index("PRODUCT_ID")
+    keys["IS_NEW"] = True
+    index = matching.get_token_index(keys)
+    keys["N_TOKENS"] = index.groupby("PRODUCT_ID").size()
+    pairs = matching.get_matches(keys.index, keys, index)
+    # vintage and size differ for 3 and 4, 5 has the lower score for 2
+    assert pairs.values.tolist() == [[1, 2, 2 / 3]]
+
+
+def test_get_matches_002():
+    # words in too many products do not make candidates, but still score
+    keys = pd.DataFrame({
+        "SRC": ["a", "b"],
+        "PRODUCER": "x",
+        "VINTAGE": pd.array([None, None], dtype="Int64"),
+        "SIZE_ML": 750,
+        "MATCH_NAME": ["x red", "x red blend"],
+        "IS_NEW": True,
+        "N_TOKENS": [2, 3],
+    },
+                        index=pd.Index([1, 2], name="PRODUCT_ID"))
+    index = matching.get_token_index(keys)
+    assert matching.get_matches([1, 2], keys, index, max_products=1).empty
+    pairs = matching.get_matches([1, 2], keys, index)
+    assert pairs["SCORE"].tolist() == [2 / 3]
+
+
+def test_get_wine_ids_001():
+    wine_ids = pd.Series([1, 2, 3, 3, 5], index=[1, 2, 3, 4, 5])
+    pairs = pd.DataFrame({"PRODUCT_ID": [5, 4], "MATCH_PRODUCT_ID": [2, 1]})
+    assert matching.get_wine_ids(wine_ids,
+                                 pairs).tolist() == [1, 2, 1, 1, 2]
+
+
+def test_match_new_products_001(tmp_path):
+    with scraper_io.WineDbWriter(str(tmp_path / "wine_db.db")) as writer:
+        writer.write_batch(
+            make_batch(1, "a", ["Caymus Cabernet Sauvignon 2019",
+                                "Opus One 2018"]))
+        writer.write_batch(
+            make_batch(1, "b", ["CAYMUS Cabernet Sauvignon 750ml 2019"]))
+        writer.write_batch(make_batch(1, "c", ["Opus One Red 2018"]))
+        assert matching.match_new_products(writer) == (4, 2)
+        assert matching.match_new_products(writer) == (0, 0)
+
+        # only the new product is matched, and joins both wines of its run
+        writer.write_batch(
+            make_batch(2, "d", ["Caymus Cab Sauv 2019", "Opus One 2018"]))
+        assert matching.match_new_products(writer, batch_size=1) == (2, 4)
+        wine_ids = get_wine_ids(writer)
+    assert wine_ids == {
+        "Caymus Cabernet Sauvignon 2019": 1,
+        "Opus One 2018": 2,
+        "CAYMUS Cabernet Sauvignon 750ml 2019": 1,
+        "Opus One Red 2018": 2,
+        "Caymus Cab Sauv 2019": 1,
+    }
+
+
+def get_match_ends(writer):
+    return writer.get_matched_retailers().sort_values(
+        ["PRODUCT_ID", "OTHER_SRC"]).values.tolist()
+
+
+def test_match_new_products_002(tmp_path):
+    with scraper_io.WineDbWriter(str(tmp_path / "wine_db.db")) as writer:
+        writer.write_batch(make_batch(1, "a", ["Opus One 2018"]))
+        writer.write_batch(make_batch(1, "b", ["Opus One 2018"]))
+        assert matching.match_new_products(writer) == (2, 1)
+        # the stored product of a keeps its match at b
+        writer.write_batch(make_batch(2, "b", ["Opus One Red 2018"]))
+        assert matching.match_new_products(writer) == (1, 0)
+        assert get_match_ends(writer) == [[1, "b"], [2, "a"]]
+
+
+def test_match_new_products_003(tmp_path):
+    with scraper_io.WineDbWriter(str(tmp_path / "wine_db.db")) as writer:
+        writer.write_batch(make_batch(1, "a", ["Opus One 2018"]))
+        writer.write_batch(make_batch(1, "b", ["Opus One 2018"]))
+        writer.write_batch(make_batch(1, "a", ["Opus One Red 2018"]))
+        # 2 is matched to 1 in the first batch, not again to 3 in the second
+        assert matching.match_new_products(writer, batch_size=1) == (3, 1)
+        assert get_match_ends(writer) == [[1, "b"], [2, "a"]]
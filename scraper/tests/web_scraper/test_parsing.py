@@ -0,0 +1,93 @@
+"""All unit tests for parsing module.
+
+"""
+
+# STANDARD LIB
+import re
+import pandas as pd
+
+# PROJECT LIB
+from scraper.web_scraper.wine_scraper import constants as ws_const
+from scraper.web_scraper.wine_scraper import parsing
+
+
+def test_find_first_001():
+    regex = re.compile(parsing.find_first(parsing.price_field("P")))
+    assert regex.match("$ $x $1,299.99 $5.00").group("P") == "1,299.99"
+
+
+def test_optional_field_001():
+    regex = re.compile(
+        parsing.optional_field(r'b">(?P<B>[^<]*)<') +
+        parsing.optional_field(r'a">(?P<A>[^<]*)<'))
+    s = pd.Series(['<i a">1</i><i b">2</i>', '<i a">3</i>', "none"])
+    df = s.str.extract(regex)
+    assert df["A"].tolist()[:2] == ["1", "3"]
+    assert df["B"].iloc[0] == "2"
+    assert df["B"].iloc[1:].isnull().all()
+    assert df["A"].iloc[2:].isnull().all()
+
+
+def test_to_price_001():
+    s = parsing.to_price(pd.Series(["1,299.99", "5.00", None]))
+    assert s.iloc[0] == 1299.99
+    assert s.iloc[1] == 5.0
+    assert pd.isnull(s.iloc[2])
+
+
+def test_get_cell_texts_001():
+    html_str = ("<html><body><table><tr><td>nav</td></tr></table>"
+                "<table><tr><td>img</td><td> Wine\n  A <b>$9.99</b></td></tr>"
+                "<tr><td>img</td><td></td></tr></table>"
+                "<table><tr><td>x</td><td>footer</td></tr></table>"
+                "</body></html>")
+    assert parsing.get_cell_texts(html_str, 1) == ["Wine A $9.99", "footer"]
+    assert parsing.get_cell_texts(html_str, 1,
+                                  tables=slice(1, -1)) == ["Wine A $9.99"]
+    assert parsing.get_cell_texts(html_str, 4) == []
+    assert parsing.get_cell_texts("", 1) == []
+
+
+def make_page(query, prices):
+    return pd.DataFrame({
+        "NAME": ["Wine {}".format(i) for i in range(len(prices))],
+        "PRICE": prices,
+        "BASE_PRICE": prices,
+        "IS_ON_SALE": False,
+        "SRC": "https://www.example.com/",
+        "QUERY": query,
+        "AS_OF_DATE": parsing.get_as_of_date(),
+        "RAW_DATA_STR": "<td>",
+    })
+
+
+def test_get_as_of_date_001():
+    as_of_date = pd.Timestamp("2020-01-01")
+    assert parsing.get_as_of_date(as_of_date) is as_of_date
+    assert parsing.get_as_of_date() > as_of_date
+
+
+def test_to_output_001():
+    df = parsing.to_output(make_page("q1", [12.99, 5.0]),
+                           "https://www.example.com/")
+    assert df.columns.tolist() == ws_const.WINE_SCRAPER_OUTPUT_COLS
+    assert df.dtypes.astype(str).to_dict() == {
+        "NAME": "str",
+        "PRICE": "float32",
+        "BASE_PRICE": "float32",
+        "IS_ON_SALE": "bool",
+        "SRC": "category",
+        "QUERY": "category",
+        "AS_OF_DATE": "datetime64[us]",
+    }
+
+
+def test_concat_output_001():
+    url = "https://www.example.com/"
+    df = parsing.concat_output([
+        parsing.to_output(make_page("q1", [1.0]), url),
+        parsing.to_output(make_page("q2", [2.0, 3.0]), url)
+    ])
+    assert df["QUERY"].tolist() == ["q1", "q2", "q2"]
+    assert isinstance(df["QUERY"].dtype, pd.CategoricalDtype)
+    assert df["PRICE"].dtype == "float32"
@@ -0,0 +1,31 @@
+"""All unit tests for registry module.
+
+"""
+
+# STANDARD LIB
+import pytest
+
+# PROJECT LIB
+from scraper.web_scraper.wine_scraper import registry
+
+
+def test_get_modules_001():
+    names = registry.get_names()
+    modules = registry.get_modules()
+    assert [m.__name__.split(".")[-1] for m in modules] == names
+    for module in modules:
+        assert callable(module.scrape_batches)
+        assert callable(module.parse_page)
+        assert module.HTML.startswith("https://")
+
+
+def test_get_modules_002():
+    modules = registry.get_modules(["winelibrary", "garyswine"])
+    assert [m.HTML for m in modules] == [
+        "https://winelibrary.com/", "https://www.garyswine.com/"
+    ]
+
+
+def test_get_module_001():
+    with pytest.raises(KeyError):
+        registry.get_module("nope")
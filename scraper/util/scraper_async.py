@@ -0,0 +1,194 @@
+"""Module of the asyncio fetch engine.
+
+The default engine fetches every page in flight on its own thread. This
+engine runs all page requests of a run as tasks on a single event loop
+with aiohttp, so a run needs no thread per request and the number of
+open connections per host is capped by the connector alone. Requests go
+through the same cache, per-host throttles and retry policy as
+scraper_http.fetch; parsing is handed to scraper_parse on a worker
+thread so the loop keeps fetching.
+
+aiohttp is only needed when this engine is used.
+
+"""
+
+# STANDARD LIB
+import asyncio
+import time
+import aiohttp
+
+# PROJECT LIB
+from scraper.util import scraper_http, scraper_metrics, scraper_parse
+
+
+def get_client_timeout(timeout):
+    """Convert a requests style timeout for aiohttp.
+
+    Args:
+        timeout (float or tuple): seconds, or (connect, read) seconds.
+
+    Returns:
+        timeout (aiohttp.ClientTimeout): the same limits for aiohttp.
+    """
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+    return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+
+class AsyncFetcher:
+    """Fetches and parses pages on the running event loop.
+
+    Use as an async context manager, which opens the shared connection
+    pool:
+
+        async with AsyncFetcher() as engine:
+            html_str = await engine.fetch(url)
+
+    Args:
+        max_connections_per_host (int, default None): connections open to
+            one host at a time, the scraper_http setting if None.
+        timeout (float or tuple, default None): request timeout, the
+            scraper_http setting if None.
+    """
+
+    def __init__(self, max_connections_per_host=None, timeout=None):
+        self.max_connections_per_host = (
+            max_connections_per_host
+            or scraper_http.get_config("max_connections_per_host"))
+        self.timeout = get_client_timeout(
+            timeout or scraper_http.get_config("timeout"))
+        self._connector = None
+        self._session = None
+
+    async def __aenter__(self):
+        self._connector = aiohttp.TCPConnector(
+            limit=0, limit_per_host=self.max_connections_per_host)
+        self._session = self.new_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        await self._connector.close()
+
+    def new_session(self):
+        """Start a session with its own cookies on the shared connections.
+
+        Pass a dedicated session to fetch when the site keys state on
+        cookies; close it when done, e.g. with async with.
+
+        Returns:
+            session (aiohttp.ClientSession): a new session.
+        """
+        return aiohttp.ClientSession(connector=self._connector,
+                                     connector_owner=False,
+                                     headers=scraper_http.HEADERS,
+                                     timeout=self.timeout)
+
+    async def send(self, session, url, headers):
+        """Send a GET within the host's rate limit, retrying failures.
+
+        Same policy as scraper_http.send, but waits without blocking the
+        event loop. A cancelled request gives up its breaker trial.
+
+        Args:
+            session (aiohttp.ClientSession): session to send with.
+            url (str): link to fetch.
+            headers (dict): extra request headers.
+
+        Returns:
+            status_code (int): response status.
+            text (str): decoded response body.
+            headers (Mapping): response headers.
+
+        Raises:
+            aiohttp.ClientResponseError: the response is an error, after
+                any retries.
+        """
+        bucket, breaker = scraper_http.get_host_throttle(url)
+        max_retries = scraper_http.get_config("max_retries")
+        for attempt in range(max_retries + 1):
+            breaker.allow()
+            retry_after = None
+            try:
+                await asyncio.sleep(bucket.reserve())
+                start = time.perf_counter()
+                async with session.get(url, headers=headers) as response:
+                    if response.status not in scraper_http.RETRY_STATUSES:
+                        if response.status in scraper_http.END_STATUSES:
+                            breaker.record_success()
+                            response.raise_for_status()
+                        if response.status >= 400:
+                            # e.g. a 403 block page, not the page asked for
+                            breaker.record_failure()
+                            response.raise_for_status()
+                        body = await response.read()
+                        scraper_metrics.observe("fetch_seconds",
+                                                time.perf_counter() - start,
+                                                url)
+                        # aiohttp counts decompressed bytes, the header
+                        # has the size sent
+                        length = response.headers.get("Content-Length", "")
+                        scraper_metrics.inc(
+                            "fetch_bytes",
+                            int(length) if body and length.isdigit() else
+                            len(body), url)
+                        breaker.record_success()
+                        return (response.status, await response.text(),
+                                response.headers)
+                    breaker.record_failure()
+                    if attempt == max_retries:
+                        response.raise_for_status()
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                breaker.record_failure()
+                if attempt == max_retries:
+                    raise
+            except BaseException:
+                # e.g. cancelled past the end of a catalog, don't hold a
+                # trial open forever
+                breaker.release()
+                raise
+
+            wait = scraper_http.get_retry_wait(bucket, attempt, retry_after)
+            print("Retrying {} in {:.1f}s".format(url, wait))
+            scraper_metrics.inc("fetch_retries", 1, url)
+            await asyncio.sleep(wait)
+
+    async def fetch(self, url, session=None):
+        """Fetch a page and return its decoded body.
+
+        Same caching as scraper_http.fetch.
+
+        Args:
+            url (str): link to fetch.
+            session (aiohttp.ClientSession, default None): session to use,
+                the engine's shared session if None.
+
+        Returns:
+            text (str): decoded response body.
+        """
+        entry, text, headers = scraper_http.lookup(url)
+        if text is not None:
+            return text
+        status_code, text, response_headers = await self.send(
+            session or self._session, url, headers)
+        return scraper_http.store(url, entry, status_code, text,
+                                  response_headers)
+
+    async def parse(self, parse_fn, html_str, *args):
+        """Parse a fetched page off the event loop, see scraper_parse.parse.
+
+        Args:
+            parse_fn (callable): module level function taking html_str and
+                args, e.g. a retailer's parse_page.
+            html_str (str): html of the page.
+            *args: passed on to parse_fn.
+
+        Returns:
+            result: what parse_fn returns.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, scraper_parse.parse,
+                                           parse_fn, html_str, *args)
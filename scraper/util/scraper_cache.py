@@ -0,0 +1,177 @@
+"""Module of on-disk http response caching tools.
+
+Responses are stored zlib compressed in a sqlite file keyed by url,
+together with the ETag / Last-Modified validators needed to revalidate
+them with a conditional request.
+
+"""
+
+# STANDARD LIB
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# PROJECT LIB
+from scraper.settings import settings
+
+DEFAULT_TTL = 0  # seconds an entry is served without revalidation
+DEFAULT_MAX_BYTES = 512 * 1024**2  # compressed size budget
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS response (
+    url TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+)
+"""
+_CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS response_accessed_at ON response (accessed_at)
+"""
+
+
+def get_default_path():
+    """Default location of the cache file.
+
+    Returns:
+        path (str): path under settings.DATA_DIRECTORY.
+    """
+    return os.path.join(settings.DATA_DIRECTORY, "http_cache.db")
+
+
+class HttpCache:
+    """Url keyed response cache with LRU eviction.
+
+    Safe to share between threads; all access goes through one
+    connection guarded by a lock.
+
+    Args:
+        path (str): path of the sqlite cache file.
+        ttl (float, default DEFAULT_TTL): seconds an entry counts as fresh.
+        max_bytes (int, default DEFAULT_MAX_BYTES): compressed size budget,
+            least recently used entries are evicted beyond this.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cnx = sqlite3.connect(path, check_same_thread=False)
+        self._cnx.execute(_CREATE_TABLE)
+        self._cnx.execute(_CREATE_INDEX)
+        self._cnx.commit()
+        self._total = self._cnx.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM response").fetchone()[0]
+
+    def get(self, url):
+        """Look up a cached response and mark it as recently used.
+
+        Args:
+            url (str): cache key.
+
+        Returns:
+            entry (dict or None): with "body", "etag", "last_modified" and
+                "is_fresh", None on a miss.
+        """
+        with self._lock:
+            row = self._cnx.execute(
+                "SELECT body, etag, last_modified, fetched_at "
+                "FROM response WHERE url = ?", (url, )).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._cnx.execute(
+                "UPDATE response SET accessed_at = ? WHERE url = ?",
+                (now, url))
+            self._cnx.commit()
+
+        body, etag, last_modified, fetched_at = row
+        return {
+            "body": zlib.decompress(body).decode("utf-8"),
+            "etag": etag,
+            "last_modified": last_modified,
+            "is_fresh": now - fetched_at < self.ttl,
+        }
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Store a response, evicting old entries if over budget.
+
+        Args:
+            url (str): cache key.
+            body (str): decoded response body.
+            etag (str, default None): ETag header of the response.
+            last_modified (str, default None): Last-Modified header.
+
+        Returns:
+            void
+        """
+        blob = zlib.compress(body.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            row = self._cnx.execute("SELECT size FROM response WHERE url = ?",
+                                    (url, )).fetchone()
+            if row is not None:
+                self._total -= row[0]
+            self._cnx.execute(
+                "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, blob, etag, last_modified, now, now, len(blob)))
+            self._total += len(blob)
+            self._evict()
+            self._cnx.commit()
+
+    def urls(self):
+        """List every cached url.
+
+        Returns:
+            urls (list of str): cached urls, most recently used first.
+        """
+        with self._lock:
+            rows = self._cnx.execute("SELECT url FROM response "
+                                     "ORDER BY accessed_at DESC").fetchall()
+        return [row[0] for row in rows]
+
+    def touch(self, url):
+        """Mark an entry as just revalidated (e.g. after a 304).
+
+        Args:
+            url (str): cache key.
+
+        Returns:
+            void
+        """
+        now = time.time()
+        with self._lock:
+            self._cnx.execute(
+                "UPDATE response SET fetched_at = ?, accessed_at = ? "
+                "WHERE url = ?", (now, now, url))
+            self._cnx.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until under max_bytes.
+
+        Caller must hold the lock.
+        """
+        while self._total > self.max_bytes:
+            row = self._cnx.execute(
+                "SELECT url, size FROM response "
+                "ORDER BY accessed_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._cnx.execute("DELETE FROM response WHERE url = ?",
+                              (row[0], ))
+            self._total -= row[1]
+
+    def close(self):
+        """Close the underlying connection.
+
+        Returns:
+            void
+        """
+        with self._lock:
+            self._cnx.close()
@@ -0,0 +1,475 @@
+"""Module of shared http fetch tools.
+
+All retailer modules fetch pages through here so that connections are
+pooled and kept alive across pages instead of paying a TCP + TLS
+handshake per request, and so that responses go through the on-disk
+cache in scraper_cache. Requests are throttled per host and retried on
+timeouts, 429 and 5xx responses, see scraper_throttle.
+
+"""
+
+# STANDARD LIB
+import importlib.util
+import threading
+import time
+import urllib.parse
+import requests
+from requests import adapters
+
+# PROJECT LIB
+from scraper.util import scraper_cache, scraper_metrics, scraper_throttle
+
+DEFAULT_TIMEOUT = (10, 60)  # (connect, read) in seconds
+MAX_CONNECTIONS_PER_HOST = 8
+MAX_HOSTS = 10  # number of per-host pools kept open
+
+CACHE_ON = "on"  # serve fresh entries, revalidate stale ones
+CACHE_OFF = "off"  # always go to the network, store nothing
+CACHE_ONLY = "only"  # never go to the network
+CACHE_MODES = [CACHE_ON, CACHE_OFF, CACHE_ONLY]
+
+MAX_RETRIES = 4  # retries after the first attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# sites that page by number may answer these past the last page
+END_STATUSES = {404, 410}
+
+# urllib3 only decodes brotli when a brotli package is installed
+if (importlib.util.find_spec("brotli") is not None
+        or importlib.util.find_spec("brotlicffi") is not None):
+    ACCEPT_ENCODING = "gzip, deflate, br"
+else:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+HEADERS = {
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Connection": "keep-alive",
+}
+
+_config = {
+    "timeout": DEFAULT_TIMEOUT,
+    "max_connections_per_host": MAX_CONNECTIONS_PER_HOST,
+    "cache_mode": CACHE_ON,
+    "cache_path": None,  # None for scraper_cache.get_default_path()
+    "cache_ttl": scraper_cache.DEFAULT_TTL,
+    "cache_max_bytes": scraper_cache.DEFAULT_MAX_BYTES,
+    "rate": scraper_throttle.DEFAULT_RATE,
+    "burst": scraper_throttle.DEFAULT_BURST,
+    "host_limits": {},  # host -> (rate, burst), overrides rate and burst
+    "max_retries": MAX_RETRIES,
+    "backoff_base": scraper_throttle.DEFAULT_BACKOFF_BASE,
+    "backoff_max": scraper_throttle.DEFAULT_BACKOFF_MAX,
+    "breaker_failures": scraper_throttle.DEFAULT_BREAKER_FAILURES,
+    "breaker_reset": scraper_throttle.DEFAULT_BREAKER_RESET,
+}
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+_hosts = {}  # host -> (scraper_throttle.TokenBucket, CircuitBreaker)
+_hosts_lock = threading.Lock()
+
+
+def configure(timeout=None,
+              max_connections_per_host=None,
+              cache_mode=None,
+              cache_path=None,
+              cache_ttl=None,
+              cache_max_bytes=None,
+              rate=None,
+              burst=None,
+              host_limits=None,
+              max_retries=None,
+              backoff_base=None,
+              backoff_max=None,
+              breaker_failures=None,
+              breaker_reset=None):
+    """Change the defaults used by the shared session, cache and throttle.
+
+    The shared session, cache and per-host throttles are rebuilt on next
+    use so new settings apply. Any argument left as None keeps its
+    current value.
+
+    Args:
+        timeout (float or tuple, default None): request timeout, either
+            one value or (connect, read).
+        max_connections_per_host (int, default None): size of each
+            per-host connection pool.
+        cache_mode (str, default None): one of CACHE_MODES.
+        cache_path (str, default None): path of the cache file.
+        cache_ttl (float, default None): seconds a cached page is served
+            without revalidation.
+        cache_max_bytes (int, default None): compressed cache size budget.
+        rate (float, default None): requests per second per host, 0 for
+            no limit.
+        burst (int, default None): requests a host may get back to back.
+        host_limits (dict, default None): host -> (rate, burst) for hosts
+            that need their own limits, e.g. {"winelibrary.com": (2, 4)}.
+        max_retries (int, default None): retries of a failed request.
+        backoff_base (float, default None): seconds before the first
+            retry, doubled for every retry after.
+        backoff_max (float, default None): cap on a single backoff.
+        breaker_failures (int, default None): consecutive failures after
+            which a host is not contacted for breaker_reset seconds.
+        breaker_reset (float, default None): see breaker_failures.
+
+    Returns:
+        void
+    """
+    global _session, _cache
+    if cache_mode is not None and cache_mode not in CACHE_MODES:
+        raise ValueError("cache_mode must be one of {}".format(CACHE_MODES))
+
+    new_values = {
+        "timeout": timeout,
+        "max_connections_per_host": max_connections_per_host,
+        "cache_mode": cache_mode,
+        "cache_path": cache_path,
+        "cache_ttl": cache_ttl,
+        "cache_max_bytes": cache_max_bytes,
+        "rate": rate,
+        "burst": burst,
+        "host_limits": host_limits,
+        "max_retries": max_retries,
+        "backoff_base": backoff_base,
+        "backoff_max": backoff_max,
+        "breaker_failures": breaker_failures,
+        "breaker_reset": breaker_reset,
+    }
+    with _session_lock, _cache_lock, _hosts_lock:
+        _config.update({k: v for k, v in new_values.items() if v is not None})
+        _session = None
+        _hosts.clear()
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def new_session(max_connections_per_host=None):
+    """Create a pooled, keep-alive session.
+
+    Connections to a host are capped at max_connections_per_host; extra
+    requests wait for a free connection rather than opening new ones.
+
+    Args:
+        max_connections_per_host (int, default None): size of each
+            per-host connection pool, None for the configured default.
+
+    Returns:
+        session (requests.Session): a new session.
+    """
+    if max_connections_per_host is None:
+        max_connections_per_host = _config["max_connections_per_host"]
+    adapter = adapters.HTTPAdapter(pool_connections=MAX_HOSTS,
+                                   pool_maxsize=max_connections_per_host,
+                                   pool_block=True)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def get_session():
+    """Get the session shared by all modules, creating it on first use.
+
+    Returns:
+        session (requests.Session): the shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+        return _session
+
+
+def get_cache():
+    """Get the shared response cache, opening it on first use.
+
+    Returns:
+        cache (scraper_cache.HttpCache or None): None if caching is off.
+    """
+    global _cache
+    if _config["cache_mode"] == CACHE_OFF:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = _config["cache_path"] or scraper_cache.get_default_path()
+            _cache = scraper_cache.HttpCache(
+                path,
+                ttl=_config["cache_ttl"],
+                max_bytes=_config["cache_max_bytes"])
+        return _cache
+
+
+def get_host_throttle(url):
+    """Get the rate limiter and circuit breaker of a url's host.
+
+    Args:
+        url (str): link about to be fetched.
+
+    Returns:
+        bucket (scraper_throttle.TokenBucket): the host's rate limiter.
+        breaker (scraper_throttle.CircuitBreaker): the host's breaker.
+    """
+    host = urllib.parse.urlsplit(url).netloc
+    with _hosts_lock:
+        if host not in _hosts:
+            rate, burst = _config["host_limits"].get(
+                host, (_config["rate"], _config["burst"]))
+            _hosts[host] = (scraper_throttle.TokenBucket(rate, burst),
+                            scraper_throttle.CircuitBreaker(
+                                _config["breaker_failures"],
+                                _config["breaker_reset"]))
+        return _hosts[host]
+
+
+def get_error_status(error):
+    """HTTP status of a failed fetch of either fetch engine.
+
+    Args:
+        error (Exception): raised by fetch or scraper_async.AsyncFetcher.
+
+    Returns:
+        status_code (int or None): None if the error has no response, e.g.
+            a timeout.
+    """
+    if isinstance(error, requests.HTTPError):
+        if error.response is not None:
+            return error.response.status_code
+        return None
+    status = getattr(error, "status", None)  # aiohttp.ClientResponseError
+    return status if isinstance(status, int) else None
+
+
+def get_wire_bytes(response):
+    """Size of a response body as sent, before any decompression.
+
+    urllib3 counts the bytes it reads, except for chunked bodies; those
+    fall back to Content-Length, and to the decoded size without one.
+
+    Args:
+        response (requests.Response): a response whose body was read.
+
+    Returns:
+        n_bytes (int): body bytes received.
+    """
+    n_bytes = response.raw.tell() if response.raw is not None else 0
+    if n_bytes or not response.content:
+        return n_bytes
+    length = response.headers.get("Content-Length", "")
+    return int(length) if length.isdigit() else len(response.content)
+
+
+def get_retry_wait(bucket, attempt, retry_after=None):
+    """Time to wait before retrying a failed request.
+
+    A Retry-After also pauses the host's bucket, so other requests to the
+    host wait as well.
+
+    Args:
+        bucket (scraper_throttle.TokenBucket): the host's rate limiter.
+        attempt (int): number of the failed attempt, starting at 0.
+        retry_after (str, default None): Retry-After header of the failed
+            response, if any.
+
+    Returns:
+        wait (float): seconds to sleep, the larger of Retry-After and an
+            exponential backoff with jitter.
+    """
+    retry_after = scraper_throttle.parse_retry_after(retry_after)
+    if retry_after is not None:
+        bucket.pause(retry_after)
+    return max(
+        retry_after or 0,
+        scraper_throttle.get_backoff(attempt, _config["backoff_base"],
+                                     _config["backoff_max"]))
+
+
+def send(session, url, headers, timeout):
+    """Send a GET within the host's rate limit, retrying failures.
+
+    Timeouts, connection errors and RETRY_STATUSES responses are retried
+    up to max_retries times after an exponential backoff with jitter, or
+    after Retry-After when the server sends one. A Retry-After also holds
+    back every other request to the host. Other 4xx and 5xx responses
+    raise at once. Each failure counts towards the host's circuit
+    breaker, except END_STATUSES which the host answered on purpose.
+
+    Args:
+        session (requests.Session): session to send with.
+        url (str): link to fetch.
+        headers (dict): extra request headers.
+        timeout (float or tuple): request timeout.
+
+    Returns:
+        response (requests.Response): the first response that is not
+            retried.
+
+    Raises:
+        requests.HTTPError: the response is an error, after any retries.
+    """
+    bucket, breaker = get_host_throttle(url)
+    max_retries = _config["max_retries"]
+    for attempt in range(max_retries + 1):
+        breaker.allow()
+        retry_after = None
+        try:
+            bucket.acquire()
+            with scraper_metrics.timer("fetch_seconds", url):
+                response = session.get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record_failure()
+            if attempt == max_retries:
+                raise
+        except BaseException:
+            # e.g. too many redirects, don't hold a trial open forever
+            breaker.release()
+            raise
+        else:
+            scraper_metrics.inc("fetch_bytes", get_wire_bytes(response), url)
+            if response.status_code not in RETRY_STATUSES:
+                if response.status_code in END_STATUSES:
+                    breaker.record_success()
+                    response.raise_for_status()
+                if response.status_code >= 400:
+                    # e.g. a 403 block page, not the page asked for
+                    breaker.record_failure()
+                    response.raise_for_status()
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == max_retries:
+                response.raise_for_status()
+            retry_after = response.headers.get("Retry-After")
+
+        wait = get_retry_wait(bucket, attempt, retry_after)
+        print("Retrying {} in {:.1f}s".format(url, wait))
+        scraper_metrics.inc("fetch_retries", 1, url)
+        time.sleep(wait)
+
+
+def fetch(url, session=None, timeout=None):
+    """Fetch a page and return its decoded body.
+
+    Goes through the response cache unless caching is off: fresh entries
+    are returned as is, stale ones are revalidated with If-None-Match /
+    If-Modified-Since and reused on a 304. In cache only mode a miss
+    returns an empty body, which every parser treats as an empty page.
+    Otherwise a response other than 2xx or 304 raises, so an error page
+    is never parsed as the end of a catalog, see scraper_pager.is_past_end
+    for the statuses that do end one.
+
+    Args:
+        url (str): link to fetch.
+        session (requests.Session, default None): session to use, the
+            shared session if None. Pass a dedicated session when the site
+            keys state on cookies.
+        timeout (float or tuple, default None): request timeout, the
+            configured default if None.
+
+    Returns:
+        text (str): decoded response body.
+
+    Raises:
+        requests.HTTPError: the response is not 2xx or 304.
+    """
+    entry, text, headers = lookup(url)
+    if text is not None:
+        return text
+
+    if session is None:
+        session = get_session()
+    if timeout is None:
+        timeout = _config["timeout"]
+    response = send(session, url, headers, timeout)
+    check_status(response)
+    return store(url, entry, response.status_code, response.text,
+                 response.headers)
+
+
+def check_status(response):
+    """Raise for a response that does not carry the page.
+
+    Args:
+        response (requests.Response): response of a fetch.
+
+    Returns:
+        void
+
+    Raises:
+        requests.HTTPError: the status is not 2xx or 304.
+    """
+    if response.status_code == 304 or 200 <= response.status_code < 300:
+        return
+    response.raise_for_status()  # 4xx and 5xx
+    raise requests.HTTPError("{} Unexpected status for url: {}".format(
+        response.status_code, response.url),
+                             response=response)
+
+
+def lookup(url):
+    """Look a url up in the cache before fetching it.
+
+    Args:
+        url (str): link about to be fetched.
+
+    Returns:
+        entry (dict or None): the cache entry, see scraper_cache.
+        text (str or None): the body if no request is needed, i.e. a fresh
+            entry, or any lookup in cache only mode.
+        headers (dict): conditional request headers for a stale entry.
+    """
+    cache = get_cache()
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and (entry["is_fresh"]
+                              or _config["cache_mode"] == CACHE_ONLY):
+        scraper_metrics.inc("cache_hits", 1, url)
+        return entry, entry["body"], {}
+    if _config["cache_mode"] == CACHE_ONLY:
+        return entry, "", {}
+
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return entry, None, headers
+
+
+def store(url, entry, status_code, text, headers):
+    """Update the cache with a response.
+
+    Args:
+        url (str): link that was fetched.
+        entry (dict or None): cache entry returned by lookup.
+        status_code (int): response status.
+        text (str): decoded response body.
+        headers (Mapping): response headers.
+
+    Returns:
+        text (str): the page, from the cache on a 304.
+    """
+    cache = get_cache()
+    if status_code == 304 and entry is not None:
+        scraper_metrics.inc("cache_revalidated", 1, url)
+        cache.touch(url)
+        return entry["body"]
+    if cache is not None and status_code == 200:
+        cache.put(url,
+                  text,
+                  etag=headers.get("ETag"),
+                  last_modified=headers.get("Last-Modified"))
+    return text
+
+
+def get_config(name):
+    """Current value of a setting, see configure.
+
+    Args:
+        name (str): argument name of configure, e.g. "timeout".
+
+    Returns:
+        value: the setting.
+    """
+    return _config[name]
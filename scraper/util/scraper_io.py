@@ -3,17 +3,1059 @@
 """
 
 # STANDARD LIB
+import contextlib
+import json
 import os
 import sqlite3
+import uuid
 import pandas as pd
 
 # PROJECT LIB
 from scraper.settings import settings
+from scraper.util import scraper_metrics
+
+
+DEFAULT_COMMIT_ROWS = 50000  # rows per transaction
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # safe with WAL, fsync only on checkpoint
+    "cache_size": -64000,  # negative means KiB, i.e. ~64MB
+    "temp_store": "MEMORY",
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # same text as df.to_sql
+
+PARQUET_PARTITION_COLS = ["SITE", "RUN_DATE"]
+PARQUET_DTYPES = {
+    "RUN_ID": "int64",
+    "NAME": "string",
+    "PRICE": "float64",
+    "BASE_PRICE": "float64",
+    "IS_ON_SALE": "bool",
+    "SRC": "category",
+    "QUERY": "string",
+    "AS_OF_DATE": "datetime64[us]",
+}
+PARQUET_FILE_ROWS = 100000  # rows buffered before a parquet file is written
+PARQUET_COMPRESSION = "zstd"
+
+FORMAT_CSV = "csv"
+FORMAT_PARQUET = "parquet"
+FILE_FORMATS = [FORMAT_CSV, FORMAT_PARQUET]
+
+
+def get_sqlite_type(s):
+    """Sqlite column type for a series, matching what df.to_sql creates.
+
+    Args:
+        s (pd.Series): a column of the data frame to write.
+
+    Returns:
+        sqlite_type (str): sqlite column type.
+    """
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(s):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def to_float64(s):
+    """Widen float32 values to the float64 of their shortest decimal.
+
+    A plain astype turns a float32 12.99 into 12.989999771118164; going
+    through the decimal text gives back 12.99.
+
+    Args:
+        s (pd.Series): a column of the data frame to write.
+
+    Returns:
+        s (pd.Series): float64 if s was float32, else s unchanged.
+    """
+    if s.dtype != "float32":
+        return s
+    return s.astype(str).astype("float64")
+
+
+def get_sqlite_values(s):
+    """Python values of a series that sqlite3 can bind directly.
+
+    Args:
+        s (pd.Series): a column of the data frame to write.
+
+    Returns:
+        values (list): one value per row.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = s.dt.strftime(TIMESTAMP_FORMAT)
+    s = to_float64(s)
+    # missing values come out as NaN, which sqlite stores as NULL
+    return s.tolist()
+
+
+def get_sqlite_rows(df):
+    """Rows of a data frame as tuples that sqlite3 can bind directly.
+
+    Args:
+        df (pd.DataFrame): data frame to write.
+
+    Returns:
+        rows (iterator of tuple): one tuple per row.
+    """
+    return zip(*[get_sqlite_values(s) for _, s in df.items()])
+
+
+class SqliteWriter:
+    """Writes data frames to a sqlite db over a single connection.
+
+    Rows are inserted with executemany on a prepared INSERT and grouped
+    into transactions of about commit_rows rows. Each write is atomic:
+    if it fails, none of its rows are kept. Use as a context manager to
+    commit and close at the end:
+
+        with SqliteWriter(db_path) as writer:
+            for df in batches:
+                writer.write(df, "wine")
+
+    Args:
+        db_path (str): path of the sqlite database.
+        commit_rows (int, default DEFAULT_COMMIT_ROWS): rows written
+            before the open transaction is committed.
+        pragmas (dict, default None): pragmas applied on connect, None
+            for DEFAULT_PRAGMAS.
+    """
+
+    def __init__(self,
+                 db_path,
+                 commit_rows=DEFAULT_COMMIT_ROWS,
+                 pragmas=None):
+        self.db_path = db_path
+        self.commit_rows = commit_rows
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cnx = None
+        self._pending_rows = 0
+        self._depth = 0  # nested atomic blocks open
+        self._columns = {}  # table name -> existing column names
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        self.close()
+
+    def open(self):
+        """Connect and apply pragmas.
+
+        Returns:
+            void
+        """
+        try:
+            # transactions are managed explicitly, see write
+            self.cnx = sqlite3.connect(self.db_path, isolation_level=None)
+        except sqlite3.Error as e:
+            print("Failed to connect to sqlite db: {}".format(e))
+            raise
+        for name, value in self.pragmas.items():
+            self.cnx.execute("PRAGMA {} = {}".format(name, value))
+
+    def get_columns(self, table_name):
+        """Column names of an existing table.
+
+        Args:
+            table_name (str): name of the table.
+
+        Returns:
+            columns (list of str): empty if the table does not exist.
+        """
+        if table_name not in self._columns:
+            rows = self.cnx.execute('PRAGMA table_info("{}")'.format(
+                table_name)).fetchall()
+            if not rows:
+                return []
+            self._columns[table_name] = [row[1] for row in rows]
+        return self._columns[table_name]
+
+    def create_table(self, df, table_name):
+        """Create a table with the columns of a data frame.
+
+        Args:
+            df (pd.DataFrame): data frame in the correct table structure.
+            table_name (str): name of the table to create.
+
+        Returns:
+            void
+        """
+        cols = ", ".join('"{}" {}'.format(name, get_sqlite_type(s))
+                         for name, s in df.items())
+        self.cnx.execute('CREATE TABLE IF NOT EXISTS "{}" ({})'.format(
+            table_name, cols))
+        self._columns.pop(table_name, None)
+
+    def write(self, df, table_name):
+        """Append a data frame to a table, creating the table if needed.
+
+        Args:
+            df (pd.DataFrame): data frame in the correct table structure.
+            table_name (str): name of the table to write data to.
+
+        Returns:
+            void
+
+        Raises:
+            sqlite3.OperationalError: if df has a column the table lacks.
+        """
+        with self.atomic(len(df)):
+            if not self.get_columns(table_name):
+                self.create_table(df, table_name)
+            missing = set(df.columns) - set(self.get_columns(table_name))
+            if missing:
+                raise sqlite3.OperationalError(
+                    "table {} has no column named {}".format(
+                        table_name, ", ".join(sorted(missing))))
+
+            sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+                table_name, ", ".join('"{}"'.format(c) for c in df.columns),
+                ", ".join("?" * len(df.columns)))
+            self.cnx.executemany(sql, get_sqlite_rows(df))
+
+    @contextlib.contextmanager
+    def atomic(self, n_rows=0):
+        """Run statements as one unit inside the batched transaction.
+
+        Opens the batched transaction if needed and a savepoint within it.
+        On error everything since the savepoint is undone; otherwise the
+        rows count towards commit_rows. Blocks may be nested, a commit
+        only happens once the outermost block is done.
+
+        Args:
+            n_rows (int, default 0): rows written by the statements.
+
+        Yields:
+            cnx (sqlite3.Connection): the open connection.
+        """
+        if not self.cnx.in_transaction:
+            self.cnx.execute("BEGIN")
+        self.cnx.execute("SAVEPOINT atomic")
+        self._depth += 1
+        try:
+            yield self.cnx
+        except Exception:
+            self.cnx.execute("ROLLBACK TO atomic")
+            self.cnx.execute("RELEASE atomic")
+            raise
+        finally:
+            self._depth -= 1
+        self.cnx.execute("RELEASE atomic")
+
+        self._pending_rows += n_rows
+        if self._depth == 0 and self._pending_rows >= self.commit_rows:
+            self.commit()
+
+    def commit(self):
+        """Commit the open transaction, if any.
+
+        Returns:
+            void
+        """
+        if self.cnx is not None and self.cnx.in_transaction:
+            self.cnx.execute("COMMIT")
+        self._pending_rows = 0
+
+    def close(self):
+        """Roll back anything uncommitted and close the connection.
+
+        Returns:
+            void
+        """
+        if self.cnx is not None:
+            if self.cnx.in_transaction:
+                self.cnx.execute("ROLLBACK")
+            self.cnx.close()
+            self.cnx = None
+
+
+WINE_SCHEMA = [
+    # one row per distinct wine per retailer
+    """
+    CREATE TABLE IF NOT EXISTS product (
+        PRODUCT_ID INTEGER PRIMARY KEY,
+        SRC TEXT NOT NULL,
+        NAME_KEY TEXT NOT NULL,
+        NAME TEXT NOT NULL,
+        FIRST_RUN_ID INTEGER NOT NULL,
+        LAST_RUN_ID INTEGER NOT NULL,
+        UNIQUE (SRC, NAME_KEY)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS run (
+        RUN_ID INTEGER PRIMARY KEY,
+        STARTED_AT TIMESTAMP
+    )
+    """,
+    # clustered on (PRODUCT_ID, RUN_ID), so price history lookups are
+    # served from the table itself
+    """
+    CREATE TABLE IF NOT EXISTS price_observation (
+        PRODUCT_ID INTEGER NOT NULL REFERENCES product (PRODUCT_ID),
+        RUN_ID INTEGER NOT NULL REFERENCES run (RUN_ID),
+        PRICE REAL,
+        BASE_PRICE REAL,
+        IS_ON_SALE INTEGER,
+        QUERY TEXT,
+        AS_OF_DATE TIMESTAMP,
+        PRIMARY KEY (PRODUCT_ID, RUN_ID)
+    ) WITHOUT ROWID
+    """,
+    # PRODUCT_ID is implicitly part of every index of the table above
+    """
+    CREATE INDEX IF NOT EXISTS price_observation_run_sale
+    ON price_observation (RUN_ID, IS_ON_SALE, PRICE, BASE_PRICE)
+    """,
+    # delta storage: one row per product per run of unchanged prices,
+    # VALID_TO_RUN_ID is the first run the row no longer held, NULL while
+    # it is current
+    """
+    CREATE TABLE IF NOT EXISTS price_interval (
+        PRODUCT_ID INTEGER NOT NULL REFERENCES product (PRODUCT_ID),
+        VALID_FROM_RUN_ID INTEGER NOT NULL,
+        VALID_TO_RUN_ID INTEGER,
+        LAST_SEEN_RUN_ID INTEGER NOT NULL,
+        PRICE REAL,
+        BASE_PRICE REAL,
+        IS_ON_SALE INTEGER,
+        PRIMARY KEY (PRODUCT_ID, VALID_FROM_RUN_ID)
+    ) WITHOUT ROWID
+    """,
+    # at most one current row per product; also finds the current rows
+    # without scanning history
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS price_interval_current
+    ON price_interval (PRODUCT_ID) WHERE VALID_TO_RUN_ID IS NULL
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS current_price AS
+    SELECT p.PRODUCT_ID, p.SRC, p.NAME, i.PRICE, i.BASE_PRICE, i.IS_ON_SALE,
+        i.VALID_FROM_RUN_ID, i.LAST_SEEN_RUN_ID
+    FROM price_interval i
+    JOIN product p ON p.PRODUCT_ID = i.PRODUCT_ID
+    WHERE i.VALID_TO_RUN_ID IS NULL
+    """,
+    # pages written by a run, so an interrupted run can be resumed
+    """
+    CREATE TABLE IF NOT EXISTS page_checkpoint (
+        RUN_ID INTEGER NOT NULL REFERENCES run (RUN_ID),
+        RETAILER TEXT NOT NULL,
+        PAGE_KEY TEXT NOT NULL,
+        N_ROWS INTEGER NOT NULL,
+        PRIMARY KEY (RUN_ID, RETAILER, PAGE_KEY)
+    ) WITHOUT ROWID
+    """,
+    # retailers a run scraped to the end, only their prices reach the
+    # aggregates, see complete_retailer
+    """
+    CREATE TABLE IF NOT EXISTS run_retailer (
+        RUN_ID INTEGER NOT NULL REFERENCES run (RUN_ID),
+        SRC TEXT NOT NULL,
+        PRIMARY KEY (RUN_ID, SRC)
+    ) WITHOUT ROWID
+    """,
+    # scraper_metrics.get_rows of every run
+    """
+    CREATE TABLE IF NOT EXISTS run_metric (
+        RUN_ID INTEGER NOT NULL,
+        SITE TEXT NOT NULL,
+        NAME TEXT NOT NULL,
+        KIND TEXT NOT NULL,
+        N INTEGER NOT NULL,
+        TOTAL REAL NOT NULL,
+        P50 REAL,
+        P90 REAL,
+        P99 REAL,
+        MAX REAL,
+        PRIMARY KEY (RUN_ID, SITE, NAME)
+    ) WITHOUT ROWID
+    """,
+    # matching.normalize_names of every product matched so far, products
+    # of the same wine across retailers share the lowest PRODUCT_ID among
+    # them as WINE_ID
+    """
+    CREATE TABLE IF NOT EXISTS product_match_key (
+        PRODUCT_ID INTEGER PRIMARY KEY REFERENCES product (PRODUCT_ID),
+        PRODUCER TEXT NOT NULL,
+        VINTAGE INTEGER,
+        SIZE_ML INTEGER NOT NULL,
+        MATCH_NAME TEXT NOT NULL,
+        WINE_ID INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS product_match_key_wine
+    ON product_match_key (WINE_ID)
+    """,
+    # the best match of a product per other retailer
+    """
+    CREATE TABLE IF NOT EXISTS product_match (
+        PRODUCT_ID INTEGER NOT NULL REFERENCES product (PRODUCT_ID),
+        MATCH_PRODUCT_ID INTEGER NOT NULL REFERENCES product (PRODUCT_ID),
+        SCORE REAL NOT NULL,
+        PRIMARY KEY (PRODUCT_ID, MATCH_PRODUCT_ID)
+    ) WITHOUT ROWID
+    """,
+    # price aggregates, refreshed run by run with refresh_aggregates
+    # sale counts of every retailer in every run
+    """
+    CREATE TABLE IF NOT EXISTS retailer_run_stats (
+        SRC TEXT NOT NULL,
+        RUN_ID INTEGER NOT NULL,
+        N_PRODUCTS INTEGER NOT NULL,
+        N_ON_SALE INTEGER NOT NULL,
+        AVG_DISCOUNT_PCT REAL,
+        PRIMARY KEY (SRC, RUN_ID)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS retailer_latest_run AS
+    SELECT SRC, MAX(RUN_ID) AS RUN_ID FROM retailer_run_stats GROUP BY SRC
+    """,
+    # latest price of every product and the one seen before it; current
+    # if RUN_ID is the latest run of its retailer
+    """
+    CREATE TABLE IF NOT EXISTS product_latest (
+        PRODUCT_ID INTEGER PRIMARY KEY REFERENCES product (PRODUCT_ID),
+        SRC TEXT NOT NULL,
+        RUN_ID INTEGER NOT NULL,
+        PRICE REAL,
+        BASE_PRICE REAL,
+        IS_ON_SALE INTEGER,
+        DISCOUNT_PCT REAL,
+        PREV_RUN_ID INTEGER,
+        PREV_PRICE REAL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS product_latest_run
+    ON product_latest (SRC, RUN_ID)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS product_latest_discount
+    ON product_latest (DISCOUNT_PCT) WHERE DISCOUNT_PCT > 0
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS product_latest_change
+    ON product_latest (SRC, RUN_ID) WHERE PRICE <> PREV_PRICE
+    """,
+    # cheapest current offer of every wine, see matching
+    """
+    CREATE TABLE IF NOT EXISTS wine_price (
+        WINE_ID INTEGER PRIMARY KEY,
+        NAME TEXT NOT NULL,
+        N_OFFERS INTEGER NOT NULL,
+        PRODUCT_ID INTEGER NOT NULL,
+        SRC TEXT NOT NULL,
+        PRICE REAL NOT NULL,
+        MAX_PRICE REAL NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS wine_price_offers
+    ON wine_price (N_OFFERS, PRICE)
+    """,
+    # same columns as the original flat wine table
+    """
+    CREATE VIEW IF NOT EXISTS wine_flat AS
+    SELECT o.RUN_ID, p.NAME, o.PRICE, o.BASE_PRICE, o.IS_ON_SALE, p.SRC,
+        o.QUERY, o.AS_OF_DATE
+    FROM price_observation o
+    JOIN product p ON p.PRODUCT_ID = o.PRODUCT_ID
+    """,
+]
+
+_UPSERT_PRODUCT = """
+INSERT INTO product (SRC, NAME_KEY, NAME, FIRST_RUN_ID, LAST_RUN_ID)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (SRC, NAME_KEY) DO UPDATE SET
+    NAME = excluded.NAME,
+    LAST_RUN_ID = MAX(LAST_RUN_ID, excluded.LAST_RUN_ID)
+"""
+_UPSERT_OBSERVATION = """
+INSERT INTO price_observation (PRODUCT_ID, RUN_ID, PRICE, BASE_PRICE,
+    IS_ON_SALE, QUERY, AS_OF_DATE)
+VALUES ((SELECT PRODUCT_ID FROM product WHERE SRC = ? AND NAME_KEY = ?),
+    ?, ?, ?, ?, ?, ?)
+ON CONFLICT (PRODUCT_ID, RUN_ID) DO UPDATE SET
+    PRICE = excluded.PRICE,
+    BASE_PRICE = excluded.BASE_PRICE,
+    IS_ON_SALE = excluded.IS_ON_SALE,
+    QUERY = excluded.QUERY,
+    AS_OF_DATE = excluded.AS_OF_DATE
+"""
+
+# products of a batch already written by its run, either write mode,
+# parameters (SRC, json array of NAME_KEY, RUN_ID)
+_COUNT_WRITTEN = """
+SELECT COALESCE(SUM(
+    (SELECT COUNT(*) FROM price_observation o
+     WHERE o.PRODUCT_ID = p.PRODUCT_ID AND o.RUN_ID = ?3) +
+    (SELECT COUNT(*) FROM price_interval i
+     WHERE i.PRODUCT_ID = p.PRODUCT_ID AND i.LAST_SEEN_RUN_ID = ?3
+        AND i.VALID_TO_RUN_ID IS NULL)), 0)
+FROM product p
+WHERE p.SRC = ?1 AND p.NAME_KEY IN (SELECT value FROM json_each(?2))
+"""
+
+# the three steps of a delta write, run in this order for every row with
+# parameters (SRC, NAME_KEY, RUN_ID, PRICE, BASE_PRICE, IS_ON_SALE)
+_CLOSE_CHANGED_INTERVAL = """
+UPDATE price_interval SET VALID_TO_RUN_ID = ?3
+WHERE PRODUCT_ID = (SELECT PRODUCT_ID FROM product
+                    WHERE SRC = ?1 AND NAME_KEY = ?2)
+    AND VALID_TO_RUN_ID IS NULL AND VALID_FROM_RUN_ID < ?3
+    AND (PRICE IS NOT ?4 OR BASE_PRICE IS NOT ?5 OR IS_ON_SALE IS NOT ?6)
+"""
+_TOUCH_CURRENT_INTERVAL = """
+UPDATE price_interval
+SET LAST_SEEN_RUN_ID = ?3, PRICE = ?4, BASE_PRICE = ?5, IS_ON_SALE = ?6
+WHERE PRODUCT_ID = (SELECT PRODUCT_ID FROM product
+                    WHERE SRC = ?1 AND NAME_KEY = ?2)
+    AND VALID_TO_RUN_ID IS NULL
+"""
+_OPEN_INTERVAL = """
+INSERT OR IGNORE INTO price_interval (PRODUCT_ID, VALID_FROM_RUN_ID,
+    LAST_SEEN_RUN_ID, PRICE, BASE_PRICE, IS_ON_SALE)
+VALUES ((SELECT PRODUCT_ID FROM product WHERE SRC = ?1 AND NAME_KEY = ?2),
+    ?3, ?3, ?4, ?5, ?6)
+"""
+_CLOSE_MISSING_INTERVALS = """
+UPDATE price_interval SET VALID_TO_RUN_ID = ?
+WHERE VALID_TO_RUN_ID IS NULL AND LAST_SEEN_RUN_ID < ?
+    AND PRODUCT_ID IN (SELECT PRODUCT_ID FROM product WHERE SRC = ?)
+"""
+
+# prices of a run in either write mode, parameter RUN_ID; an interval
+# holds the price of every run from VALID_FROM_RUN_ID to LAST_SEEN_RUN_ID
+_RUN_PRICES = """
+SELECT PRODUCT_ID, PRICE, BASE_PRICE, IS_ON_SALE
+FROM price_observation WHERE RUN_ID = ?1
+UNION ALL
+SELECT PRODUCT_ID, PRICE, BASE_PRICE, IS_ON_SALE
+FROM price_interval WHERE VALID_FROM_RUN_ID <= ?1 AND LAST_SEEN_RUN_ID >= ?1
+"""
+# a partial scrape of a retailer would hide the products it never reached,
+# so only retailers the run completed are aggregated
+_REFRESH_RETAILER_RUN_STATS = """
+INSERT OR REPLACE INTO retailer_run_stats
+SELECT p.SRC, ?1, COUNT(*), COALESCE(SUM(s.IS_ON_SALE), 0),
+    AVG(CASE WHEN s.IS_ON_SALE THEN 100 * (1 - s.PRICE / s.BASE_PRICE) END)
+FROM ({}) s
+JOIN product p ON p.PRODUCT_ID = s.PRODUCT_ID
+JOIN run_retailer c ON c.RUN_ID = ?1 AND c.SRC = p.SRC
+GROUP BY p.SRC
+""".format(_RUN_PRICES)
+# a run older than a product's latest one leaves it alone; refreshing
+# the latest run again keeps the price seen before it
+_REFRESH_PRODUCT_LATEST = """
+INSERT INTO product_latest (PRODUCT_ID, SRC, RUN_ID, PRICE, BASE_PRICE,
+    IS_ON_SALE, DISCOUNT_PCT)
+SELECT s.PRODUCT_ID, p.SRC, ?1, s.PRICE, s.BASE_PRICE, s.IS_ON_SALE,
+    100 * (1 - s.PRICE / NULLIF(s.BASE_PRICE, 0))
+FROM ({}) s
+JOIN product p ON p.PRODUCT_ID = s.PRODUCT_ID
+JOIN run_retailer c ON c.RUN_ID = ?1 AND c.SRC = p.SRC
+WHERE true
+ON CONFLICT (PRODUCT_ID) DO UPDATE SET
+    PREV_RUN_ID = CASE WHEN RUN_ID < excluded.RUN_ID
+        THEN RUN_ID ELSE PREV_RUN_ID END,
+    PREV_PRICE = CASE WHEN RUN_ID < excluded.RUN_ID
+        THEN PRICE ELSE PREV_PRICE END,
+    RUN_ID = excluded.RUN_ID,
+    PRICE = excluded.PRICE,
+    BASE_PRICE = excluded.BASE_PRICE,
+    IS_ON_SALE = excluded.IS_ON_SALE,
+    DISCOUNT_PCT = excluded.DISCOUNT_PCT
+WHERE excluded.RUN_ID >= RUN_ID
+""".format(_RUN_PRICES)
+# the name and retailer of a wine are those of its cheapest offer
+_REBUILD_WINE_PRICE = """
+INSERT INTO wine_price
+SELECT WINE_ID, NAME, N_OFFERS, PRODUCT_ID, SRC, PRICE, MAX_PRICE
+FROM (
+    SELECT COALESCE(k.WINE_ID, l.PRODUCT_ID) AS WINE_ID, p.NAME,
+        l.PRODUCT_ID, l.SRC, l.PRICE,
+        COUNT(*) OVER wine AS N_OFFERS,
+        MAX(l.PRICE) OVER wine AS MAX_PRICE,
+        ROW_NUMBER() OVER (wine ORDER BY l.PRICE, l.PRODUCT_ID) AS RANK
+    FROM retailer_latest_run r
+    JOIN product_latest l ON l.SRC = r.SRC AND l.RUN_ID = r.RUN_ID
+    JOIN product p ON p.PRODUCT_ID = l.PRODUCT_ID
+    LEFT JOIN product_match_key k ON k.PRODUCT_ID = l.PRODUCT_ID
+    WHERE l.PRICE IS NOT NULL
+    WINDOW wine AS (PARTITION BY COALESCE(k.WINE_ID, l.PRODUCT_ID))
+)
+WHERE RANK = 1
+"""
+
+WRITE_FULL = "full"  # a price_observation row per product per run
+WRITE_DELTA = "delta"  # price_interval rows, only on change
+WRITE_MODES = [WRITE_FULL, WRITE_DELTA]
+
+
+def normalize_name(name):
+    """Product key of a wine name: lower case, single spaced.
+
+    Args:
+        name (str): NAME as scraped.
+
+    Returns:
+        name_key (str): normalized name.
+    """
+    return " ".join(name.lower().split())
+
+
+def normalize_names(s):
+    """Vectorized normalize_name.
+
+    Args:
+        s (pd.Series): NAME column as scraped.
+
+    Returns:
+        s (pd.Series): normalized names.
+    """
+    return s.str.lower().str.split().str.join(" ")
+
+
+class WineDbWriter(SqliteWriter):
+    """Writes scraped wine frames into the normalized wine schema.
+
+    Creates WINE_SCHEMA on open: a product dimension keyed by (SRC,
+    normalized NAME), a run table and a price_observation fact table with
+    one row per product per run. Products are upserted, so the product
+    table only grows when a new wine shows up. The wine_flat view gives
+    the original flat wine table layout.
+
+    In WRITE_DELTA mode prices go to price_interval instead, which only
+    gets a new row when a product's price changes; the current_price
+    view gives the latest price of every product still listed.
+
+    Args:
+        db_path (str): path of the sqlite database.
+        commit_rows (int, default DEFAULT_COMMIT_ROWS): rows written
+            before the open transaction is committed.
+        pragmas (dict, default None): pragmas applied on connect, None
+            for DEFAULT_PRAGMAS.
+        write_mode (str, default WRITE_FULL): one of WRITE_MODES, used by
+            write_batch.
+    """
+
+    def __init__(self,
+                 db_path,
+                 commit_rows=DEFAULT_COMMIT_ROWS,
+                 pragmas=None,
+                 write_mode=WRITE_FULL):
+        if write_mode not in WRITE_MODES:
+            raise ValueError("write_mode must be one of {}, got {}".format(
+                WRITE_MODES, write_mode))
+        super().__init__(db_path, commit_rows, pragmas)
+        self.write_mode = write_mode
+
+    def open(self):
+        """Connect, apply pragmas and create the schema.
+
+        Returns:
+            void
+        """
+        super().open()
+        with self.atomic():
+            for statement in WINE_SCHEMA:
+                self.cnx.execute(statement)
+
+    def start_run(self, run_id, started_at=None):
+        """Register a run.
+
+        Args:
+            run_id (int): ID of this run.
+            started_at (pd.Timestamp, default None): start time, now if None.
+
+        Returns:
+            void
+        """
+        started_at = pd.Timestamp.now() if started_at is None else started_at
+        with self.atomic():
+            self.cnx.execute(
+                "INSERT OR IGNORE INTO run (RUN_ID, STARTED_AT) VALUES (?, ?)",
+                (run_id, started_at.strftime(TIMESTAMP_FORMAT)))
+
+    def write_observations(self, df):
+        """Upsert the products of a batch and record their prices.
+
+        Args:
+            df (pd.DataFrame): a batch with "RUN_ID" and
+                ws_const.WINE_SCRAPER_OUTPUT_COLS.
+
+        Returns:
+            n_collapsed (int): rows merged into a product already written
+                by the run, see count_collapsed.
+        """
+        df = df[df["NAME"].notnull()]
+        if df.empty:
+            return 0
+        keys = get_sqlite_values(normalize_names(df["NAME"]))
+        src = get_sqlite_values(df["SRC"])
+        run_id = get_sqlite_values(df["RUN_ID"])
+        with self.atomic(len(df)):
+            n_collapsed = self.count_collapsed(src, keys, run_id[0])
+            self.cnx.executemany(
+                _UPSERT_PRODUCT,
+                zip(src, keys, get_sqlite_values(df["NAME"]), run_id, run_id))
+            observations = df[[
+                "RUN_ID", "PRICE", "BASE_PRICE", "IS_ON_SALE", "QUERY",
+                "AS_OF_DATE"
+            ]]
+            self.cnx.executemany(
+                _UPSERT_OBSERVATION,
+                (key + row for key, row in zip(
+                    zip(src, keys), get_sqlite_rows(observations))))
+        return n_collapsed
+
+    def write_deltas(self, df):
+        """Upsert the products of a batch and record price changes only.
+
+        A product whose price, base price and sale flag match its current
+        price_interval row only has LAST_SEEN_RUN_ID moved forward; a
+        changed or new product closes the current row at this run and
+        opens a new one.
+
+        Args:
+            df (pd.DataFrame): a batch with "RUN_ID" and
+                ws_const.WINE_SCRAPER_OUTPUT_COLS.
+
+        Returns:
+            n_collapsed (int): rows merged into a product already written
+                by the run, see count_collapsed.
+        """
+        df = df[df["NAME"].notnull()]
+        if df.empty:
+            return 0
+        keys = get_sqlite_values(normalize_names(df["NAME"]))
+        src = get_sqlite_values(df["SRC"])
+        run_id = get_sqlite_values(df["RUN_ID"])
+        with self.atomic(len(df)):
+            n_collapsed = self.count_collapsed(src, keys, run_id[0])
+            self.cnx.executemany(
+                _UPSERT_PRODUCT,
+                zip(src, keys, get_sqlite_values(df["NAME"]), run_id, run_id))
+            rows = [
+                key + row for key, row in zip(
+                    zip(src, keys),
+                    get_sqlite_rows(df[[
+                        "RUN_ID", "PRICE", "BASE_PRICE", "IS_ON_SALE"
+                    ]]))
+            ]
+            for statement in [
+                    _CLOSE_CHANGED_INTERVAL, _TOUCH_CURRENT_INTERVAL,
+                    _OPEN_INTERVAL
+            ]:
+                self.cnx.executemany(statement, rows)
+        return n_collapsed
+
+    def close_missing(self, src, run_id):
+        """Close the current rows of products a run no longer lists.
+
+        Only call this once every batch of src for run_id is written, a
+        partial scrape would otherwise close products it never reached.
+
+        Args:
+            src (str): SRC of the retailer that was scraped.
+            run_id (int): ID of the run that completed.
+
+        Returns:
+            void
+        """
+        with self.atomic():
+            self.cnx.execute(_CLOSE_MISSING_INTERVALS, (run_id, run_id, src))
+
+    def complete_retailer(self, src, run_id):
+        """Mark a retailer as completely scraped by a run.
+
+        Only retailers a run completed count in refresh_aggregates, a
+        retailer that failed partway keeps its previous run as its latest.
+        In WRITE_DELTA mode this also closes the products the run no
+        longer lists, see close_missing.
+
+        Args:
+            src (str): SRC of the retailer that was scraped.
+            run_id (int): ID of the run that completed.
+
+        Returns:
+            void
+        """
+        with self.atomic():
+            if self.write_mode == WRITE_DELTA:
+                self.close_missing(src, run_id)
+            self.cnx.execute(
+                "INSERT OR IGNORE INTO run_retailer (RUN_ID, SRC) "
+                "VALUES (?, ?)", (run_id, src))
+
+    def count_collapsed(self, src, keys, run_id):
+        """Rows of a batch that merge into a product already written.
+
+        Products are keyed by (SRC, normalized NAME), so a run keeps a
+        single price per key: rows repeating a key of the same batch, or
+        of an earlier batch of the same run, overwrite that price. Most
+        are the same wine listed under several queries, but e.g. two
+        bottle sizes sharing a name also end up as one product.
+
+        Args:
+            src (list of str): SRC of every row, not yet written.
+            keys (list of str): normalized NAME of every row.
+            run_id (int): ID of the run of the rows.
+
+        Returns:
+            n_rows (int): rows whose price replaces another row's.
+        """
+        distinct = set(zip(src, keys))
+        n_rows = len(keys) - len(distinct)
+        src_keys = {}
+        for s, key in distinct:
+            src_keys.setdefault(s, []).append(key)
+        for s, group in src_keys.items():
+            n_rows += self.cnx.execute(_COUNT_WRITTEN,
+                                       (s, json.dumps(group),
+                                        run_id)).fetchone()[0]
+        return n_rows
+
+    def write_batch(self, df, retailer=None, page_key=None):
+        """Write a batch according to write_mode.
+
+        With a page_key the page is also checkpointed, in the same
+        transaction as its rows, so a checkpoint is only ever committed
+        together with the data of its page. Rows collapsing into a product
+        already written by the run are counted in the "rows_collapsed"
+        metric, see count_collapsed.
+
+        Args:
+            df (pd.DataFrame): a batch with "RUN_ID" and
+                ws_const.WINE_SCRAPER_OUTPUT_COLS.
+            retailer (str, default None): name of the retailer scraped.
+            page_key (str, default None): key of the page the batch came
+                from, see get_completed_pages.
+
+        Returns:
+            void
+        """
+        src = get_batch_src(df)
+        with scraper_metrics.timer("write_seconds", src), self.atomic():
+            if self.write_mode == WRITE_DELTA:
+                n_collapsed = self.write_deltas(df)
+            else:
+                n_collapsed = self.write_observations(df)
+            if page_key is not None:
+                self.cnx.execute(
+                    "INSERT OR REPLACE INTO page_checkpoint "
+                    "VALUES (?, ?, ?, ?)",
+                    (int(df["RUN_ID"].iloc[0]), retailer, page_key,
+                     len(df)))
+        scraper_metrics.inc("rows_written", len(df), src)
+        if n_collapsed:
+            scraper_metrics.inc("rows_collapsed", n_collapsed, src)
+            print("{} rows of {} share a product name with rows already "
+                  "written, only their last price is kept".format(
+                      n_collapsed, src))
+
+    def write_metrics(self, run_id, rows):
+        """Store the metrics of a run, replacing any stored before.
+
+        Args:
+            run_id (int): ID of the run.
+            rows (list of dict): see scraper_metrics.get_rows.
+
+        Returns:
+            void
+        """
+        columns = ["SITE", "NAME", "KIND", "N", "TOTAL", "P50", "P90", "P99",
+                   "MAX"]
+        with self.atomic():
+            self.cnx.executemany(
+                "INSERT OR REPLACE INTO run_metric VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [[run_id] + [r[c] for c in columns] for r in rows])
+
+    def get_completed_pages(self, run_id):
+        """Pages already written by a run.
+
+        Args:
+            run_id (int): ID of the run.
+
+        Returns:
+            pages (dict): retailer name -> set of page keys.
+        """
+        pages = {}
+        for retailer, page_key in self.cnx.execute(
+                "SELECT RETAILER, PAGE_KEY FROM page_checkpoint "
+                "WHERE RUN_ID = ?", (run_id, )):
+            pages.setdefault(retailer, set()).add(page_key)
+        return pages
+
+    def get_unmatched_products(self):
+        """Products not matched yet, see matching.match_new_products.
+
+        Returns:
+            df (pd.DataFrame): "PRODUCT_ID", "SRC" and "NAME", in
+                PRODUCT_ID order.
+        """
+        return pd.read_sql(
+            "SELECT p.PRODUCT_ID, p.SRC, p.NAME FROM product p "
+            "WHERE p.PRODUCT_ID NOT IN "
+            "(SELECT PRODUCT_ID FROM product_match_key) "
+            "ORDER BY p.PRODUCT_ID", self.cnx)
+
+    def get_match_keys(self):
+        """Normalized names of the products matched so far.
+
+        Returns:
+            df (pd.DataFrame): "PRODUCT_ID", "SRC" and the
+                product_match_key columns.
+        """
+        df = pd.read_sql(
+            "SELECT k.PRODUCT_ID, p.SRC, k.PRODUCER, k.VINTAGE, k.SIZE_ML, "
+            "k.MATCH_NAME, k.WINE_ID FROM product_match_key k "
+            "JOIN product p ON p.PRODUCT_ID = k.PRODUCT_ID", self.cnx)
+        return df.astype({"VINTAGE": "Int64"})
+
+    def get_matched_retailers(self):
+        """Retailers every product already has a match at.
+
+        Returns:
+            df (pd.DataFrame): "PRODUCT_ID" and "OTHER_SRC", the SRC of a
+                stored match, one row per product and retailer.
+        """
+        return pd.read_sql(
+            "SELECT m.PRODUCT_ID, p.SRC AS OTHER_SRC FROM product_match m "
+            "JOIN product p ON p.PRODUCT_ID = m.MATCH_PRODUCT_ID "
+            "UNION "
+            "SELECT m.MATCH_PRODUCT_ID, p.SRC FROM product_match m "
+            "JOIN product p ON p.PRODUCT_ID = m.PRODUCT_ID", self.cnx)
+
+    def write_matches(self, keys, pairs, wine_ids=None):
+        """Store a batch of matched products.
+
+        Args:
+            keys (pd.DataFrame): "PRODUCT_ID" and the product_match_key
+                columns of the products matched.
+            pairs (pd.DataFrame): "PRODUCT_ID", "MATCH_PRODUCT_ID" and
+                "SCORE" of the matches found.
+            wine_ids (pd.Series, default None): new WINE_ID of products
+                stored before, indexed by PRODUCT_ID.
+
+        Returns:
+            void
+        """
+        columns = ["PRODUCT_ID", "PRODUCER", "VINTAGE", "SIZE_ML",
+                   "MATCH_NAME", "WINE_ID"]
+        keys = keys[columns].astype({"VINTAGE": object})
+        with self.atomic(len(keys) + len(pairs)):
+            self.cnx.executemany(
+                "INSERT OR REPLACE INTO product_match_key "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                get_sqlite_rows(keys.where(keys.notnull(), None)))
+            self.cnx.executemany(
+                "INSERT OR REPLACE INTO product_match VALUES (?, ?, ?)",
+                get_sqlite_rows(
+                    pairs[["PRODUCT_ID", "MATCH_PRODUCT_ID", "SCORE"]]))
+            if wine_ids is not None:
+                self.cnx.executemany(
+                    "UPDATE product_match_key SET WINE_ID = ? "
+                    "WHERE PRODUCT_ID = ?",
+                    zip(wine_ids.tolist(), wine_ids.index.tolist()))
+        self.commit()
+
+    def refresh_aggregates(self, run_ids=None):
+        """Bring the price aggregates up to date with some runs.
+
+        retailer_run_stats and product_latest only read the prices of the
+        given runs, in either write mode, so a refresh costs one run
+        whatever the history. Only the retailers each run completed are
+        read, see complete_retailer. wine_price is rebuilt from the
+        current rows of product_latest. Refresh after matching, so new
+        matches count.
+        Refreshing a run again, e.g. a resumed one, is safe.
+
+        Args:
+            run_ids (list of int, default None): runs to add, every run
+                newer than the last one refreshed if None.
+
+        Returns:
+            run_ids (list of int): runs refreshed, in order.
+        """
+        if run_ids is None:
+            run_ids = [
+                run_id for run_id, in self.cnx.execute(
+                    "SELECT RUN_ID FROM run WHERE RUN_ID > "
+                    "(SELECT COALESCE(MAX(RUN_ID), -1) "
+                    "FROM retailer_run_stats) ORDER BY RUN_ID")
+            ]
+        with scraper_metrics.timer("aggregate_seconds"), self.atomic():
+            for run_id in sorted(run_ids):
+                self.cnx.execute(_REFRESH_RETAILER_RUN_STATS, (run_id, ))
+                self.cnx.execute(_REFRESH_PRODUCT_LATEST, (run_id, ))
+            self.cnx.execute("DELETE FROM wine_price")
+            self.cnx.execute(_REBUILD_WINE_PRICE)
+        self.commit()
+        return sorted(run_ids)
+
+    def import_flat_table(self, table_name="wine"):
+        """Copy a flat wine table written by older versions.
+
+        Args:
+            table_name (str, default "wine"): table with "RUN_ID" and
+                ws_const.WINE_SCRAPER_OUTPUT_COLS.
+
+        Returns:
+            void
+        """
+        self.commit()
+        self.cnx.create_function("NORMALIZE_NAME",
+                                 1,
+                                 normalize_name,
+                                 deterministic=True)
+        with self.atomic():
+            self.cnx.execute("""
+                INSERT OR IGNORE INTO run (RUN_ID)
+                SELECT DISTINCT RUN_ID FROM "{0}"
+                """.format(table_name))
+            self.cnx.execute("""
+                INSERT INTO product (SRC, NAME_KEY, NAME, FIRST_RUN_ID,
+                    LAST_RUN_ID)
+                SELECT SRC, NORMALIZE_NAME(NAME), MAX(NAME), MIN(RUN_ID),
+                    MAX(RUN_ID)
+                FROM "{0}"
+                WHERE NAME IS NOT NULL
+                GROUP BY SRC, NORMALIZE_NAME(NAME)
+                ON CONFLICT (SRC, NAME_KEY) DO UPDATE SET
+                    FIRST_RUN_ID = MIN(FIRST_RUN_ID, excluded.FIRST_RUN_ID),
+                    LAST_RUN_ID = MAX(LAST_RUN_ID, excluded.LAST_RUN_ID)
+                """.format(table_name))
+            self.cnx.execute("""
+                INSERT OR REPLACE INTO price_observation
+                SELECT p.PRODUCT_ID, w.RUN_ID, w.PRICE, w.BASE_PRICE,
+                    w.IS_ON_SALE, w.QUERY, w.AS_OF_DATE
+                FROM "{0}" w
+                JOIN product p
+                ON p.SRC = w.SRC AND p.NAME_KEY = NORMALIZE_NAME(w.NAME)
+                """.format(table_name))
+        self.commit()
 
 
 def to_sqlite_db(df, table_name, db_path):
     """Writes a dafa frame to the given table and sqlite db.
 
+    Opens a SqliteWriter for a single write; hold one open instead when
+    writing many frames.
+
     Args:
         df (pd.DataFrame): data frame in the correct table structure.
         table_name (str): name of the table to write data to.
@@ -22,13 +1064,41 @@ def to_sqlite_db(df, table_name, db_path):
     Returns:
         void
     """
-    try:
-        cnx = sqlite3.connect(db_path)
-    except ConnectionError as e:
-        print("Failed to connect to sqlite db: {}".format(e))
-        raise
+    with SqliteWriter(db_path) as writer:
+        writer.write(df, table_name)
 
-    df.to_sql(name=table_name, con=cnx, if_exists="append", index=False)
+
+def get_csv_path(basename):
+    """Timestamped csv path in the data directory.
+
+    Args:
+        basename (str): name of the file (no extension) to write data to.
+
+    Returns:
+        path (str): full path of the csv file.
+    """
+    now = pd.to_datetime("today").strftime("%Y%m%d_%H%M%S%f")
+    out_file = "{}_{}.csv".format(basename, now)
+    return os.path.join(settings.DATA_DIRECTORY, out_file)
+
+
+def append_csv(df, path):
+    """Appends a data frame to a csv file, writing the header only once.
+
+    Args:
+        df (pd.DataFrame): data frame in the correct table structure.
+        path (str): full path of the csv file.
+
+    Returns:
+        void
+    """
+    src = get_batch_src(df)
+    with scraper_metrics.timer("write_seconds", src):
+        df.to_csv(path,
+                  mode="a",
+                  header=not os.path.exists(path),
+                  index=False)
+    scraper_metrics.inc("rows_written", len(df), src)
 
 
 def to_csv(df, basename):
@@ -41,6 +1111,194 @@ def to_csv(df, basename):
     Returns:
         void
     """
-    now = pd.to_datetime("today").strftime("%Y%m%d_%H%M%S%f")
-    out_file = "{}_{}.csv".format(basename, now)
-    df.to_csv(os.path.join(settings.DATA_DIRECTORY, out_file), index=False)
+    df.to_csv(get_csv_path(basename), index=False)
+
+
+def to_csv_batches(batches, basename):
+    """Writes data frame batches to a single csv file as they arrive.
+
+    Args:
+        batches (iterable of pd.DataFrame): data frames with the same
+            columns.
+        basename (str): name of the file (no extension) to write data to.
+
+    Returns:
+        path (str): full path of the csv file.
+    """
+    path = get_csv_path(basename)
+    for df in batches:
+        append_csv(df, path)
+    return path
+
+
+def get_parquet_directory():
+    """Root of the partitioned parquet dataset in the data directory.
+
+    Returns:
+        path (str): full path of the dataset directory.
+    """
+    return os.path.join(settings.DATA_DIRECTORY, "wine_parquet")
+
+
+def get_site(src):
+    """Partition name of a retailer, its host without "www.".
+
+    Args:
+        src (str): SRC of a retailer, e.g. "https://www.garyswine.com/".
+
+    Returns:
+        site (str): e.g. "garyswine.com".
+    """
+    return scraper_metrics.get_site(src)
+
+
+def get_batch_src(df):
+    """SRC of a batch, to label its metrics.
+
+    Args:
+        df (pd.DataFrame): a batch, usually from a single retailer.
+
+    Returns:
+        src (str): SRC of the first row, "" if there is none.
+    """
+    if "SRC" not in df or df.empty:
+        return ""
+    return df["SRC"].iloc[0]
+
+
+def get_parquet_frame(df):
+    """Typed copy of a wine frame with the partition columns added.
+
+    Args:
+        df (pd.DataFrame): frame with ws_const.WINE_SCRAPER_OUTPUT_COLS and
+            optionally "RUN_ID".
+
+    Returns:
+        df (pd.DataFrame): frame with PARQUET_DTYPES, "SITE" and "RUN_DATE".
+    """
+    df = df.assign(**{c: to_float64(s) for c, s in df.items()})
+    df = df.astype({c: t for c, t in PARQUET_DTYPES.items() if c in df})
+    sites = {src: get_site(src) for src in df["SRC"].unique()}
+    df["SITE"] = df["SRC"].map(sites).astype("string")
+    df["RUN_DATE"] = df["AS_OF_DATE"].dt.strftime("%Y-%m-%d")
+    return df
+
+
+def to_parquet(df, root=None):
+    """Adds a data frame to the partitioned parquet dataset.
+
+    Files are partitioned by site and run date, e.g.
+    SITE=garyswine.com/RUN_DATE=2020-01-01/part-<uuid>-0.parquet, so every
+    call adds new files and never overwrites earlier ones.
+
+    Args:
+        df (pd.DataFrame): frame with ws_const.WINE_SCRAPER_OUTPUT_COLS and
+            optionally "RUN_ID".
+        root (str, default None): dataset directory, get_parquet_directory()
+            if None.
+
+    Returns:
+        void
+    """
+    if df.empty:
+        return
+    src = get_batch_src(df)
+    with scraper_metrics.timer("write_seconds", src):
+        df = get_parquet_frame(df)
+        df.to_parquet(root or get_parquet_directory(),
+                      engine="pyarrow",
+                      compression=PARQUET_COMPRESSION,
+                      index=False,
+                      partition_cols=PARQUET_PARTITION_COLS,
+                      basename_template="part-{}-{{i}}.parquet".format(
+                          uuid.uuid4().hex),
+                      use_dictionary=True)
+    scraper_metrics.inc("rows_written", len(df), src)
+
+
+def to_parquet_batches(batches, root=None, file_rows=PARQUET_FILE_ROWS):
+    """Writes data frame batches to the parquet dataset as they arrive.
+
+    Batches are buffered up to file_rows rows so the dataset is not split
+    into one small file per page.
+
+    Args:
+        batches (iterable of pd.DataFrame): data frames with the same
+            columns.
+        root (str, default None): dataset directory, get_parquet_directory()
+            if None.
+        file_rows (int, default PARQUET_FILE_ROWS): rows buffered before
+            they are written.
+
+    Returns:
+        root (str): full path of the dataset directory.
+    """
+    root = root or get_parquet_directory()
+    pending = []
+    n_rows = 0
+    for df in batches:
+        pending.append(df)
+        n_rows += len(df)
+        if n_rows >= file_rows:
+            to_parquet(pd.concat(pending, ignore_index=True), root)
+            pending = []
+            n_rows = 0
+    if pending:
+        to_parquet(pd.concat(pending, ignore_index=True), root)
+    return root
+
+
+def read_parquet(root=None,
+                 columns=None,
+                 sites=None,
+                 start_date=None,
+                 end_date=None,
+                 filters=None):
+    """Reads the parquet dataset, only loading what is asked for.
+
+    sites and the dates are pushed down as partition filters, so files of
+    other sites and dates are never opened, and only the given columns
+    are read from the files that are.
+
+    Args:
+        root (str, default None): dataset directory, get_parquet_directory()
+            if None.
+        columns (list of str, default None): columns to load, all if None.
+        sites (list of str, default None): sites to load, see get_site.
+        start_date (str, default None): first run date, "YYYY-MM-DD".
+        end_date (str, default None): last run date, "YYYY-MM-DD".
+        filters (list of tuple, default None): extra pyarrow filters, e.g.
+            [("IS_ON_SALE", "==", True)], applied to row groups.
+
+    Returns:
+        df (pd.DataFrame): matching rows.
+    """
+    filters = list(filters or [])
+    if sites is not None:
+        filters.append(("SITE", "in", list(sites)))
+    if start_date is not None:
+        filters.append(("RUN_DATE", ">=", start_date))
+    if end_date is not None:
+        filters.append(("RUN_DATE", "<=", end_date))
+    return pd.read_parquet(root or get_parquet_directory(),
+                           engine="pyarrow",
+                           columns=columns,
+                           filters=filters or None)
+
+
+def to_file_batches(batches, basename, file_format=FORMAT_CSV):
+    """Writes data frame batches in the chosen file format.
+
+    Args:
+        batches (iterable of pd.DataFrame): data frames with the same
+            columns.
+        basename (str): name of the csv file (no extension), not used for
+            parquet which goes to get_parquet_directory().
+        file_format (str, default FORMAT_CSV): one of FILE_FORMATS.
+
+    Returns:
+        path (str): full path of the csv file or parquet dataset.
+    """
+    if file_format == FORMAT_PARQUET:
+        return to_parquet_batches(batches)
+    return to_csv_batches(batches, basename)
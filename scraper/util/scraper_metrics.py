@@ -0,0 +1,270 @@
+"""Module of run metrics, timers and counters per site and stage.
+
+Every stage of a scrape records here: fetch (latency, bytes, retries,
+cache hits), parse (raw items), transform (metadata, rows parsed and
+dropped) and write. Metrics are keyed by name and site, the host of the
+retailer without "www.", e.g. ("fetch_seconds", "garyswine.com").
+
+    with scraper_metrics.timer("parse_seconds", HTML):
+        df = get_raw_data(html_str)
+    scraper_metrics.inc("rows_parsed", len(df), HTML)
+
+Timers keep every sample so percentiles can be reported. At the end of
+a run get_rows summarizes them, for scraper_io.write_metrics or
+to_prometheus.
+
+"""
+
+# STANDARD LIB
+import contextlib
+import threading
+import time
+import urllib.parse
+import numpy as np
+
+KIND_COUNTER = "counter"
+KIND_TIMER = "timer"
+QUANTILES = [0.5, 0.9, 0.99]
+PROMETHEUS_PREFIX = "scraper_"
+
+_counters = {}  # (name, site) -> [increments, total]
+_samples = {}  # (name, site) -> list of seconds
+_lock = threading.Lock()
+
+
+def get_site(url):
+    """Site label of a link.
+
+    Args:
+        url (str): any link of the site, e.g. a retailer's HTML.
+
+    Returns:
+        site (str): host without "www.", e.g. "garyswine.com".
+    """
+    host = urllib.parse.urlsplit(url).netloc
+    return host[4:] if host.startswith("www.") else host
+
+
+def inc(name, value=1, url=""):
+    """Add to a counter.
+
+    Args:
+        name (str): metric name, e.g. "rows_parsed".
+        value (float, default 1): amount to add.
+        url (str, default ""): link of the site, see get_site.
+
+    Returns:
+        void
+    """
+    key = (name, get_site(url))
+    with _lock:
+        counter = _counters.setdefault(key, [0, 0])
+        counter[0] += 1
+        counter[1] += value
+
+
+def observe(name, seconds, url=""):
+    """Add a sample to a timer.
+
+    Args:
+        name (str): metric name, e.g. "fetch_seconds".
+        seconds (float): duration.
+        url (str, default ""): link of the site, see get_site.
+
+    Returns:
+        void
+    """
+    key = (name, get_site(url))
+    with _lock:
+        _samples.setdefault(key, []).append(seconds)
+
+
+@contextlib.contextmanager
+def timer(name, url=""):
+    """Time the body of a with block, see observe.
+
+    Args:
+        name (str): metric name, e.g. "transform_seconds".
+        url (str, default ""): link of the site, see get_site.
+
+    Yields:
+        void
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, url)
+
+
+def collect():
+    """Copy of everything recorded so far, e.g. to send to another process.
+
+    Returns:
+        recorded (tuple): counters and samples, see merge.
+    """
+    with _lock:
+        return ({k: list(v) for k, v in _counters.items()},
+                {k: list(v) for k, v in _samples.items()})
+
+
+def merge(recorded):
+    """Add metrics recorded elsewhere, e.g. in a parse worker.
+
+    Args:
+        recorded (tuple): what collect returned.
+
+    Returns:
+        void
+    """
+    counters, samples = recorded
+    with _lock:
+        for key, (n, total) in counters.items():
+            counter = _counters.setdefault(key, [0, 0])
+            counter[0] += n
+            counter[1] += total
+        for key, values in samples.items():
+            _samples.setdefault(key, []).extend(values)
+
+
+def reset():
+    """Drop everything recorded.
+
+    Returns:
+        void
+    """
+    with _lock:
+        _counters.clear()
+        _samples.clear()
+
+
+def get_rows():
+    """Summarize every metric.
+
+    Returns:
+        rows (list of dict): one per metric and site, sorted, with SITE,
+            NAME, KIND, N (increments or samples), TOTAL and, for timers,
+            P50, P90, P99 and MAX.
+    """
+    counters, samples = collect()
+    rows = []
+    for (name, site), (n, total) in counters.items():
+        rows.append({
+            "SITE": site,
+            "NAME": name,
+            "KIND": KIND_COUNTER,
+            "N": n,
+            "TOTAL": float(total),
+            "P50": None,
+            "P90": None,
+            "P99": None,
+            "MAX": None
+        })
+    for (name, site), values in samples.items():
+        values = np.asarray(values)
+        p50, p90, p99 = np.quantile(values, QUANTILES)
+        rows.append({
+            "SITE": site,
+            "NAME": name,
+            "KIND": KIND_TIMER,
+            "N": len(values),
+            "TOTAL": float(values.sum()),
+            "P50": float(p50),
+            "P90": float(p90),
+            "P99": float(p99),
+            "MAX": float(values.max())
+        })
+    rows.sort(key=lambda r: (r["SITE"], r["NAME"]))
+    return rows
+
+
+def to_prometheus(rows, run_id=None):
+    """Format metrics in the Prometheus text exposition format.
+
+    Counters become <name>_total, timers summaries with quantiles, e.g.
+    scraper_fetch_seconds{site="garyswine.com",quantile="0.9"} 0.41
+
+    Args:
+        rows (list of dict): see get_rows.
+        run_id (int, default None): added as a run_id label if given.
+
+    Returns:
+        text (str): one sample per line.
+    """
+    lines = []
+    typed = set()
+    # samples of one metric have to be listed together
+    for row in sorted(rows, key=lambda r: (r["NAME"], r["SITE"])):
+        labels = 'site="{}"'.format(row["SITE"])
+        if run_id is not None:
+            labels += ',run_id="{}"'.format(run_id)
+        name = PROMETHEUS_PREFIX + row["NAME"]
+        if row["KIND"] == KIND_COUNTER:
+            name += "_total"
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE {} counter".format(name))
+            lines.append("{}{{{}}} {}".format(name, labels, row["TOTAL"]))
+            continue
+
+        if name not in typed:
+            typed.add(name)
+            lines.append("# TYPE {} summary".format(name))
+        for q in QUANTILES:
+            lines.append('{}{{{},quantile="{}"}} {}'.format(
+                name, labels, q, row["P{:02.0f}".format(q * 100)]))
+        lines.append("{}_sum{{{}}} {}".format(name, labels, row["TOTAL"]))
+        lines.append("{}_count{{{}}} {}".format(name, labels, row["N"]))
+    return "\n".join(lines) + "\n"
+
+
+def format_summary(rows):
+    """Table of the time spent per site and stage, slowest first.
+
+    Args:
+        rows (list of dict): see get_rows.
+
+    Returns:
+        text (str): printable table.
+    """
+    timers = [r for r in rows if r["KIND"] == KIND_TIMER]
+    timers.sort(key=lambda r: -r["TOTAL"])
+    lines = [
+        "{:<22}{:<20}{:>8}{:>10}{:>9}{:>9}".format("site", "stage", "n",
+                                                   "total s", "p50 ms",
+                                                   "p99 ms")
+    ]
+    for r in timers:
+        lines.append("{:<22}{:<20}{:>8}{:>10.2f}{:>9.1f}{:>9.1f}".format(
+            r["SITE"], r["NAME"], r["N"], r["TOTAL"], r["P50"] * 1e3,
+            r["P99"] * 1e3))
+    return "\n".join(lines)
+
+
+def format_memory(rows):
+    """Table of the memory of the scraped frames per site.
+
+    Compares the "frame_bytes" counter, the frames as output, with
+    "frame_bytes_plain", the same frames before their compact dtypes.
+
+    Args:
+        rows (list of dict): see get_rows.
+
+    Returns:
+        text (str): printable table.
+    """
+    totals = {}  # site -> {name: total}
+    for r in rows:
+        if r["NAME"] in ("frame_bytes", "frame_bytes_plain", "rows_parsed"):
+            totals.setdefault(r["SITE"], {})[r["NAME"]] = r["TOTAL"]
+    lines = [
+        "{:<22}{:>10}{:>12}{:>12}{:>8}".format("site", "rows", "plain MiB",
+                                               "frame MiB", "saved")
+    ]
+    for site, t in sorted(totals.items()):
+        plain = t.get("frame_bytes_plain", 0)
+        compact = t.get("frame_bytes", 0)
+        lines.append("{:<22}{:>10.0f}{:>12.2f}{:>12.2f}{:>7.0f}%".format(
+            site, t.get("rows_parsed", 0), plain / 2**20, compact / 2**20,
+            100 * (1 - compact / plain) if plain else 0))
+    return "\n".join(lines)
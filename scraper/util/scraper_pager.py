@@ -0,0 +1,320 @@
+"""Module of pagination tools.
+
+Every retailer exposes its catalog as numbered result pages and the only
+way to find the last page is to query until an empty page comes back,
+or until a page past the first answers 404 or 410.
+Querying one page at a time means a run is dominated by network round
+trips, so the pager here keeps a window of page requests in flight.
+
+"""
+
+# STANDARD LIB
+import asyncio
+import collections
+import concurrent.futures
+import queue
+import threading
+
+# PROJECT LIB
+from scraper.util import scraper_http
+
+DEFAULT_WINDOW = 4  # page requests in flight per catalog
+LOOKAHEAD = 2  # pages held per catalog, in windows, fetched or not
+
+
+def is_past_end(error):
+    """Whether a failed page request means the catalog has ended.
+
+    Sites that page by number may answer scraper_http.END_STATUSES
+    instead of an empty page past the last one. Only pages after the
+    first are checked, a missing first page is still an error.
+
+    Args:
+        error (Exception): raised by a page request.
+
+    Returns:
+        past_end (bool): True if the error is one of END_STATUSES.
+    """
+    return scraper_http.get_error_status(error) in scraper_http.END_STATUSES
+
+
+def resolve(result):
+    """Wait for a page result that may still be parsing.
+
+    Args:
+        result (pd.DataFrame or concurrent.futures.Future): what a query_fn
+            returned.
+
+    Returns:
+        df (pd.DataFrame): the page.
+    """
+    if isinstance(result, concurrent.futures.Future):
+        return result.result()
+    return result
+
+
+def iter_pages(query_fn, keys, window=DEFAULT_WINDOW):
+    """Query pages concurrently and yield results in page order.
+
+    Pages are requested through a sliding window: as soon as the oldest
+    page in the window comes back non-empty, the next key is submitted.
+    Once an empty page is seen no new requests are issued, pages still
+    waiting to start are cancelled and the pages after it are discarded,
+    so at most window - 1 requests are spent past the end of the catalog,
+    LOOKAHEAD * window - 1 while pages wait to be parsed. A 404 or 410 on
+    any page after the first also ends the catalog, see is_past_end.
+
+    Args:
+        query_fn (callable): takes a key and returns a pd.DataFrame, empty
+            when there are no more results.
+        keys (iterable): page keys in order, e.g. page numbers or item
+            offsets. May be infinite.
+        window (int, default DEFAULT_WINDOW): max page requests in flight.
+
+    Yields:
+        df (pd.DataFrame): each non-empty page result, in key order.
+    """
+    for _, df in iter_keyed_pages(query_fn, keys, window):
+        yield df
+
+
+def iter_keyed_pages(query_fn, keys, window=DEFAULT_WINDOW):
+    """Like iter_pages, but yield each page with its key.
+
+    query_fn may also return a concurrent.futures.Future of the page,
+    e.g. from scraper_parse.submit, so a page is parsed while the thread
+    that fetched it fetches the next one. Futures are resolved here, in
+    key order. Only pages being fetched count against the window, pages
+    waiting to be parsed are bounded by scraper_parse and by LOOKAHEAD,
+    which then also bounds the requests spent past the end.
+
+    Args:
+        query_fn (callable): takes a key and returns a pd.DataFrame, empty
+            when there are no more results, or a future of one.
+        keys (iterable): page keys in order. May be infinite.
+        window (int, default DEFAULT_WINDOW): max page requests in flight.
+
+    Yields:
+        key, df (tuple): each non-empty page result and its key, in key
+            order.
+    """
+    keys = iter(keys)
+    is_first = True
+    if window <= 1:
+        for key in keys:
+            try:
+                df = resolve(query_fn(key))
+            except Exception as e:
+                if is_first or not is_past_end(e):
+                    raise
+                return
+            if df.empty:
+                return
+            yield key, df
+            is_first = False
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(window) as executor:
+        pending = collections.deque()
+
+        def fill():
+            # only pages still being fetched count against the window
+            n_fetching = sum(not future.done() for _, future in pending)
+            while n_fetching < window and len(pending) < LOOKAHEAD * window:
+                key = next(keys, None)
+                if key is None:
+                    return
+                pending.append((key, executor.submit(query_fn, key)))
+                n_fetching += 1
+
+        def wait_oldest():
+            # keep fetching while the oldest page is fetched or parsed
+            _, future = pending[0]
+            while True:
+                waiting = future
+                if future.done():
+                    result = future.result()
+                    if (not isinstance(result, concurrent.futures.Future)
+                            or result.done()):
+                        return resolve(result)
+                    waiting = result
+                concurrent.futures.wait(
+                    [waiting] + [f for _, f in pending if not f.done()],
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                fill()
+
+        try:
+            fill()
+            while pending:
+                try:
+                    df = wait_oldest()
+                except Exception as e:
+                    if is_first or not is_past_end(e):
+                        raise
+                    break
+                key, _ = pending.popleft()
+                if df.empty:
+                    break
+                yield key, df
+                is_first = False
+                fill()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+async def iter_keyed_pages_async(query_fn, keys, window=DEFAULT_WINDOW):
+    """Like iter_keyed_pages, but with page requests as asyncio tasks.
+
+    Args:
+        query_fn (coroutine function): takes a key and returns a
+            pd.DataFrame, empty when there are no more results.
+        keys (iterable): page keys in order. May be infinite.
+        window (int, default DEFAULT_WINDOW): max page requests in flight.
+
+    Yields:
+        key, df (tuple): each non-empty page result and its key, in key
+            order.
+    """
+    keys = iter(keys)
+    pending = collections.deque()
+    is_first = True
+
+    def fill():
+        while len(pending) < max(window, 1):
+            key = next(keys, None)
+            if key is None:
+                return
+            pending.append((key, asyncio.ensure_future(query_fn(key))))
+
+    try:
+        fill()
+        while pending:
+            key, task = pending.popleft()
+            try:
+                df = await task
+            except Exception as e:
+                if is_first or not is_past_end(e):
+                    raise
+                break
+            if df.empty:
+                break
+            yield key, df
+            is_first = False
+            fill()
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in pending),
+                             return_exceptions=True)
+
+
+def iter_merged(iterables, max_workers):
+    """Drain several iterators at once, yielding items as they arrive.
+
+    Each iterator runs on a worker thread, at most max_workers at a time,
+    e.g. the page iterators of several catalogs of one site. Items pass
+    through a small queue, so workers wait for a slow consumer. An
+    exception in any iterator is raised here and stops the others.
+
+    Args:
+        iterables (list of iterable): iterators to drain.
+        max_workers (int): iterators drained at the same time.
+
+    Yields:
+        item: items of all iterators, each iterator's in its own order.
+    """
+    items = queue.Queue(maxsize=max(1, max_workers))
+    stop = threading.Event()
+    done = object()  # marks the end of one iterator
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def drain(iterable):
+        if stop.is_set():
+            return
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((done, e))
+            return
+        put((done, None))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max(1, max_workers))
+    try:
+        for iterable in iterables:
+            executor.submit(drain, iterable)
+        remaining = len(iterables)
+        while remaining:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def iter_merged_async(aiterables):
+    """Like iter_merged, but drain async iterators as asyncio tasks.
+
+    Args:
+        aiterables (list of async iterable): async iterators to drain.
+
+    Yields:
+        item: items of all iterators, each iterator's in its own order.
+    """
+    items = asyncio.Queue(maxsize=max(1, len(aiterables)))
+    done = object()  # marks the end of one iterator
+
+    async def drain(aiterable):
+        try:
+            async for item in aiterable:
+                await items.put((item, None))
+        except Exception as e:
+            await items.put((done, e))
+            return
+        await items.put((done, None))
+
+    tasks = [asyncio.ensure_future(drain(a)) for a in aiterables]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item, error = await items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def query_pages(query_fn, keys, window=DEFAULT_WINDOW):
+    """Query pages concurrently until an empty page comes back.
+
+    Args:
+        query_fn (callable): takes a key and returns a pd.DataFrame, empty
+            when there are no more results.
+        keys (iterable): page keys in order.
+        window (int, default DEFAULT_WINDOW): max page requests in flight.
+
+    Returns:
+        all_dfs (list of pd.DataFrame): non-empty page results in key order.
+    """
+    return list(iter_pages(query_fn, keys, window))
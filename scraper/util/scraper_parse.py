@@ -0,0 +1,173 @@
+"""Module of shared page parsing tools.
+
+Parsing a result page is CPU bound and, on the fetching threads, runs
+one page at a time under the GIL while the network sits idle. Retailer
+modules hand every fetched page to submit() or parse() instead of
+parsing it themselves; with workers configured the page is parsed on a
+process pool. submit() returns a future at once, so the fetching thread
+moves on to its next page while scraper_pager resolves the futures in
+page order; the pool's slots bound the pages waiting to be parsed.
+
+"""
+
+# STANDARD LIB
+import concurrent.futures
+import multiprocessing
+import threading
+
+# PROJECT LIB
+from scraper.util import scraper_metrics
+
+DEFAULT_WORKERS = 0  # parse on the calling thread
+PENDING_PER_WORKER = 2  # raw pages waiting per worker before fetchers block
+
+_config = {
+    "workers": DEFAULT_WORKERS,
+    "max_pending": None,  # None for PENDING_PER_WORKER * workers
+}
+_pool = None
+_slots = None  # semaphore bounding the raw pages held by the pool
+_pool_lock = threading.Lock()
+
+
+def configure(workers=None, max_pending=None):
+    """Change the parse worker settings.
+
+    The current pool is shut down and a new one is started on next use.
+    Any argument left as None keeps its current value.
+
+    Args:
+        workers (int, default None): parse processes, 0 to parse on the
+            calling thread.
+        max_pending (int, default None): pages submitted to the pool and
+            not yet parsed; parse() blocks beyond this.
+
+    Returns:
+        void
+    """
+    if workers is not None and workers < 0:
+        raise ValueError("workers must be >= 0, got {}".format(workers))
+    shutdown()
+    with _pool_lock:
+        if workers is not None:
+            _config["workers"] = workers
+        if max_pending is not None:
+            _config["max_pending"] = max_pending
+
+
+def get_pool():
+    """Get the parse pool, starting it on first use.
+
+    Workers are spawned rather than forked, the fetching threads may hold
+    locks at fork time.
+
+    Returns:
+        pool (concurrent.futures.ProcessPoolExecutor or None): None if
+            parsing happens on the calling thread.
+        slots (threading.BoundedSemaphore or None): one slot per page the
+            pool may hold.
+    """
+    global _pool, _slots
+    with _pool_lock:
+        workers = _config["workers"]
+        if workers <= 0:
+            return None, None
+        if _pool is None:
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"))
+            _slots = threading.BoundedSemaphore(
+                _config["max_pending"] or PENDING_PER_WORKER * workers)
+        return _pool, _slots
+
+
+def submit(parse_fn, html_str, *args):
+    """Start parsing a fetched page, on the pool if workers are configured.
+
+    Blocks while the pool already holds max_pending pages, so a fast
+    network cannot pile up unparsed pages in memory. Without workers the
+    page is parsed here and the future returned is already done.
+
+    Args:
+        parse_fn (callable): module level function taking html_str and
+            args, e.g. a retailer's parse_page.
+        html_str (str): html of the page.
+        *args: passed on to parse_fn.
+
+    Returns:
+        future (concurrent.futures.Future): of what parse_fn returns.
+    """
+    future = concurrent.futures.Future()
+    pool, slots = get_pool()
+    if pool is None:
+        try:
+            future.set_result(parse_fn(html_str, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    slots.acquire()
+    try:
+        parsed = pool.submit(parse_recorded, parse_fn, html_str, *args)
+    except BaseException:
+        slots.release()
+        raise
+
+    def done(parsed):
+        slots.release()
+        try:
+            result, recorded = parsed.result()
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        scraper_metrics.merge(recorded)
+        future.set_result(result)
+
+    parsed.add_done_callback(done)
+    return future
+
+
+def parse(parse_fn, html_str, *args):
+    """Parse a fetched page and wait for the result, see submit.
+
+    Args:
+        parse_fn (callable): module level function taking html_str and
+            args, e.g. a retailer's parse_page.
+        html_str (str): html of the page.
+        *args: passed on to parse_fn.
+
+    Returns:
+        result: what parse_fn returns.
+    """
+    return submit(parse_fn, html_str, *args).result()
+
+
+def parse_recorded(parse_fn, html_str, *args):
+    """Run parse_fn in a pool worker, also returning its metrics.
+
+    Args:
+        parse_fn (callable): see parse.
+        html_str (str): html of the page.
+        *args: passed on to parse_fn.
+
+    Returns:
+        result: what parse_fn returns.
+        recorded (tuple): what parse_fn recorded in scraper_metrics, see
+            scraper_metrics.merge.
+    """
+    scraper_metrics.reset()
+    result = parse_fn(html_str, *args)
+    return result, scraper_metrics.collect()
+
+
+def shutdown():
+    """Stop the parse pool, waiting for pages being parsed.
+
+    Returns:
+        void
+    """
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+        _slots = None
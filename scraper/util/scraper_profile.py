@@ -0,0 +1,229 @@
+"""Module of opt-in cpu and memory profiling of a scrape.
+
+Wraps a block, e.g. one retailer's scrape, in cProfile and/or
+tracemalloc and leaves the results in a directory:
+
+    with scraper_profile.profile("garyswine", directory, memory=True):
+        garyswine.scrape()
+
+writes garyswine.pstats, open with pstats or snakeviz, and
+garyswine_memory.txt, the lines that allocated the most, and prints the
+hottest functions.
+
+Pages are fetched and parsed on the pager's threads. From Python 3.12
+cProfile runs on sys.monitoring, one profiler sees every thread and only
+one may be enabled at a time. Before, a profiler only sees the thread
+that enabled it: every thread started inside the block gets a profiler
+of its own and their stats are added together, threads started before
+the block are not seen.
+
+"""
+
+# STANDARD LIB
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+
+# PROJECT LIB
+from scraper.settings import settings
+
+TOP_FUNCTIONS = 15  # hot functions printed per profile
+TOP_ALLOCATIONS = 25  # source lines listed in a memory report
+TRACE_FRAMES = 1  # frames tracemalloc keeps per allocation
+# a profiler only sees its own thread before cProfile moved to
+# sys.monitoring
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+
+def get_profile_directory(run_id):
+    """Directory the profiles of a run are written to.
+
+    Args:
+        run_id (int): ID of the run.
+
+    Returns:
+        path (str): path under settings.DATA_DIRECTORY.
+    """
+    return os.path.join(settings.DATA_DIRECTORY, "profiles", str(run_id))
+
+
+@contextlib.contextmanager
+def profile_threads():
+    """Profile the calling thread and every thread started in the block.
+
+    A profiler can only be turned off from its own thread: with
+    PER_THREAD_PROFILERS, a thread still running after the block keeps
+    its profiler until it exits, but what it records after the block is
+    left out of the stats.
+
+    Yields:
+        stats (list of pstats.Stats): empty, filled in with the stats of
+            each profiler when the block ends, see get_stats.
+    """
+    stats = []
+    profiler = cProfile.Profile()
+    if not PER_THREAD_PROFILERS:
+        profiler.enable()
+        try:
+            yield stats
+        finally:
+            collect(profiler, stats)
+        return
+
+    profilers = [profiler]
+    lock = threading.Lock()
+    is_stopped = False
+
+    def start(*_):
+        # first profile event of a new thread, hand over to a profiler
+        with lock:
+            if is_stopped:
+                sys.setprofile(None)
+                return
+            thread_profiler = cProfile.Profile()
+            profilers.append(thread_profiler)
+            thread_profiler.enable()
+
+    threading.setprofile(start)
+    profiler.enable()
+    try:
+        yield stats
+    finally:
+        profiler.disable()
+        threading.setprofile(None)
+        with lock:
+            is_stopped = True
+            for thread_profiler in profilers:
+                collect(thread_profiler, stats)
+
+
+def collect(profiler, stats):
+    """Stop a profiler and keep its stats so far.
+
+    Args:
+        profiler (cProfile.Profile): profiler to stop.
+        stats (list of pstats.Stats): appended to, unless the profiler
+            saw no calls.
+
+    Returns:
+        void
+    """
+    profiler.create_stats()  # disables it
+    if profiler.stats:
+        stats.append(pstats.Stats(profiler))
+
+
+def get_stats(stats):
+    """Add up the stats of several profilers.
+
+    Args:
+        stats (list of pstats.Stats): see profile_threads.
+
+    Returns:
+        stats (pstats.Stats): combined stats.
+    """
+    total = pstats.Stats()
+    for s in stats:
+        total.add(s)
+    return total
+
+
+def format_hot_functions(stats, n=TOP_FUNCTIONS):
+    """Table of the functions with the most time spent in their own body.
+
+    Built-ins are left out, the threads spend most of their time blocked
+    in them, e.g. waiting on sockets and locks; the stats keep them.
+
+    Args:
+        stats (pstats.Stats): see get_stats.
+        n (int, default TOP_FUNCTIONS): functions to list.
+
+    Returns:
+        text (str): printable table, hottest first.
+    """
+    rows = [item for item in stats.stats.items() if item[0][0] != "~"]
+    rows = sorted(rows, key=lambda item: -item[1][2])[:n]
+    lines = [
+        "{:>10}{:>10}{:>10}  {}".format("ncalls", "tottime", "cumtime",
+                                        "function")
+    ]
+    for (path, line, func), (_, ncalls, tottime, cumtime, _) in rows:
+        lines.append("{:>10}{:>10.3f}{:>10.3f}  {}:{}({})".format(
+            ncalls, tottime, cumtime, os.path.basename(path), line, func))
+    return "\n".join(lines)
+
+
+def format_top_allocations(snapshot, peak, n=TOP_ALLOCATIONS):
+    """Report of the source lines holding the most memory.
+
+    Args:
+        snapshot (tracemalloc.Snapshot): taken at the end of the block.
+        peak (int): peak traced bytes during the block.
+        n (int, default TOP_ALLOCATIONS): lines to list.
+
+    Returns:
+        text (str): printable report, largest first.
+    """
+    snapshot = snapshot.filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.statistics("lineno")
+    lines = [
+        "peak {:.1f} MiB, {:.1f} MiB still allocated".format(
+            peak / 2**20,
+            sum(s.size for s in stats) / 2**20),
+        "{:>10}{:>10}  {}".format("KiB", "blocks", "line")
+    ]
+    for stat in stats[:n]:
+        frame = stat.traceback[0]
+        lines.append("{:>10.1f}{:>10}  {}:{}".format(stat.size / 2**10,
+                                                    stat.count,
+                                                    frame.filename,
+                                                    frame.lineno))
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profile(name, directory, cpu=True, memory=False):
+    """Profile a block and write the results to directory.
+
+    Args:
+        name (str): prefix of the files, e.g. a retailer's module name.
+        directory (str): created if missing, see get_profile_directory.
+        cpu (bool, default True): write <name>.pstats.
+        memory (bool, default False): write <name>_memory.txt.
+
+    Yields:
+        void
+    """
+    os.makedirs(directory, exist_ok=True)
+    if memory:
+        tracemalloc.start(TRACE_FRAMES)
+    try:
+        if cpu:
+            with profile_threads() as thread_stats:
+                yield
+        else:
+            thread_stats = None
+            yield
+        if memory:
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    if thread_stats is not None:
+        stats = get_stats(thread_stats)
+        path = os.path.join(directory, name + ".pstats")
+        stats.dump_stats(path)
+        print("Hot functions of {}, profile in {}".format(name, path))
+        print(format_hot_functions(stats))
+    if memory:
+        path = os.path.join(directory, name + "_memory.txt")
+        with open(path, "w") as f:
+            f.write(format_top_allocations(snapshot, peak) + "\n")
+        print("Memory of {} in {}".format(name, path))
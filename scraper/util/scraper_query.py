@@ -0,0 +1,187 @@
+"""Module of price queries over the wine db.
+
+Answers the usual dashboard questions from the aggregate tables that
+scraper_io.WineDbWriter.refresh_aggregates keeps up to date after every
+run, so no query scans the price history:
+
+    with scraper_query.WineQuery(db_path) as query:
+        query.get_biggest_discounts(limit=20)
+
+A product is current while it was listed in the latest run of its
+retailer. Flat wine tables written by older versions can be moved into
+the wine db with scraper_io.WineDbWriter.import_flat_table.
+
+"""
+
+# STANDARD LIB
+import sqlite3
+import pandas as pd
+
+DEFAULT_LIMIT = 50  # rows returned by the top-N queries
+
+# current rows of product_latest, with the product name
+_CURRENT_PRODUCTS = """
+FROM retailer_latest_run r
+JOIN product_latest l ON l.SRC = r.SRC AND l.RUN_ID = r.RUN_ID
+JOIN product p ON p.PRODUCT_ID = l.PRODUCT_ID
+"""
+
+
+class WineQuery:
+    """Read only connection to the wine db with the price queries.
+
+    Use as a context manager, or call open and close:
+
+        with WineQuery(db_path) as query:
+            query.get_sale_ratios()
+
+    Args:
+        db_path (str): path of the sqlite database.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.cnx = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        """Connect read only.
+
+        Returns:
+            void
+        """
+        self.cnx = sqlite3.connect("file:{}?mode=ro".format(self.db_path),
+                                   uri=True)
+
+    def close(self):
+        """Close the connection.
+
+        Returns:
+            void
+        """
+        if self.cnx is not None:
+            self.cnx.close()
+            self.cnx = None
+
+    def read(self, sql, params=()):
+        """Run a query.
+
+        Args:
+            sql (str): SELECT statement.
+            params (tuple, default ()): its parameters.
+
+        Returns:
+            df (pd.DataFrame): result rows.
+        """
+        return pd.read_sql(sql, self.cnx, params=params)
+
+    def get_cheapest_prices(self, name=None, min_offers=1, limit=None):
+        """Cheapest current offer of every wine.
+
+        Products matched across retailers count as one wine, see
+        matching.
+
+        Args:
+            name (str, default None): only wines whose name contains this,
+                case insensitive.
+            min_offers (int, default 1): only wines offered this many
+                times, e.g. 2 for wines sold by several retailers.
+            limit (int, default None): most rows returned, all if None.
+
+        Returns:
+            df (pd.DataFrame): "WINE_ID", "NAME", "N_OFFERS" and the
+                "PRODUCT_ID", "SRC" and "PRICE" of the cheapest offer, and
+                "MAX_PRICE", by WINE_ID.
+        """
+        sql = "SELECT * FROM wine_price WHERE N_OFFERS >= ?"
+        params = [min_offers]
+        if name is not None:
+            sql += " AND NAME LIKE ?"
+            params.append("%{}%".format(name))
+        sql += " ORDER BY WINE_ID"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.read(sql, params)
+
+    def get_biggest_discounts(self, limit=DEFAULT_LIMIT, src=None):
+        """Current products with the largest discount off BASE_PRICE.
+
+        Args:
+            limit (int, default DEFAULT_LIMIT): most rows returned.
+            src (str, default None): only this retailer's SRC.
+
+        Returns:
+            df (pd.DataFrame): "PRODUCT_ID", "SRC", "NAME", "PRICE",
+                "BASE_PRICE" and "DISCOUNT_PCT", largest discount first.
+        """
+        # walk the discount index from the top, the current run of the
+        # few retailers is looked up per row
+        sql = ("SELECT l.PRODUCT_ID, l.SRC, p.NAME, l.PRICE, l.BASE_PRICE, "
+               "l.DISCOUNT_PCT "
+               "FROM product_latest l INDEXED BY product_latest_discount "
+               "JOIN product p ON p.PRODUCT_ID = l.PRODUCT_ID "
+               "WHERE l.DISCOUNT_PCT > 0 AND l.RUN_ID = "
+               "(SELECT RUN_ID FROM retailer_latest_run r WHERE r.SRC = l.SRC)")
+        params = []
+        if src is not None:
+            sql += " AND l.SRC = ?"
+            params.append(src)
+        sql += " ORDER BY l.DISCOUNT_PCT DESC, l.PRODUCT_ID LIMIT ?"
+        params.append(limit)
+        return self.read(sql, params)
+
+    def get_price_changes(self, src=None, limit=None):
+        """Current products whose price changed since they were last seen.
+
+        Args:
+            src (str, default None): only this retailer's SRC.
+            limit (int, default None): most rows returned, all if None.
+
+        Returns:
+            df (pd.DataFrame): "PRODUCT_ID", "SRC", "NAME", "PREV_RUN_ID",
+                "PREV_PRICE", "RUN_ID", "PRICE" and "CHANGE_PCT", largest
+                change, up or down, first.
+        """
+        sql = ("SELECT l.PRODUCT_ID, l.SRC, p.NAME, l.PREV_RUN_ID, "
+               "l.PREV_PRICE, l.RUN_ID, l.PRICE, "
+               "100 * (l.PRICE / l.PREV_PRICE - 1) AS CHANGE_PCT " +
+               _CURRENT_PRODUCTS + "WHERE l.PRICE <> l.PREV_PRICE")
+        params = []
+        if src is not None:
+            sql += " AND l.SRC = ?"
+            params.append(src)
+        sql += " ORDER BY ABS(CHANGE_PCT) DESC, l.PRODUCT_ID"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.read(sql, params)
+
+    def get_sale_ratios(self, run_id=None):
+        """Share of every retailer's products on sale.
+
+        Args:
+            run_id (int, default None): run to look at, the latest run of
+                each retailer if None.
+
+        Returns:
+            df (pd.DataFrame): "SRC", "RUN_ID", "N_PRODUCTS", "N_ON_SALE",
+                "SALE_RATIO" and "AVG_DISCOUNT_PCT" of the products on
+                sale, by SRC.
+        """
+        sql = ("SELECT s.SRC, s.RUN_ID, s.N_PRODUCTS, s.N_ON_SALE, "
+               "1.0 * s.N_ON_SALE / s.N_PRODUCTS AS SALE_RATIO, "
+               "s.AVG_DISCOUNT_PCT FROM retailer_run_stats s ")
+        if run_id is None:
+            sql += "JOIN retailer_latest_run r USING (SRC, RUN_ID)"
+            params = ()
+        else:
+            sql += "WHERE s.RUN_ID = ?"
+            params = (run_id, )
+        return self.read(sql + " ORDER BY s.SRC", params)
@@ -0,0 +1,204 @@
+"""Module of per-host request throttling tools.
+
+Every host gets a token bucket, so requests to one site are spread out
+to a sustained rate with short bursts, and a circuit breaker, so a site
+that keeps failing is left alone for a while instead of being hammered
+with retries. scraper_http applies both to every network request.
+
+"""
+
+# STANDARD LIB
+import email.utils
+import random
+import threading
+import time
+
+DEFAULT_RATE = 5.0  # sustained requests per second per host
+DEFAULT_BURST = 10  # requests allowed back to back after an idle spell
+DEFAULT_BACKOFF_BASE = 0.5  # seconds before the first retry, doubled after
+DEFAULT_BACKOFF_MAX = 60.0  # cap on a single backoff
+DEFAULT_BREAKER_FAILURES = 8  # consecutive failures that open the circuit
+DEFAULT_BREAKER_RESET = 60.0  # seconds the circuit stays open
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request to a host that keeps failing."""
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    Holds up to burst tokens, refilled at rate tokens per second; every
+    request takes one. Callers that find the bucket empty are given a
+    place in line rather than polling, so waiting threads are served in
+    order at exactly the sustained rate.
+
+    Args:
+        rate (float): tokens added per second, 0 or None for no limit.
+        burst (int): bucket size.
+        clock (callable, default time.monotonic): current time in seconds.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._last = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning how long to wait before using it.
+
+        Returns:
+            wait (float): seconds until the request may be sent.
+        """
+        with self._lock:
+            now = self.clock()
+            wait = max(0.0, self._paused_until - now)
+            if not self.rate:
+                return wait
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def acquire(self):
+        """Block until a request may be sent.
+
+        Returns:
+            void
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every request for a while, e.g. on a Retry-After.
+
+        Args:
+            seconds (float): time from now before the next request.
+
+        Returns:
+            void
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     self.clock() + seconds)
+
+
+class CircuitBreaker:
+    """Stops requests to a host after too many consecutive failures.
+
+    Once open, requests fail fast with CircuitOpenError until reset
+    seconds have passed; then one trial request is let through, and its
+    outcome closes the circuit or opens it again.
+
+    Args:
+        failures (int): consecutive failures that open the circuit.
+        reset (float): seconds the circuit stays open.
+        clock (callable, default time.monotonic): current time in seconds.
+    """
+
+    def __init__(self, failures, reset, clock=time.monotonic):
+        self.failures = failures
+        self.reset = reset
+        self.clock = clock
+        self._failed = 0
+        self._opened_at = None
+        self._trial = False  # a trial request is in flight
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Check that a request may be sent.
+
+        Returns:
+            void
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial or self.clock() - self._opened_at < self.reset:
+                raise CircuitOpenError(
+                    "circuit open after {} consecutive failures".format(
+                        self._failed))
+            self._trial = True
+
+    def record_success(self):
+        """Close the circuit.
+
+        Returns:
+            void
+        """
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release(self):
+        """End a request that has no outcome, e.g. a cancelled one.
+
+        A trial request in flight is given up, the next request after
+        reset tries again.
+
+        Returns:
+            void
+        """
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        """Count a failure, opening the circuit at the threshold.
+
+        Returns:
+            void
+        """
+        with self._lock:
+            self._failed += 1
+            if self._trial or self._failed >= self.failures:
+                self._opened_at = self.clock()
+            self._trial = False
+
+
+def get_backoff(attempt, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_MAX):
+    """Exponential backoff with full jitter.
+
+    A random wait up to base * 2**attempt spreads out the retries of
+    threads that failed at the same moment.
+
+    Args:
+        attempt (int): number of the failed attempt, starting at 0.
+        base (float, default DEFAULT_BACKOFF_BASE): first backoff cap.
+        cap (float, default DEFAULT_BACKOFF_MAX): max backoff.
+
+    Returns:
+        seconds (float): time to wait before the next attempt.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header.
+
+    Args:
+        value (str or None): header value, either seconds or an HTTP date.
+        now (float, default None): current unix time, time.time() if None.
+
+    Returns:
+        seconds (float or None): None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, date.timestamp() - now)
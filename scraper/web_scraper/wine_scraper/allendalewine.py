@@ -3,18 +3,58 @@
 """
 
 # STANDARD LIB
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import itertools
 import re
-import bs4
+import lxml.etree
+import lxml.html
 import pandas as pd
-import requests
 
 # PROJECT LIB
-from scraper.util import scraper_io
-from scraper.web_scraper.wine_scraper import constants as ws_const
+from scraper.util import (scraper_http, scraper_io, scraper_metrics,
+                          scraper_pager, scraper_parse)
+from scraper.web_scraper.wine_scraper import parsing
 
 HTML = "https://www.allendalewine.com/"
 
 RESULTS_PER_PAGE = 100  # easier if constant
+# page size asked for on the first page of a category; the server may
+# cap it, the rest of the category is paged at the size it returned
+MAX_RESULTS_PER_PAGE = 500
+# attrs key of a parsed page: items on the page, before items without a
+# brand are dropped
+N_ITEMS_ATTR = "N_ITEMS"
+CATEGORY_WORKERS = 3  # categories scraped at the same time
+
+# every item starts with an element of this class inside the results list
+ITEM_CLASS = "itemTitle"
+# class of each tagged element -> field, e.g. <span class="brand">Brand</span>
+FIELD_CLASSES = {
+    "brand": "BRAND",
+    "title": "TITLE",
+    "vintageAge": "VINTAGE",
+    "listprice": "BASE_PRICE",
+    "priceSale": "PRICE",
+}
+
+# category pages whose results make up the catalog
+CATEGORY_PAGES = [
+    r"r/Cats/Red%20Wine",  # red wine
+    r"r/Cats/White%20Wine",  # white wine
+    r"results?countryid=&regionid=&catid=1088",  # sparkling wine
+    r"results?countryid=&regionid=&catid=1060",  # dessert wine
+    r"results?countryid=&regionid=&catid=1211",  # rose
+    r"results?countryid=&regionid=&catid=1438",  # rice wine
+    r"results?countryid=&regionid=&catid=1361",  # fruit wine
+    r"results?countryid=&regionid=&catid=1369",  # sangria
+    r"results?countryid=&regionid=&catid=1021"  # non-alcoholic wine
+]
+
+# first paging link, e.g. href="/scan/MM=ab74b62767f10ebd8144523111d08f19:50:
+SESSION_KEY_REGEX = re.compile(r"""href=["'][^"'>]*?scan/MM=(\w*)""")
 
 
 def get_html_format(session, page_name="search"):
@@ -39,52 +79,104 @@ def get_html_format(session, page_name="search"):
     """
     link = HTML + page_name
     print("Making request to {}".format(link))
-    request = session.get(link)
-    soup = bs4.BeautifulSoup(request.text, "lxml")
-    page_links = [
-        a['href'] for a in soup.find_all("a", href=True)
-        if "/scan/MM" in a['href']
-    ]
-
-    if not page_links:  # do this if only one page of results
+    html_str = scraper_http.fetch(link, session=session)
+    return to_html_format(link, html_str)
+
+
+async def get_html_format_async(engine, session, page_name="search"):
+    """Like get_html_format, but on the asyncio fetch engine.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        session (aiohttp.ClientSession): session from engine.new_session.
+        page_name (str, default: "search"): base page to query.
+
+    Returns:
+        html_format (str): returns html base link.
+    """
+    link = HTML + page_name
+    print("Making request to {}".format(link))
+    html_str = await engine.fetch(link, session=session)
+    return to_html_format(link, html_str)
+
+
+def to_html_format(link, html_str):
+    """Html base link format of a fetched base page.
+
+    Args:
+        link (str): link the page was fetched from.
+        html_str (str): html of the page.
+
+    Returns:
+        html_format (str): link with the session key, or link itself if
+            the page has a single page of results.
+    """
+    session_key = get_session_key(html_str)
+
+    if session_key is None:  # do this if only one page of results
         return link
 
-    sample_link = page_links[0]
-    # each session has a unique key, retrieve this
-    # eg. https://www.allendalewine.com/scan/MM=ab74b62767f10ebd8144523111d08f19:50:99:50?mv_more_ip=1&mv_nextpage=results&pf=sql&id=sbI4KBZv
-    session_cache = re.findall(r"scan\/MM=\w*", sample_link)[0]
-    html_format = HTML + session_cache
+    html_format = HTML + "scan/MM=" + session_key
     return html_format
 
 
-def get_html_formats(session):
+def get_session_key(html_str):
+    """Find the session key in the first paging link of a page.
+
+    Stops at the first link, the page is not parsed.
+
+    Args:
+        html_str (str): html of a result page.
+
+    Returns:
+        session_key (str or None): e.g. "ab74b62767f10ebd8144523111d08f19",
+            None if the page has no paging links.
+    """
+    # eg. https://www.allendalewine.com/scan/MM=ab74b62767f10ebd8144523111d08f19:50:99:50?mv_more_ip=1&mv_nextpage=results&pf=sql&id=sbI4KBZv
+    match = SESSION_KEY_REGEX.search(html_str)
+    return match.group(1) if match else None
+
+
+def get_html_formats(session, max_workers=CATEGORY_WORKERS):
     """Derive the html base link formats from an instantiated session.
 
     Loop through all the wine links and modify them to have the session IDs.
+    A session key names the result list of one category on the server,
+    so every category needs its own key, but all of them can live in one
+    site session. The first category page is requested alone to start
+    that session, the others then reuse it and are requested at once.
 
     Args:
         session (request.session): a html request session.
+        max_workers (int, default CATEGORY_WORKERS): category pages
+            requested at the same time.
 
     Returns:
-        all_formats (list of str): returns html base links.
+        all_formats (list of str): returns html base links, in
+            CATEGORY_PAGES order.
     """
-    all_formats = []
-    pages = [
-        r"r/Cats/Red%20Wine",  # red wine
-        r"r/Cats/White%20Wine",  # white wine
-        r"results?countryid=&regionid=&catid=1088",  # sparkling wine
-        r"results?countryid=&regionid=&catid=1060",  # dessert wine
-        r"results?countryid=&regionid=&catid=1211",  # rose
-        r"results?countryid=&regionid=&catid=1438",  # rice wine
-        r"results?countryid=&regionid=&catid=1361",  # fruit wine
-        r"results?countryid=&regionid=&catid=1369",  # sangria
-        r"results?countryid=&regionid=&catid=1021"  # non-alcoholic wine
-    ]
-    for page in pages:
-        html = get_html_format(session, page_name=page)
-        if html is not None:
-            all_formats.append(html)
-    return all_formats
+    first = get_html_format(session, page_name=CATEGORY_PAGES[0])
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        rest = executor.map(lambda page: get_html_format(session, page),
+                            CATEGORY_PAGES[1:])
+        return [first] + list(rest)
+
+
+async def get_html_formats_async(engine, session):
+    """Like get_html_formats, but on the asyncio fetch engine.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        session (aiohttp.ClientSession): session from engine.new_session.
+
+    Returns:
+        all_formats (list of str): returns html base links, in
+            CATEGORY_PAGES order.
+    """
+    first = await get_html_format_async(engine, session, CATEGORY_PAGES[0])
+    rest = await asyncio.gather(*(get_html_format_async(engine, session, page)
+                                  for page in CATEGORY_PAGES[1:]))
+    return [first] + rest
 
 
 def link_generator(html_format,
@@ -120,39 +212,128 @@ def link_generator(html_format,
     return link
 
 
-def query_one_page(session, html_link):
+def query_one_page(session, html_link, as_of_date=None):
     """Query a single web page of a given session and html.
 
     Args:
         session (request.session): a html request session.
         html_link (str): link to the desired page to scrape.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
+
+    Returns:
+        df (pd.DataFrame): returns a dataframe
+            with ws_const.WINE_SCRAPER_OUTPUT_COLS
+    """
+    return submit_one_page(session, html_link, as_of_date).result()
+
+
+def submit_one_page(session, html_link, as_of_date=None):
+    """Fetch a single web page and start parsing it.
+
+    Args:
+        session (request.session): a html request session.
+        html_link (str): link to the desired page to scrape.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
+
+    Returns:
+        future (concurrent.futures.Future): of the page, see
+            scraper_parse.submit.
+    """
+    print("QUERYING items from {}".format(html_link))
+    html_str = scraper_http.fetch(html_link, session=session)
+    return scraper_parse.submit(parse_page, html_str, html_link, as_of_date)
+
+
+async def query_one_page_async(engine, session, html_link, as_of_date=None):
+    """Like query_one_page, but on the asyncio fetch engine.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        session (aiohttp.ClientSession): session from engine.new_session.
+        html_link (str): link to the desired page to scrape.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
 
     Returns:
         df (pd.DataFrame): returns a dataframe
             with ws_const.WINE_SCRAPER_OUTPUT_COLS
     """
     print("QUERYING items from {}".format(html_link))
-    request = session.get(html_link)
-    soup = bs4.BeautifulSoup(request.text, "lxml")
-    results_list = "".join(map(str, soup.find_all(id="itemResultsList")))
-    results_list = results_list.replace("\n", "")
-    results_list = results_list.split("itemTitle")
-    df = pd.DataFrame(results_list, columns=["RAW_DATA_STR"])
+    html_str = await engine.fetch(html_link, session=session)
+    return await engine.parse(parse_page, html_str, html_link, as_of_date)
+
+
+def parse_page(html_str, html_link, as_of_date=None):
+    """Parse a single fetched result page.
+
+    Args:
+        html_str (str): html of the result page.
+        html_link (str): link the page was fetched from.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
+
+    Returns:
+        df (pd.DataFrame): returns a dataframe
+            with ws_const.WINE_SCRAPER_OUTPUT_COLS, the number of items on
+            the page in attrs[N_ITEMS_ATTR].
+    """
+    with scraper_metrics.timer("parse_seconds", HTML):
+        df = get_raw_data(html_str)
     if df.empty:
         print("NO DATA found, returning empty df.")
         return pd.DataFrame()
+    n_items = len(df)
 
     df["SRC"] = HTML
     df["QUERY"] = html_link
-    df["AS_OF_DATE"] = pd.to_datetime("today")
+    df["AS_OF_DATE"] = parsing.get_as_of_date(as_of_date)
 
-    df = get_metadata_from_query_result(df)
+    with scraper_metrics.timer("transform_seconds", HTML):
+        df = get_metadata_from_query_result(df)
+    scraper_metrics.inc("rows_parsed", len(df), HTML)
 
-    df = df[ws_const.WINE_SCRAPER_OUTPUT_COLS]
+    df = parsing.to_output(df, HTML)
+    df.attrs[N_ITEMS_ATTR] = n_items
     return df
 
 
-def query_all_pages(session, html_format):
+def get_raw_data(html_str):
+    """Read the raw fields of every item off a result page.
+
+    Walks the results list once in document order: an ITEM_CLASS element
+    starts a new item and the first FIELD_CLASSES element of each kind
+    gives that field its text.
+
+    Args:
+        html_str (str): html of the result page.
+
+    Returns:
+        df (pd.DataFrame): dataframe with the FIELD_CLASSES fields as
+            text, one row per item, empty if the page has no results.
+    """
+    columns = list(FIELD_CLASSES.values())
+    if not html_str:  # empty on a cache only miss
+        return pd.DataFrame(columns=columns)
+
+    items = []
+    item = None
+    root = lxml.html.fromstring(html_str)
+    for results_list in root.xpath('//*[@id="itemResultsList"]'):
+        for element in results_list.iter(tag=lxml.etree.Element):
+            for name in element.get("class", "").split():
+                if name == ITEM_CLASS:
+                    item = {}
+                    items.append(item)
+                elif name in FIELD_CLASSES and item is not None:
+                    item.setdefault(FIELD_CLASSES[name], element.text or "")
+    return pd.DataFrame(items, columns=columns, dtype=object)
+
+
+def query_all_pages(session,
+                    html_format,
+                    window=scraper_pager.DEFAULT_WINDOW):
     """Query all item pages until no results come back.
 
     For a single html base format, there is an unknown number of items.
@@ -164,76 +345,274 @@ def query_all_pages(session, html_format):
         session (request.session): a html request session.
         html_format (str): the base html link to be modified with the
             item index.
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
 
     Returns:
         res (pd.DataFrame): returns a dataframe of all queries.
     """
-    all_dfs = []
-    min_item = 0
-    max_item = 100
-
-    prev_html_link = None
-    while True:
-        html_link = link_generator(html_format, min_item, max_item)
-        if html_link == prev_html_link:
-            # breaking condition (don't query same link twice)
-            break
-        df = query_one_page(session, html_link)
-        if not df.empty:
-            all_dfs.append(df)
-            min_item += RESULTS_PER_PAGE
-            max_item += RESULTS_PER_PAGE
-        else:
-            break
-        prev_html_link = html_link
-
-    res = pd.concat(all_dfs, ignore_index=True)
-    return res
+    return parsing.concat_output(
+        iter_all_pages(session, html_format, window))
+
+
+def iter_all_pages(session,
+                   html_format,
+                   window=scraper_pager.DEFAULT_WINDOW):
+    """Query all item pages, yielding each page as it comes back.
+
+    Args:
+        session (request.session): a html request session.
+        html_format (str): the base html link to be modified with the
+            item index.
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+
+    Yields:
+        df (pd.DataFrame): one page with ws_const.WINE_SCRAPER_OUTPUT_COLS,
+            in item order.
+    """
+    for _, df in iter_keyed_pages(session, html_format, window):
+        yield df
+
+
+def iter_keyed_pages(session,
+                     html_format,
+                     window=scraper_pager.DEFAULT_WINDOW,
+                     skip_offsets=frozenset(),
+                     as_of_date=None):
+    """Like iter_all_pages, but yield each page with its item offset.
+
+    The first page asks for MAX_RESULTS_PER_PAGE items; the rest of the
+    category is paged at the size the server returned, see
+    get_items_per_page, which cuts the number of requests. Paging stops
+    at the first short or empty page.
+
+    Args:
+        session (request.session): a html request session.
+        html_format (str): the base html link to be modified with the
+            item index.
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+        skip_offsets (set of int, default empty): item offsets of pages
+            not to query.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            the time of this call if None.
+
+    Yields:
+        min_item, df (tuple): item offset of the page and the page with
+            ws_const.WINE_SCRAPER_OUTPUT_COLS, in item order.
+    """
+    as_of_date = parsing.get_as_of_date(as_of_date)
+    df = query_one_page(
+        session, get_page_link(html_format, 0, MAX_RESULTS_PER_PAGE),
+        as_of_date)
+    if df.empty:
+        return
+    if 0 not in skip_offsets:
+        yield 0, df
+    items_per_page = get_items_per_page(df)
+    if is_last_page(df, items_per_page):
+        return
+
+    def query_offset(min_item):
+        return submit_one_page(
+            session, get_page_link(html_format, min_item, items_per_page),
+            as_of_date)
+
+    offsets = get_offsets(html_format, skip_offsets, items_per_page)
+    pages = scraper_pager.iter_keyed_pages(query_offset,
+                                           offsets,
+                                           window=window)
+    with contextlib.closing(pages):  # cancels the pages past the end
+        for min_item, df in pages:
+            yield min_item, df
+            if is_last_page(df, items_per_page):
+                return
+
+
+async def iter_keyed_pages_async(engine,
+                                 session,
+                                 html_format,
+                                 window=scraper_pager.DEFAULT_WINDOW,
+                                 skip_offsets=frozenset(),
+                                 as_of_date=None):
+    """Like iter_keyed_pages, but on the asyncio fetch engine.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        session (aiohttp.ClientSession): session from engine.new_session.
+        html_format (str): the base html link to be modified with the
+            item index.
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+        skip_offsets (set of int, default empty): item offsets of pages
+            not to query.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            the time of this call if None.
+
+    Yields:
+        min_item, df (tuple): item offset of the page and the page with
+            ws_const.WINE_SCRAPER_OUTPUT_COLS, in item order.
+    """
+    as_of_date = parsing.get_as_of_date(as_of_date)
+    df = await query_one_page_async(
+        engine, session, get_page_link(html_format, 0, MAX_RESULTS_PER_PAGE),
+        as_of_date)
+    if df.empty:
+        return
+    if 0 not in skip_offsets:
+        yield 0, df
+    items_per_page = get_items_per_page(df)
+    if is_last_page(df, items_per_page):
+        return
+
+    def query_offset(min_item):
+        return query_one_page_async(
+            engine, session,
+            get_page_link(html_format, min_item, items_per_page), as_of_date)
+
+    offsets = get_offsets(html_format, skip_offsets, items_per_page)
+    pages = scraper_pager.iter_keyed_pages_async(query_offset,
+                                                 offsets,
+                                                 window=window)
+    try:
+        async for min_item, df in pages:
+            yield min_item, df
+            if is_last_page(df, items_per_page):
+                return
+    finally:
+        await pages.aclose()  # cancels the pages past the end
+
+
+def get_item_count(df):
+    """Number of items on a parsed page, dropped ones included.
+
+    Args:
+        df (pd.DataFrame): page from parse_page.
+
+    Returns:
+        n_items (int): items on the page.
+    """
+    return df.attrs.get(N_ITEMS_ATTR, len(df))
+
+
+def get_items_per_page(first_page):
+    """Page size to use after the first page of a category.
+
+    A server that caps the page size returns fewer items than asked for,
+    e.g. 250, and the next page starts right after them.
+
+    Args:
+        first_page (pd.DataFrame): first page, asked for with
+            MAX_RESULTS_PER_PAGE items.
+
+    Returns:
+        items_per_page (int): the items the server returned if more than
+            RESULTS_PER_PAGE, else RESULTS_PER_PAGE.
+    """
+    n_items = get_item_count(first_page)
+    if n_items > RESULTS_PER_PAGE:
+        return n_items
+    return RESULTS_PER_PAGE
+
+
+def is_last_page(df, items_per_page):
+    """Whether a page ends its category.
+
+    Args:
+        df (pd.DataFrame): page from parse_page.
+        items_per_page (int): page size asked for.
+
+    Returns:
+        is_last (bool): True if the page has fewer items.
+    """
+    return get_item_count(df) < items_per_page
+
+
+def get_page_link(html_format, min_item, items_per_page=RESULTS_PER_PAGE):
+    """Link of the result page starting at an item offset.
+
+    Args:
+        html_format (str): the base html link to be modified with the
+            item index.
+        min_item (int): item offset of the page.
+        items_per_page (int, default RESULTS_PER_PAGE): items to return.
+
+    Returns:
+        link (str): returns final html link for querying.
+    """
+    return link_generator(html_format, min_item, min_item + items_per_page,
+                          items_per_page)
+
+
+def get_offsets(html_format,
+                skip_offsets=frozenset(),
+                items_per_page=RESULTS_PER_PAGE):
+    """Item offsets of the result pages after the first page of a category.
+
+    Args:
+        html_format (str): the base html link to be modified with the
+            item index.
+        skip_offsets (set of int, default empty): item offsets of pages
+            not to query.
+        items_per_page (int, default RESULTS_PER_PAGE): page size.
+
+    Returns:
+        offsets (iterator of int): offsets in order, may be infinite.
+    """
+    if link_generator(html_format, 0) == link_generator(html_format, 1):
+        # the link ignores the item index (single page of results),
+        # so don't query the same link twice
+        offsets = []
+    else:
+        offsets = itertools.count(items_per_page, items_per_page)
+    return (o for o in offsets if o not in skip_offsets)
 
 
 def get_metadata_from_query_result(df):
     """Generate metadata from query result dataframe.
 
     Args:
-        df (pd.DataFrame): dataframe with ["RAW_DATA_STR"]
+        df (pd.DataFrame): dataframe from get_raw_data.
 
     Returns:
         df (pd.DataFrame): returns data frame with all parsed metadata.
     """
-    df = df.copy()  # do not modify input
-
-    df["BRAND"] = df["RAW_DATA_STR"].str.findall('(?<=brand">).*?(?=<)')
-    # str.findall returns a list of one element, flatten this
-    df["BRAND"] = df["BRAND"].apply(lambda x: x[0].strip() if x else None)
-    df = df[df["BRAND"].notnull()].copy()
+    is_item = df["BRAND"].notnull()
+    scraper_metrics.inc("rows_dropped", len(df) - is_item.sum(), HTML)
+    df = df[is_item].copy()  # do not modify input
 
-    df["TITLE"] = df["RAW_DATA_STR"].str.findall('(?<=title">).*?(?=<)')
-    df["TITLE"] = df["TITLE"].apply(lambda x: x[0].strip())
+    df["BRAND"] = df["BRAND"].str.strip()
 
-    df["VINTAGE"] = df["RAW_DATA_STR"].str.findall(
-        r'(?<=vintageAge">)\w.*?(?=<)')
+    df["TITLE"] = df["TITLE"].str.strip()
     # some items have no vintage, so can be None
-    df["VINTAGE"] = df["VINTAGE"].apply(lambda x: x[0] if x else None)
+    df["VINTAGE"] = df["VINTAGE"].str.strip().replace("", None)
 
     df["NAME"] = (
         df["BRAND"] + " " + df["TITLE"] + " " +
         df["VINTAGE"].fillna("")).str.strip()  # strip trailing spaces
 
-    df["BASE_PRICE"] = df["RAW_DATA_STR"].str.findall(
-        r'(?<=listprice">\$)\w.*?(?=<)')
-    df["BASE_PRICE"] = df["BASE_PRICE"].apply(
-        lambda x: float(x[0].replace(",", "")) if x else None)
-
-    df["PRICE"] = df["RAW_DATA_STR"].str.findall(
-        r'(?<=priceSale">\$)\w.*?(?=<)')
-    df["PRICE"] = df["PRICE"].apply(lambda x: float(x[0].replace(",", ""))
-                                    if x else None)
+    df["BASE_PRICE"] = get_price(df["BASE_PRICE"])
+    df["PRICE"] = get_price(df["PRICE"])
     df["PRICE"] = df["PRICE"].where(df["PRICE"].notnull(), df["BASE_PRICE"])
 
     df["IS_ON_SALE"] = df["BASE_PRICE"] > df["PRICE"]
     return df
 
 
+def get_price(s):
+    """Convert price texts like "$1,299.99" to floats.
+
+    Args:
+        s (pd.Series): price texts, missing values allowed.
+
+    Returns:
+        s (pd.Series): float prices, NaN where there is no "$" amount.
+    """
+    s = s.str.strip()
+    return parsing.to_price(s.where(s.str.startswith("$", na=False)).str[1:])
+
+
 def scrape_one_page(min_item=0,
                     max_item=RESULTS_PER_PAGE,
                     items_per_page=RESULTS_PER_PAGE):
@@ -249,28 +628,142 @@ def scrape_one_page(min_item=0,
         df (pd.DataFrame): returns a dataframe
             with ws_const.WINE_SCRAPER_OUTPUT_COLS
     """
-    session = requests.session()
+    session = scraper_http.new_session()
     html_format = get_html_format(session)
     html_link = link_generator(html_format, min_item, max_item, items_per_page)
     df = query_one_page(session, html_link)
     return df
 
 
-def scrape():
+def scrape(window=scraper_pager.DEFAULT_WINDOW):
     """Scrape all pages.
 
+    Args:
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+
     Returns:
         df (pd.DataFrame): returns a dataframe
             with ws_const.WINE_SCRAPER_OUTPUT_COLS
     """
-    all_dfs = []
-    session = requests.session()
-    for html_format in get_html_formats(session):
-        df = query_all_pages(session, html_format)
-        all_dfs.append(df)
-    df = pd.concat(all_dfs, ignore_index=True)
+    df = parsing.concat_output(df for _, df in scrape_batches(window))
     return df
 
 
+def scrape_batches(window=scraper_pager.DEFAULT_WINDOW, skip_pages=None):
+    """Scrape all pages, one batch per page.
+
+    Only the pages in flight are held in memory, so batches can be
+    written out as they arrive instead of building the whole catalog.
+    Up to CATEGORY_WORKERS categories are paged at the same time, so
+    batches of different categories arrive interleaved.
+
+    Args:
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight per category.
+        skip_pages (set of str, default None): page keys already scraped,
+            e.g. by an interrupted run, these are not queried again.
+
+    Yields:
+        page_key, df (tuple): "<category page>:<item offset>" and the page
+            with ws_const.WINE_SCRAPER_OUTPUT_COLS, all with the AS_OF_DATE
+            of this call.
+    """
+    as_of_date = pd.Timestamp.now()
+    session = scraper_http.new_session()
+    html_formats = get_html_formats(session)
+    yield from scraper_pager.iter_merged([
+        iter_category_pages(session, category, html_format, window,
+                            skip_pages, as_of_date)
+        for category, html_format in zip(CATEGORY_PAGES, html_formats)
+    ], CATEGORY_WORKERS)
+
+
+async def scrape_batches_async(engine,
+                               window=scraper_pager.DEFAULT_WINDOW,
+                               skip_pages=None):
+    """Like scrape_batches, but on the asyncio fetch engine.
+
+    Every category is paged at the same time.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight per category.
+        skip_pages (set of str, default None): page keys already scraped.
+
+    Yields:
+        page_key, df (tuple): "<category page>:<item offset>" and the page
+            with ws_const.WINE_SCRAPER_OUTPUT_COLS.
+    """
+    as_of_date = pd.Timestamp.now()
+    async with engine.new_session() as session:
+        html_formats = await get_html_formats_async(engine, session)
+
+        async def iter_category(category, html_format):
+            prefix = category + ":"
+            async for min_item, df in iter_keyed_pages_async(
+                    engine, session, html_format, window,
+                    get_skip_offsets(prefix, skip_pages), as_of_date):
+                yield prefix + str(min_item), df
+
+        async for item in scraper_pager.iter_merged_async([
+                iter_category(category, html_format)
+                for category, html_format in zip(CATEGORY_PAGES, html_formats)
+        ]):
+            yield item
+
+
+def iter_category_pages(session,
+                        category,
+                        html_format,
+                        window,
+                        skip_pages,
+                        as_of_date=None):
+    """Page through one category, keying pages by category and offset.
+
+    Session keys change between runs, so pages are keyed by category.
+
+    Args:
+        session (request.session): a html request session.
+        category (str): one of CATEGORY_PAGES.
+        html_format (str): the category's base html link.
+        window (int): max page requests in flight.
+        skip_pages (set of str or None): page keys already scraped.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            the time of this call if None.
+
+    Yields:
+        page_key, df (tuple): "<category page>:<item offset>" and the page.
+    """
+    prefix = category + ":"
+    for min_item, df in iter_keyed_pages(session, html_format, window,
+                                         get_skip_offsets(prefix, skip_pages),
+                                         as_of_date):
+        yield prefix + str(min_item), df
+
+
+def get_skip_offsets(prefix, skip_pages):
+    """Item offsets of the already scraped pages of one category.
+
+    Args:
+        prefix (str): "<category page>:".
+        skip_pages (set of str or None): page keys already scraped.
+
+    Returns:
+        skip_offsets (set of int): offsets not to query again.
+    """
+    return {
+        int(key[len(prefix):])
+        for key in skip_pages or () if key.startswith(prefix)
+    }
+
+
 if __name__ == "__main__":
-    scraper_io.to_csv(scrape(), "allendalewine_catalog")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format",
+                        choices=scraper_io.FILE_FORMATS,
+                        default=scraper_io.FORMAT_CSV)
+    args = parser.parse_args()
+    scraper_io.to_file_batches((df for _, df in scrape_batches()),
+                               "allendalewine_catalog", args.format)
@@ -5,3 +5,13 @@
 WINE_SCRAPER_OUTPUT_COLS = [
     "NAME", "PRICE", "BASE_PRICE", "IS_ON_SALE", "SRC", "QUERY", "AS_OF_DATE"
 ]
+# compact dtypes of the output columns, see parsing.to_output
+WINE_SCRAPER_OUTPUT_DTYPES = {
+    "NAME": "str",
+    "PRICE": "float32",  # exact to the cent below $131,072 (2**17)
+    "BASE_PRICE": "float32",
+    "IS_ON_SALE": "bool",
+    "SRC": "category",  # one value per retailer
+    "QUERY": "category",  # one value per page
+    "AS_OF_DATE": "datetime64[us]",  # one value per run
+}
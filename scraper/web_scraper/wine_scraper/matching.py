@@ -0,0 +1,356 @@
+"""Cross retailer product matching.
+
+Every retailer formats NAME its own way, e.g. "Caymus Cabernet Sauvignon
+2019" and "CAYMUS Cabernet Sauvignon Napa 2019 750ml". normalize_names
+splits a NAME into the fields that identify a wine:
+
+    PRODUCER    first word of the name, two after a prefix like
+                "chateau", as allendalewine puts BRAND first
+    VINTAGE     year, missing for non vintage wines
+    SIZE_ML     bottle size, 750 unless the name says otherwise
+    MATCH_NAME  the rest: lower case ascii words, common abbreviations
+                spelled out
+
+Two products of different retailers match if producer, vintage and size
+are equal and their MATCH_NAME words overlap by at least MIN_SCORE
+(Jaccard). Candidate pairs come from a blocking index of the words
+instead of all pairs: only products sharing a word are compared, where
+words listed by more than MAX_TOKEN_PRODUCTS products, e.g. "cabernet",
+do not count as shared. New products are compared in vectorized batches
+of BATCH_PRODUCTS. A pair is kept if each product is the best match
+of the other among the products of its retailer. A product matched at a
+retailer keeps that match: the wines of stored matches are merged
+already, so later, even better, candidates at the retailer are dropped.
+
+Matched products are persisted through scraper_io.WineDbWriter, so a run
+only matches the products that are new since the last one. Products of
+the same wine share a WINE_ID, the lowest PRODUCT_ID among them.
+
+"""
+
+# STANDARD LIB
+import pandas as pd
+
+# PROJECT LIB
+from scraper.util import scraper_metrics
+
+MIN_SCORE = 0.5  # share of the MATCH_NAME words two products must have
+MAX_TOKEN_PRODUCTS = 500  # words in more products than this do not block
+BATCH_PRODUCTS = 2000  # new products matched per vectorized batch
+DEFAULT_SIZE_ML = 750
+# keys compared for every candidate pair
+KEY_DTYPES = {
+    "PRODUCT_ID": "int64",
+    "SRC": "category",
+    "PRODUCER": "category",
+    "VINTAGE": "Int64",
+    "SIZE_ML": "int64",
+    "MATCH_NAME": "str",
+    "WINE_ID": "int64",
+    "IS_NEW": "bool",
+}
+
+VINTAGE_REGEX = r"\b((?:19|20)\d{2})\b"
+SIZE_REGEX = r"\b(\d+(?:\.\d+)?)\s*(ml|cl|lt|ltr|liter|litre|l)\b"
+SIZE_UNITS_ML = {
+    "ml": 1,
+    "cl": 10,
+    "lt": 1000,
+    "ltr": 1000,
+    "liter": 1000,
+    "litre": 1000,
+    "l": 1000,
+}
+SIZE_WORDS_REGEX = r"\b(double magnum|magnum|jeroboam|half bottle|split)\b"
+SIZE_WORDS_ML = {
+    "double magnum": 3000,
+    "magnum": 1500,
+    "jeroboam": 3000,
+    "half bottle": 375,
+    "split": 187,
+}
+ABBREVIATIONS = {
+    "ch": "chateau",
+    "chat": "chateau",
+    "dom": "domaine",
+    "st": "saint",
+    "ste": "sainte",
+    "mt": "mount",
+    "cab": "cabernet",
+    "sauv": "sauvignon",
+}
+PRODUCER_PREFIXES = {
+    "bodega", "bodegas", "cantina", "casa", "castello", "chateau", "clos",
+    "domaine", "maison", "quinta", "tenuta", "weingut"
+}
+STOP_TOKENS = {
+    "and", "bottle", "de", "del", "des", "di", "du", "el", "la", "le", "les",
+    "nv", "the", "wine"
+}
+
+
+def normalize_names(names):
+    """Split names into the fields products are matched on.
+
+    Args:
+        names (pd.Series): NAME as scraped, missing values allowed.
+
+    Returns:
+        df (pd.DataFrame): same index as names, with "PRODUCER",
+            "VINTAGE" (nullable int), "SIZE_ML" and "MATCH_NAME".
+    """
+    s = (names.fillna("").str.normalize("NFKD").str.encode(
+        "ascii", "ignore").str.decode("ascii").str.lower())
+
+    vintage = pd.to_numeric(s.str.extract(VINTAGE_REGEX, expand=False))
+    size = s.str.extract(SIZE_REGEX)
+    size_ml = pd.to_numeric(size[0]) * size[1].map(SIZE_UNITS_ML)
+    size_ml = size_ml.fillna(
+        s.str.extract(SIZE_WORDS_REGEX, expand=False).map(SIZE_WORDS_ML))
+
+    text = s
+    for regex in [VINTAGE_REGEX, SIZE_REGEX, SIZE_WORDS_REGEX, r"[^a-z0-9]+"]:
+        text = text.str.replace(regex, " ", regex=True)
+    for short, word in ABBREVIATIONS.items():
+        text = text.str.replace(r"\b{}\b".format(short), word, regex=True)
+    text = text.str.replace(r"\b(?:{})\b".format("|".join(STOP_TOKENS)),
+                            " ",
+                            regex=True)
+    match_name = text.str.split().str.join(" ")
+
+    first = match_name.str.split(" ", n=2, expand=True)
+    first = first.reindex(columns=[0, 1])
+    producer = first[0].where(
+        ~first[0].isin(PRODUCER_PREFIXES) | first[1].isnull(),
+        first[0] + " " + first[1])
+
+    return pd.DataFrame({
+        "PRODUCER": producer.fillna(""),
+        "VINTAGE": vintage.astype("Int64"),
+        "SIZE_ML": size_ml.fillna(DEFAULT_SIZE_ML).round().astype("int64"),
+        "MATCH_NAME": match_name,
+    })
+
+
+def get_token_index(keys):
+    """Word index, the distinct MATCH_NAME words of every product.
+
+    Args:
+        keys (pd.DataFrame): "MATCH_NAME" indexed by "PRODUCT_ID".
+
+    Returns:
+        index (pd.DataFrame): "PRODUCT_ID", "TOKEN" and "N_PRODUCTS", the
+            number of products listing the word, one row per product and
+            word.
+    """
+    tokens = keys["MATCH_NAME"].str.split().explode().dropna()
+    index = pd.DataFrame({
+        "PRODUCT_ID": tokens.index,
+        "TOKEN": tokens.to_numpy()
+    }).drop_duplicates(ignore_index=True)
+    index["N_PRODUCTS"] = index["TOKEN"].map(index["TOKEN"].value_counts())
+    return index
+
+
+def get_matches(product_ids,
+                keys,
+                index,
+                min_score=MIN_SCORE,
+                max_products=MAX_TOKEN_PRODUCTS,
+                matched=None):
+    """Best matches of some products, at most one per retailer.
+
+    Candidates are the products sharing a blocking word with one of
+    product_ids, among the stored products and product_ids themselves.
+    A pair within product_ids is only looked at from its lower
+    PRODUCT_ID, so a batch sees each of its pairs once. A pair is not a
+    candidate if either product already has a match at the other's
+    retailer. The score counts every word, blocking or not.
+
+    Args:
+        product_ids (array like): products to match.
+        keys (pd.DataFrame): "SRC", normalize_names fields, "N_TOKENS"
+            and "IS_NEW" of every product, indexed by "PRODUCT_ID".
+        index (pd.DataFrame): see get_token_index.
+        min_score (float, default MIN_SCORE): lowest score kept.
+        max_products (int, default MAX_TOKEN_PRODUCTS): words listed by
+            more products than this do not make candidates.
+        matched (pd.DataFrame, default None): "PRODUCT_ID" and
+            "OTHER_SRC" of the matches found so far, see get_match_ends.
+            "SRC" of keys has to be categorical.
+
+    Returns:
+        pairs (pd.DataFrame): "PRODUCT_ID", "MATCH_PRODUCT_ID" and
+            "SCORE", the pairs that are the best of both their products
+            for the other product's retailer, highest score first.
+    """
+    blocking = index.loc[index["N_PRODUCTS"] <= max_products,
+                         ["PRODUCT_ID", "TOKEN"]]
+    pairs = blocking[blocking["PRODUCT_ID"].isin(product_ids)].merge(
+        blocking.rename(columns={"PRODUCT_ID": "MATCH_PRODUCT_ID"}),
+        on="TOKEN")
+    pairs = pairs[["PRODUCT_ID", "MATCH_PRODUCT_ID"]].drop_duplicates(
+        ignore_index=True)
+
+    a = keys.loc[pairs["PRODUCT_ID"]].reset_index(drop=True)
+    b = keys.loc[pairs["MATCH_PRODUCT_ID"]].reset_index(drop=True)
+    is_candidate = ((a["SRC"] != b["SRC"]) & (a["PRODUCER"] == b["PRODUCER"])
+                    & (a["SIZE_ML"] == b["SIZE_ML"])
+                    & (a["VINTAGE"].fillna(0) == b["VINTAGE"].fillna(0))
+                    & (~b["IS_NEW"] |
+                       ((pairs["MATCH_PRODUCT_ID"] > pairs["PRODUCT_ID"])
+                        & pairs["MATCH_PRODUCT_ID"].isin(product_ids))))
+    if matched is not None and not matched.empty:
+        # (product, retailer) pairs as single ints, for a fast isin
+        categories = keys["SRC"].cat.categories
+        n_src = len(categories)
+        matched = (matched["PRODUCT_ID"].to_numpy() * n_src +
+                   categories.get_indexer(matched["OTHER_SRC"]))
+        is_candidate &= ~(
+            (pairs["PRODUCT_ID"] * n_src + b["SRC"].cat.codes).isin(matched)
+            | (pairs["MATCH_PRODUCT_ID"] * n_src +
+               a["SRC"].cat.codes).isin(matched))
+    pairs["N_TOKENS"] = a["N_TOKENS"] + b["N_TOKENS"]
+    pairs["SRC"] = a["SRC"]
+    pairs["MATCH_SRC"] = b["SRC"]
+    pairs = pairs[is_candidate.to_numpy()]
+
+    words = index[["PRODUCT_ID", "TOKEN"]]
+    shared = pairs[["PRODUCT_ID", "MATCH_PRODUCT_ID"]].merge(
+        words, on="PRODUCT_ID").merge(
+            words.rename(columns={"PRODUCT_ID": "MATCH_PRODUCT_ID"}),
+            on=["MATCH_PRODUCT_ID", "TOKEN"])
+    shared = shared.groupby(["PRODUCT_ID", "MATCH_PRODUCT_ID"]).size()
+    pairs = pairs.join(shared.rename("SHARED"),
+                       on=["PRODUCT_ID", "MATCH_PRODUCT_ID"])
+    pairs["SCORE"] = pairs["SHARED"] / (pairs["N_TOKENS"] - pairs["SHARED"])
+    pairs = pairs[pairs["SCORE"] >= min_score]
+
+    # keep a pair if it is the best of both its products for the other's
+    # retailer, looking at every pair from both ends
+    pairs = pairs.sort_values(["SCORE", "PRODUCT_ID", "MATCH_PRODUCT_ID"],
+                              ascending=[False, True, True],
+                              ignore_index=True)
+    ends = pd.concat([
+        pd.DataFrame({
+            "PAIR": pairs.index,
+            "PRODUCT_ID": pairs["PRODUCT_ID"],
+            "OTHER_SRC": pairs["MATCH_SRC"]
+        }),
+        pd.DataFrame({
+            "PAIR": pairs.index,
+            "PRODUCT_ID": pairs["MATCH_PRODUCT_ID"],
+            "OTHER_SRC": pairs["SRC"]
+        })
+    ]).sort_values("PAIR", kind="stable")
+    is_worse = ends.duplicated(["PRODUCT_ID", "OTHER_SRC"])
+    pairs = pairs.drop(ends.loc[is_worse.to_numpy(), "PAIR"].unique())
+    return pairs[["PRODUCT_ID", "MATCH_PRODUCT_ID",
+                  "SCORE"]].reset_index(drop=True)
+
+
+def get_match_ends(pairs, keys):
+    """Both ends of some matches, as get_matches takes them.
+
+    Args:
+        pairs (pd.DataFrame): see get_matches.
+        keys (pd.DataFrame): "SRC" indexed by "PRODUCT_ID".
+
+    Returns:
+        matched (pd.DataFrame): "PRODUCT_ID" and "OTHER_SRC", two rows
+            per pair.
+    """
+    src = keys["SRC"]
+    return pd.DataFrame({
+        "PRODUCT_ID":
+        pd.concat([pairs["PRODUCT_ID"], pairs["MATCH_PRODUCT_ID"]],
+                  ignore_index=True),
+        "OTHER_SRC":
+        pd.concat([
+            src.loc[pairs["MATCH_PRODUCT_ID"]], src.loc[pairs["PRODUCT_ID"]]
+        ],
+                  ignore_index=True).astype(str)
+    })
+
+
+def get_wine_ids(wine_ids, pairs):
+    """Merge the wines of matched products.
+
+    Args:
+        wine_ids (pd.Series): WINE_ID indexed by PRODUCT_ID, covering
+            every product in pairs.
+        pairs (pd.DataFrame): see get_matches.
+
+    Returns:
+        wine_ids (pd.Series): the lowest WINE_ID of each group of
+            connected wines, same index.
+    """
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            x = parent[x]
+        return x
+
+    for a, b in zip(wine_ids.loc[pairs["PRODUCT_ID"]],
+                    wine_ids.loc[pairs["MATCH_PRODUCT_ID"]]):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    if not parent:
+        return wine_ids
+    roots = {wine_id: find(wine_id) for wine_id in parent}
+    return wine_ids.map(roots).fillna(wine_ids).astype("int64")
+
+
+def match_new_products(writer, batch_size=BATCH_PRODUCTS):
+    """Match the products no earlier call has matched, and store them.
+
+    Each batch is stored on its own, so an interrupted call keeps the
+    batches it finished.
+
+    Args:
+        writer (scraper_io.WineDbWriter): open wine db.
+        batch_size (int, default BATCH_PRODUCTS): new products matched
+            per batch.
+
+    Returns:
+        n_products (int): products matched.
+        n_pairs (int): matches found.
+    """
+    with scraper_metrics.timer("match_seconds"):
+        new = writer.get_unmatched_products()
+        if new.empty:
+            return 0, 0
+        new = pd.concat([new[["PRODUCT_ID", "SRC"]],
+                         normalize_names(new["NAME"])],
+                        axis=1)
+        new["WINE_ID"] = new["PRODUCT_ID"]
+        keys = pd.concat([
+            writer.get_match_keys().assign(IS_NEW=False),
+            new.assign(IS_NEW=True)
+        ]).astype(KEY_DTYPES).set_index("PRODUCT_ID").sort_index()
+        index = get_token_index(keys)
+        keys["N_TOKENS"] = index.groupby("PRODUCT_ID").size().reindex(
+            keys.index, fill_value=0)
+
+        matched = [writer.get_matched_retailers()]
+        n_pairs = 0
+        for start in range(0, len(new), batch_size):
+            batch_ids = new["PRODUCT_ID"].iloc[start:start + batch_size]
+            pairs = get_matches(batch_ids,
+                                keys,
+                                index,
+                                matched=pd.concat(matched, ignore_index=True))
+            wine_ids = get_wine_ids(keys["WINE_ID"], pairs)
+            is_changed = ~keys["IS_NEW"] & (wine_ids != keys["WINE_ID"])
+            keys["WINE_ID"] = wine_ids
+
+            batch = keys.loc[batch_ids].reset_index()
+            writer.write_matches(batch, pairs, wine_ids[is_changed])
+            # later batches look at these like any stored product
+            keys.loc[batch_ids, "IS_NEW"] = False
+            matched.append(get_match_ends(pairs, keys))
+            n_pairs += len(pairs)
+    scraper_metrics.inc("products_matched", len(new))
+    return len(new), n_pairs
@@ -0,0 +1,171 @@
+"""Shared parsing tools for wine_scraper modules.
+
+"""
+
+# STANDARD LIB
+import re
+import lxml.html
+import pandas as pd
+
+# PROJECT LIB
+from scraper.util import scraper_metrics
+from scraper.web_scraper.wine_scraper import constants as ws_const
+
+
+def price_field(name):
+    """Regex for a dollar amount with cents, e.g. "$1,299.99".
+
+    Args:
+        name (str): name of the group capturing the number without "$".
+
+    Returns:
+        pattern (str): regex with one named group.
+    """
+    regex = r"\$(?P<%s>\d{1,3}(?:[,]\d{3})*(?:[.]\d{2}))"
+    #        |--|-----|-------|------------|-----------|
+    #        |$ |group| 1-3   | 3 digits   | 2 digits  |
+    #        |  |name | digits| repeated   |  (cents)  |
+    return regex % name
+
+
+def find_first(pattern, tail=""):
+    r"""Regex that skips ahead to the first match of pattern.
+
+    Equivalent to r"[\s\S]*?" + pattern, but skips with greedy character
+    classes up to each occurrence of the first character of pattern, so
+    no match attempt is made at any other position.
+
+    Args:
+        pattern (str): regex starting with a literal character, possibly
+            backslash escaped.
+        tail (str, default ""): regex to match right after pattern. It is
+            not used to decide where pattern matches, so keep optional
+            continuations here rather than in pattern.
+
+    Returns:
+        pattern (str): regex consuming everything up to and including the
+            first match of pattern, then tail.
+    """
+    first = pattern[:2] if pattern.startswith("\\") else pattern[:1]
+    # named groups cannot be repeated, so drop them from the lookahead
+    rest = re.sub(r"\(\?P<\w+>", "(?:", pattern[len(first):])
+    skip = r"[^{0}]*(?:{0}(?!{1})[^{0}]*)*".format(first, rest)
+    return skip + pattern + tail
+
+
+def optional_field(pattern, tail=""):
+    """Wrap a regex so it may match anywhere in the string, or not at all.
+
+    Fields wrapped this way can be joined into one regex that extracts
+    every field in a single Series.str.extract call, independent of the
+    order the fields appear in.
+
+    Args:
+        pattern (str): regex with one or more named groups, see find_first.
+        tail (str, default ""): see find_first.
+
+    Returns:
+        pattern (str): zero width lookahead that fills the named groups
+            from the first match of pattern, or leaves them empty.
+    """
+    return r"(?=(?:{})?)".format(find_first(pattern, tail))
+
+
+def get_cell_texts(html_str, column, tables=slice(None)):
+    """Text of one column of every table row of a page.
+
+    Walks the rows with lxml XPath and only reads the wanted cell, instead
+    of building a DataFrame per table as pd.read_html does. Whitespace is
+    collapsed and empty cells are skipped, so the result matches the
+    non-null values of that column in pd.read_html.
+
+    Args:
+        html_str (str): html of the page.
+        column (int): position of the cell within its row.
+        tables (slice, default all): tables to read, in document order.
+
+    Returns:
+        texts (list of str): cell texts, in document order.
+    """
+    if not html_str:  # empty on a cache only miss
+        return []
+    root = lxml.html.fromstring(html_str)
+    texts = []
+    for table in root.xpath("//table")[tables]:
+        for row in table.xpath("./tr|./thead/tr|./tbody/tr|./tfoot/tr"):
+            cells = row.xpath("./td|./th")
+            if len(cells) > column:
+                text = " ".join(cells[column].text_content().split())
+                if text:
+                    texts.append(text)
+    return texts
+
+
+def to_price(s):
+    """Convert extracted price strings like "1,299.99" to floats.
+
+    Args:
+        s (pd.Series): price strings, missing values allowed.
+
+    Returns:
+        s (pd.Series): float prices.
+    """
+    return pd.to_numeric(s.str.replace(",", "", regex=False))
+
+
+def get_as_of_date(as_of_date=None):
+    """AS_OF_DATE of the rows of a page.
+
+    Retailer scrape functions take the time once per call and pass it
+    down to every page they parse, so the pages of one scrape share it.
+
+    Args:
+        as_of_date (pd.Timestamp, default None): time of the scrape, now
+            if None, e.g. for a single page.
+
+    Returns:
+        as_of_date (pd.Timestamp): AS_OF_DATE to stamp.
+    """
+    return pd.Timestamp.now() if as_of_date is None else as_of_date
+
+
+def to_output(df, url):
+    """Select ws_const.WINE_SCRAPER_OUTPUT_COLS with their compact dtypes.
+
+    Records the deep memory of the frame before and after as the
+    "frame_bytes_plain" and "frame_bytes" counters, see
+    scraper_metrics.format_memory.
+
+    Args:
+        df (pd.DataFrame): parsed page with every output column.
+        url (str): link of the retailer, to label the counters.
+
+    Returns:
+        df (pd.DataFrame): ws_const.WINE_SCRAPER_OUTPUT_COLS with
+            ws_const.WINE_SCRAPER_OUTPUT_DTYPES.
+    """
+    df = df[ws_const.WINE_SCRAPER_OUTPUT_COLS]
+    scraper_metrics.inc("frame_bytes_plain",
+                        df.memory_usage(deep=True).sum(), url)
+    df = df.astype(ws_const.WINE_SCRAPER_OUTPUT_DTYPES)
+    scraper_metrics.inc("frame_bytes", df.memory_usage(deep=True).sum(), url)
+    return df
+
+
+def concat_output(dfs):
+    """Concatenate output frames, keeping their compact dtypes.
+
+    pd.concat falls back to strings for categoricals whose categories
+    differ, e.g. the QUERY of different pages.
+
+    Args:
+        dfs (iterable of pd.DataFrame): frames from to_output.
+
+    Returns:
+        df (pd.DataFrame): all rows with ws_const.WINE_SCRAPER_OUTPUT_DTYPES.
+    """
+    df = pd.concat(dfs, ignore_index=True)
+    return df.astype({
+        c: t
+        for c, t in ws_const.WINE_SCRAPER_OUTPUT_DTYPES.items() if c in df
+    })
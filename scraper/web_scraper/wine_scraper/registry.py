@@ -0,0 +1,56 @@
+"""Registry of the wine_scraper retailer modules.
+
+Retailers are listed by name and module path only, so nothing is
+imported until a retailer is actually selected. A new retailer module
+needs an entry in RETAILERS and the module level functions the driver
+uses: HTML, scrape_batches, scrape_batches_async, parse_page.
+
+"""
+
+# STANDARD LIB
+import importlib
+
+RETAILERS = {
+    "allendalewine": "scraper.web_scraper.wine_scraper.allendalewine",
+    "buyritewines": "scraper.web_scraper.wine_scraper.buyritewines",
+    "garyswine": "scraper.web_scraper.wine_scraper.garyswine",
+    "winelibrary": "scraper.web_scraper.wine_scraper.winelibrary",
+}
+
+
+def get_names():
+    """Names of all registered retailers.
+
+    Returns:
+        names (list of str): retailer names, in registration order.
+    """
+    return list(RETAILERS)
+
+
+def get_module(name):
+    """Import the module of a retailer.
+
+    Args:
+        name (str): one of RETAILERS.
+
+    Returns:
+        module (module): the wine_scraper module.
+    """
+    if name not in RETAILERS:
+        raise KeyError("unknown retailer {}, expected one of {}".format(
+            name, get_names()))
+    return importlib.import_module(RETAILERS[name])
+
+
+def get_modules(names=None):
+    """Import the modules of several retailers.
+
+    Args:
+        names (list of str, default None): retailer names, all retailers
+            if None.
+
+    Returns:
+        modules (list of module): wine_scraper modules, in the order of
+            names.
+    """
+    return [get_module(name) for name in (names or get_names())]
@@ -3,91 +3,174 @@
 """
 
 # STANDARD LIB
+import argparse
+import functools
+import itertools
+import re
 import pandas as pd
-import requests
 
 # PROJECT LIB
-from scraper.util import scraper_io
-from scraper.web_scraper.wine_scraper import constants as ws_const
+from scraper.util import (scraper_http, scraper_io, scraper_metrics,
+                          scraper_pager, scraper_parse)
+from scraper.web_scraper.wine_scraper import parsing
 
 HTML = "https://winelibrary.com/"
 HTML_FORMAT = HTML + "search?page={}"  # need a page number
 
+# name, then [sale price, reg. price]
+METADATA_REGEX = re.compile(
+    parsing.optional_field(r"js-elip-multi'>(?P<NAME>[^<]*)<") +
+    parsing.optional_field(
+        parsing.price_field("PRICE"),
+        tail=r"(?:{})?".format(
+            parsing.find_first(parsing.price_field("BASE_PRICE")))))
 
-def query_one_page(page_num):
+
+def query_one_page(page_num, as_of_date=None):
     """Query a single web page of a page num.
 
     Args:
         page_num (int): page number of results to query.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
 
     Returns:
         df (pd.DataFrame): returns a dataframe
             with ws_const.WINE_SCRAPER_OUTPUT_COLS
     """
+    return submit_one_page(page_num, as_of_date).result()
+
+
+def submit_one_page(page_num, as_of_date=None):
+    """Fetch a single web page of a page num and start parsing it.
+
+    Args:
+        page_num (int): page number of results to query.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
+
+    Returns:
+        future (concurrent.futures.Future): of the page, see
+            scraper_parse.submit.
+    """
     print("QUERYING page {}".format(page_num))
     query = HTML_FORMAT.format(page_num)
-    response = requests.get(query)
-    html_str = response.text
-    xml_raw_product_data = html_str.split("product_id_")[1:]
-    df = pd.DataFrame(xml_raw_product_data, columns=["RAW_DATA_STR"])
+    html_str = scraper_http.fetch(query)
+    return scraper_parse.submit(parse_page, html_str, query, as_of_date)
+
+
+async def query_one_page_async(engine, page_num, as_of_date=None):
+    """Like query_one_page, but on the asyncio fetch engine.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        page_num (int): page number of results to query.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
+
+    Returns:
+        df (pd.DataFrame): returns a dataframe
+            with ws_const.WINE_SCRAPER_OUTPUT_COLS
+    """
+    print("QUERYING page {}".format(page_num))
+    query = HTML_FORMAT.format(page_num)
+    html_str = await engine.fetch(query)
+    return await engine.parse(parse_page, html_str, query, as_of_date)
+
+
+def parse_page(html_str, query, as_of_date=None):
+    """Parse a single fetched result page.
+
+    Args:
+        html_str (str): html of the result page.
+        query (str): link the page was fetched from.
+        as_of_date (pd.Timestamp, default None): AS_OF_DATE of the rows,
+            now if None, see parsing.get_as_of_date.
+
+    Returns:
+        df (pd.DataFrame): returns a dataframe
+            with ws_const.WINE_SCRAPER_OUTPUT_COLS
+    """
+    with scraper_metrics.timer("parse_seconds", HTML):
+        df = get_raw_data(html_str)
     if df.empty:
         print("NO DATA found, returning empty df.")
         return pd.DataFrame()
 
     df["SRC"] = HTML
     df["QUERY"] = query
-    df["AS_OF_DATE"] = pd.to_datetime("today")
+    df["AS_OF_DATE"] = parsing.get_as_of_date(as_of_date)
 
-    df = get_metadata_from_query_result(df)
+    with scraper_metrics.timer("transform_seconds", HTML):
+        df = get_metadata_from_query_result(df)
+    scraper_metrics.inc("rows_parsed", len(df), HTML)
 
-    df = df[ws_const.WINE_SCRAPER_OUTPUT_COLS]
-    return df
+    return parsing.to_output(df, HTML)
 
 
-def query_all_pages():
+def get_raw_data(html_str):
+    """Split a result page into one raw html string per item.
+
+    Args:
+        html_str (str): html of the result page.
+
+    Returns:
+        df (pd.DataFrame): dataframe with ["RAW_DATA_STR"], empty if the
+            page has no results.
+    """
+    xml_raw_product_data = html_str.split("product_id_")[1:]
+    return pd.DataFrame(xml_raw_product_data, columns=["RAW_DATA_STR"])
+
+
+def query_all_pages(window=scraper_pager.DEFAULT_WINDOW):
     """Query all item pages until no results come back.
 
+    Args:
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+
     Returns:
         res (pd.DataFrame): returns a dataframe of all queries.
     """
-    all_dfs = []
-    page_num = 1
-    while True:
-        df = query_one_page(page_num)
-        if not df.empty:
-            all_dfs.append(df)
-            page_num += 1
-        else:
-            break
+    return parsing.concat_output(iter_all_pages(window))
+
+
+def iter_all_pages(window=scraper_pager.DEFAULT_WINDOW):
+    """Query all item pages, yielding each page as it comes back.
 
-    return pd.concat(all_dfs, ignore_index=True)
+    Args:
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+
+    Yields:
+        df (pd.DataFrame): one page with ws_const.WINE_SCRAPER_OUTPUT_COLS,
+            in page order, all with the AS_OF_DATE of this call.
+    """
+    submit_fn = functools.partial(submit_one_page,
+                                  as_of_date=pd.Timestamp.now())
+    yield from scraper_pager.iter_pages(submit_fn,
+                                        itertools.count(1),
+                                        window=window)
 
 
 def get_metadata_from_query_result(df):
     """Generate metadata from query result dataframe.
 
+    All fields are pulled out in a single pass with METADATA_REGEX.
+
     Args:
         df (pd.DataFrame): dataframe with ["RAW_DATA_STR"]
 
     Returns:
         df (pd.DataFrame): returns data frame with all parsed metadata.
     """
-    df["RAW_DATA_STR"] = df["RAW_DATA_STR"].str.replace("\n", "")
-
-    df["NAME"] = df["RAW_DATA_STR"].str.findall(
-        r"(?<=js-elip-multi'>).*?(?=<)")
-    # str.findall returns a list of one element, flatten this
-    df["NAME"] = df["NAME"].apply(lambda x: x[0])
-
-    # this should return a list of two prices [sale price, reg. price]
-    regex = r"\$\d{1,3}(?:[,]\d{3})*(?:[.]\d{2})"
-    #       |--|------|------------|-----------|
-    #       |$ | 1-3  | 3 digits   | 2 digits  |
-    #       |  |digits| repeated   |  (cents)  |
-    #       |  |      |            |           |
-    df["PRICES"] = df["RAW_DATA_STR"].str.findall(regex)
-    df["PRICE"] = df["PRICES"].apply(lambda x: x[0][1:].replace(",", ""))
-    df["BASE_PRICE"] = df["PRICES"].apply(lambda x: x[1][1:].replace(",", ""))
+    fields = df["RAW_DATA_STR"].str.extract(METADATA_REGEX)
+
+    df["NAME"] = fields["NAME"].str.replace("\n", "", regex=False)
+    df["PRICE"] = parsing.to_price(fields["PRICE"])
+    # if one price, then take the single listed price
+    df["BASE_PRICE"] = parsing.to_price(fields["BASE_PRICE"]).fillna(
+        df["PRICE"])
 
     df["IS_ON_SALE"] = df["BASE_PRICE"] > df["PRICE"]
     return df
@@ -107,16 +190,79 @@ def scrape_one_page(page_num):
     return df
 
 
-def scrape():
+def scrape(window=scraper_pager.DEFAULT_WINDOW):
     """Scrape all pages.
 
+    Args:
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+
     Returns:
         df (pd.DataFrame): returns a dataframe
             with ws_const.WINE_SCRAPER_OUTPUT_COLS
     """
-    df = query_all_pages()
+    df = query_all_pages(window)
     return df
 
 
+def scrape_batches(window=scraper_pager.DEFAULT_WINDOW, skip_pages=None):
+    """Scrape all pages, one batch per page.
+
+    Only the pages in flight are held in memory, so batches can be
+    written out as they arrive instead of building the whole catalog.
+
+    Args:
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+        skip_pages (set of str, default None): page keys already scraped,
+            e.g. by an interrupted run, these are not queried again.
+
+    Yields:
+        page_key, df (tuple): the page number as a str and the page with
+            ws_const.WINE_SCRAPER_OUTPUT_COLS, all with the AS_OF_DATE of
+            this call.
+    """
+    skip_pages = skip_pages or set()
+    page_nums = (n for n in itertools.count(1) if str(n) not in skip_pages)
+    submit_fn = functools.partial(submit_one_page,
+                                  as_of_date=pd.Timestamp.now())
+    for page_num, df in scraper_pager.iter_keyed_pages(submit_fn,
+                                                       page_nums,
+                                                       window=window):
+        yield str(page_num), df
+
+
+async def scrape_batches_async(engine,
+                               window=scraper_pager.DEFAULT_WINDOW,
+                               skip_pages=None):
+    """Like scrape_batches, but on the asyncio fetch engine.
+
+    Args:
+        engine (scraper_async.AsyncFetcher): engine to fetch with.
+        window (int, default scraper_pager.DEFAULT_WINDOW): max page
+            requests in flight.
+        skip_pages (set of str, default None): page keys already scraped.
+
+    Yields:
+        page_key, df (tuple): the page number as a str and the page with
+            ws_const.WINE_SCRAPER_OUTPUT_COLS.
+    """
+    skip_pages = skip_pages or set()
+    page_nums = (n for n in itertools.count(1) if str(n) not in skip_pages)
+    async for page_num, df in scraper_pager.iter_keyed_pages_async(
+            functools.partial(query_one_page_async,
+                              engine,
+                              as_of_date=pd.Timestamp.now()),
+            page_nums,
+            window=window):
+        yield str(page_num), df
+
+
 if __name__ == "__main__":
-    scraper_io.to_csv(scrape(), "winelibrary_catalog")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format",
+                        choices=scraper_io.FILE_FORMATS,
+                        default=scraper_io.FORMAT_CSV)
+    args = parser.parse_args()
+    scraper_io.to_file_batches((df for _, df in scrape_batches()),
+                               "winelibrary_catalog", args.format)